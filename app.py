@@ -1,1149 +1,5374 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import sqlite3
-from datetime import datetime, timedelta
-from collections import defaultdict
-from functools import wraps
-from werkzeug.security import check_password_hash
-import os
-import secrets
-import hashlib
-import bcrypt
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-app = Flask(__name__)
-app.secret_key = os.getenv("SECRET_KEY", "change_this_in_production")
-app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=30)
-app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
-app.config["SESSION_COOKIE_SECURE"] = bool(os.getenv("SESSION_COOKIE_SECURE", "1") == "1")
-
-DB_NAME = "database.db"
-DATABASE_URL = os.getenv("DATABASE_URL")
-DB_TYPE = "postgres" if DATABASE_URL else "sqlite"
-
-CHART_PALETTE = [
-    "#7f8bff",
-    "#6dc6ff",
-    "#f5b971",
-    "#8ed7b2",
-    "#f28fb1",
-    "#c1c7dd",
-    "#9bb0ff",
-]
-
-
-# -----------------------------
-# Database helpers
-# -----------------------------
-class DBConnection:
-    def __init__(self, conn, db_type):
-        self.conn = conn
-        self.db_type = db_type
-
-    def execute(self, query, params=None):
-        params = params or []
-        if self.db_type == "postgres":
-            query = query.replace("?", "%s")
-            cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute(query, params)
-            return cursor
-        if params:
-            return self.conn.execute(query, params)
-        return self.conn.execute(query)
-
-    def commit(self):
-        self.conn.commit()
-
-    def close(self):
-        self.conn.close()
-
-
-def get_db_connection():
-    if DB_TYPE == "postgres":
-        sslmode = os.getenv("DB_SSLMODE", "require")
-        database_url = DATABASE_URL or ""
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
-        if database_url and "sslmode=" in database_url:
-            conn = psycopg2.connect(database_url)
-        else:
-            conn = psycopg2.connect(database_url, sslmode=sslmode)
-        return DBConnection(conn, "postgres")
-
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    # Enforce foreign keys (SQLite only)
-    conn.execute("PRAGMA foreign_keys = ON")
-    return DBConnection(conn, "sqlite")
-
-
-def init_db():
-    conn = get_db_connection()
-    if DB_TYPE == "postgres":
-        # Users table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            );
-        """)
-        # Categories table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL UNIQUE
-            );
-        """)
-        # Expenses table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id SERIAL PRIMARY KEY,
-                date TEXT NOT NULL,
-                item TEXT NOT NULL,
-                category_id INTEGER REFERENCES categories(id),
-                amount REAL NOT NULL,
-                user_id INTEGER REFERENCES users(id)
-            );
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL REFERENCES users(id),
-                token_hash TEXT NOT NULL UNIQUE,
-                expires_at TIMESTAMP NOT NULL,
-                used_at TIMESTAMP,
-                created_at TIMESTAMP NOT NULL
-            );
-        """)
-    else:
-        # Users table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            );
-        """)
-        # Categories table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            );
-        """)
-        # Expenses table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                item TEXT NOT NULL,
-                category_id INTEGER,
-                amount REAL NOT NULL,
-                user_id INTEGER,
-                FOREIGN KEY (category_id) REFERENCES categories(id),
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            );
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                token_hash TEXT NOT NULL UNIQUE,
-                expires_at TEXT NOT NULL,
-                used_at TEXT,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            );
-        """)
-
-    # Add user_id column for existing databases
-    if DB_TYPE == "postgres":
-        conn.execute(
-            "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id)"
-        )
-    else:
-        columns = conn.execute("PRAGMA table_info(expenses)").fetchall()
-        column_names = {col["name"] for col in columns}
-        if "user_id" not in column_names:
-            conn.execute(
-                "ALTER TABLE expenses ADD COLUMN user_id INTEGER REFERENCES users(id)"
-            )
-    conn.commit()
-    conn.close()
-
-
-def get_categories():
-    conn = get_db_connection()
-    categories = conn.execute(
-        "SELECT id, name FROM categories ORDER BY name"
-    ).fetchall()
-    conn.close()
-    return categories
-
-
-def _stable_index(text, length):
-    if not text:
-        return 0
-    total = 0
-    for i, ch in enumerate(str(text).lower()):
-        total += (i + 1) * ord(ch)
-    return total % length
-
-
-def _hex_to_rgba(hex_color, alpha=0.18):
-    hex_color = hex_color.lstrip("#")
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    return f"rgba({r}, {g}, {b}, {alpha})"
-
-
-def format_pretty_date(value):
-    if not value:
-        return ""
-    if isinstance(value, datetime):
-        dt = value
-    else:
-        try:
-            dt = datetime.strptime(str(value), "%Y-%m-%d")
-        except ValueError:
-            try:
-                dt = datetime.strptime(str(value), "%d-%m-%Y")
-            except ValueError:
-                return str(value)
-    return f"{dt.day} {dt.strftime('%B')} {dt.year}"
-
-
-def category_style(value):
-    index = _stable_index(value, len(CHART_PALETTE))
-    color = CHART_PALETTE[index]
-    return f"background: {_hex_to_rgba(color)}; color: {color};"
-
-
-@app.template_filter("pretty_date")
-def pretty_date_filter(value):
-    return format_pretty_date(value)
-
-
-@app.template_filter("category_style")
-def category_style_filter(value):
-    return category_style(value)
-
-
-# -----------------------------
-# Auth helpers
-# -----------------------------
-def _initials_from_name(name, email=None):
-    if name:
-        parts = [part for part in name.strip().split() if part]
-        initials = "".join([p[0].upper() for p in parts[:2]])
-        if initials:
-            return initials
-    if email:
-        return email.strip()[:2].upper()
-    return "U"
-
-
-def get_current_user():
-    if not session.get("user_id"):
-        return None
-    return {
-        "id": session.get("user_id"),
-        "name": session.get("user_name"),
-        "email": session.get("user_email"),
-    }
-
-
-@app.context_processor
-def inject_current_user():
-    user = get_current_user()
-    initials = None
-    if user:
-        initials = _initials_from_name(user.get("name"), user.get("email"))
-    return {"current_user": user, "user_initials": initials}
-
-
-def login_required(view):
-    @wraps(view)
-    def wrapped(*args, **kwargs):
-        if not session.get("user_id"):
-            return redirect(url_for("login"))
-        return view(*args, **kwargs)
-
-    return wrapped
-
-
-# -----------------------------
-# Password helpers
-# -----------------------------
-def _hash_password(password):
-    # Use bcrypt for new passwords (stronger than default PBKDF2).
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-
-def _verify_password(stored_hash, password):
-    # Support legacy Werkzeug hashes and new bcrypt hashes.
-    if stored_hash.startswith("$2"):
-        return bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
-    return check_password_hash(stored_hash, password)
-
-
-def _parse_db_datetime(value):
-    if value is None:
-        return None
-    if isinstance(value, datetime):
-        return value
-    return datetime.fromisoformat(str(value))
-
-
-def _to_db_datetime(value):
-    if DB_TYPE == "postgres":
-        return value
-    return value.isoformat()
-
-
-def _store_reset_token(user_id, token_hash, expires_at, created_at):
-    conn = get_db_connection()
-    expires_at_db = _to_db_datetime(expires_at)
-    created_at_db = _to_db_datetime(created_at)
-    # Invalidate any existing active tokens for this user.
-    conn.execute(
-        "UPDATE password_reset_tokens SET used_at = ? WHERE user_id = ? AND used_at IS NULL",
-        (created_at_db, user_id),
-    )
-    conn.execute(
-        """
-        INSERT INTO password_reset_tokens (user_id, token_hash, expires_at, used_at, created_at)
-        VALUES (?, ?, ?, NULL, ?)
-        """,
-        (user_id, token_hash, expires_at_db, created_at_db),
-    )
-    conn.commit()
-    conn.close()
-
-
-def _get_reset_token(token_hash):
-    conn = get_db_connection()
-    token_row = conn.execute(
-        """
-        SELECT id, user_id, expires_at, used_at
-        FROM password_reset_tokens
-        WHERE token_hash = ?
-        """,
-        (token_hash,),
-    ).fetchone()
-    conn.close()
-    return token_row
-
-
-def _mark_token_used(token_id, used_at):
-    conn = get_db_connection()
-    conn.execute(
-        "UPDATE password_reset_tokens SET used_at = ? WHERE id = ?",
-        (_to_db_datetime(used_at), token_id),
-    )
-    conn.commit()
-    conn.close()
-
-
-def _send_reset_email(to_email, reset_link):
-    # TODO: integrate with an email provider (SendGrid, SES, Mailgun).
-    # For now, log the link so you can verify the flow in dev.
-    print(f"[Password Reset] Send to {to_email}: {reset_link}")
-
-
-# -----------------------------
-# Authentication
-# -----------------------------
-@app.route("/register", methods=["GET", "POST"])
-def register():
-    if session.get("user_id"):
-        return redirect(url_for("dashboard"))
-
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()
-        email = request.form.get("email", "").strip().lower()
-        password = request.form.get("password", "")
-
-        if not name or not email or not password:
-            flash("All fields are required.", "warning")
-            return render_template("register.html", name=name, email=email)
-
-        conn = get_db_connection()
-        try:
-            password_hash = _hash_password(password)
-            if DB_TYPE == "postgres":
-                cursor = conn.execute(
-                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?) RETURNING id",
-                    (name, email, password_hash),
-                )
-                user_id = cursor.fetchone()["id"]
-            else:
-                cursor = conn.execute(
-                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                    (name, email, password_hash),
-                )
-                user_id = cursor.lastrowid
-            conn.commit()
-        except (sqlite3.IntegrityError, psycopg2.IntegrityError):
-            conn.close()
-            flash("An account with that email already exists.", "danger")
-            return render_template("register.html", name=name, email=email)
-
-        session.permanent = True
-        session["user_id"] = user_id
-        session["user_name"] = name
-        session["user_email"] = email
-        conn.close()
-        return redirect(url_for("dashboard"))
-
-    return render_template("register.html")
-
-
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    if session.get("user_id"):
-        return redirect(url_for("dashboard"))
-
-    if request.method == "POST":
-        email = request.form.get("email", "").strip().lower()
-        password = request.form.get("password", "")
-
-        if not email or not password:
-            flash("Email and password are required.", "warning")
-            return render_template("login.html", email=email)
-
-        conn = get_db_connection()
-        user = conn.execute(
-            "SELECT id, name, email, password FROM users WHERE email = ?",
-            (email,),
-        ).fetchone()
-        conn.close()
-
-        if not user or not _verify_password(user["password"], password):
-            flash("Invalid email or password.", "danger")
-            return render_template("login.html", email=email)
-
-        session.permanent = True
-        session["user_id"] = user["id"]
-        session["user_name"] = user["name"]
-        session["user_email"] = user["email"]
-        return redirect(url_for("dashboard"))
-
-    return render_template("login.html")
-
-
-@app.route("/logout")
-def logout():
-    session.clear()
-    return redirect(url_for("login"))
-
-
-# -----------------------------
-# Password reset
-# -----------------------------
-@app.route("/forgot-password", methods=["GET", "POST"])
-def forgot_password():
-    if session.get("user_id"):
-        return redirect(url_for("dashboard"))
-
-    if request.method == "POST":
-        email = request.form.get("email", "").strip().lower()
-        if not email:
-            flash("Please enter your email.", "warning")
-            return render_template("forgot_password.html", email=email)
-
-        conn = get_db_connection()
-        user = conn.execute(
-            "SELECT id, email FROM users WHERE email = ?",
-            (email,),
-        ).fetchone()
-        conn.close()
-
-        # Always show the same message to avoid leaking user existence.
-        if user:
-            token = secrets.token_urlsafe(32)
-            token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
-            now = datetime.utcnow()
-            expires_at = now + timedelta(minutes=15)
-            _store_reset_token(user["id"], token_hash, expires_at, now)
-
-            reset_link = url_for(
-                "reset_password",
-                token=token,
-                _external=True,
-            )
-            _send_reset_email(user["email"], reset_link)
-
-        flash("If that email exists, a reset link has been sent.", "success")
-        return render_template("forgot_password.html", email=email)
-
-    return render_template("forgot_password.html")
-
-
-@app.route("/reset-password/<token>", methods=["GET", "POST"])
-def reset_password(token):
-    if session.get("user_id"):
-        return redirect(url_for("dashboard"))
-
-    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
-    token_row = _get_reset_token(token_hash)
-
-    if not token_row:
-        flash("Invalid or expired reset link.", "danger")
-        return render_template("reset_password.html", token=token)
-
-    expires_at = _parse_db_datetime(token_row["expires_at"])
-    used_at = _parse_db_datetime(token_row["used_at"])
-    if used_at or (expires_at and expires_at < datetime.utcnow()):
-        flash("This reset link has expired. Please request a new one.", "danger")
-        return render_template("reset_password.html", token=token)
-
-    if request.method == "POST":
-        password = request.form.get("password", "")
-        confirm_password = request.form.get("confirm_password", "")
-
-        if not password or not confirm_password:
-            flash("Please fill in both password fields.", "warning")
-            return render_template("reset_password.html", token=token)
-
-        if password != confirm_password:
-            flash("Passwords do not match.", "danger")
-            return render_template("reset_password.html", token=token)
-
-        conn = get_db_connection()
-        conn.execute(
-            "UPDATE users SET password = ? WHERE id = ?",
-            (_hash_password(password), token_row["user_id"]),
-        )
-        conn.commit()
-        conn.close()
-
-        _mark_token_used(token_row["id"], datetime.utcnow())
-
-        flash("Password reset successful. Please log in.", "success")
-        return redirect(url_for("login"))
-
-    return render_template("reset_password.html", token=token)
-
-
-# -----------------------------
-# Public Home
-# -----------------------------
-@app.route("/home")
-def home():
-    if session.get("user_id"):
-        return redirect(url_for("dashboard"))
-    return render_template("home.html")
-
-
-# -----------------------------
-# Add Expense
-# -----------------------------
-@app.route("/", methods=["GET", "POST"])
-@login_required
-def add_expense():
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-
-    categories = conn.execute(
-        "SELECT id, name FROM categories ORDER BY name"
-    ).fetchall()
-
-    if request.method == "POST":
-        date = request.form.get("date")
-        item = request.form.get("item")
-        category_id = request.form.get("category_id")
-        amount = request.form.get("amount")
-
-        conn.execute(
-            """
-            INSERT INTO expenses (date, item, category_id, amount, user_id)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (date, item, category_id, amount, user_id),
-        )
-        conn.commit()
-        conn.close()
-        return redirect(url_for("add_expense"))
-
-    conn.close()
-    return render_template("add_expense.html", categories=categories)
-
-
-# -----------------------------
-# Helper: build filter clause
-# -----------------------------
-def build_expense_filters(user_id, filter_type, from_date, to_date):
-    conditions = ["expenses.user_id = ?"]
-    params = [user_id]
-
-    if filter_type == "week":
-        if DB_TYPE == "postgres":
-            conditions.append(
-                "expenses.date::date >= CURRENT_DATE - INTERVAL '7 days'"
-            )
-        else:
-            conditions.append("expenses.date >= date('now', '-7 days')")
-    elif filter_type == "month":
-        if DB_TYPE == "postgres":
-            conditions.append(
-                "expenses.date::date >= CURRENT_DATE - INTERVAL '30 days'"
-            )
-        else:
-            conditions.append("expenses.date >= date('now', '-30 days')")
-    elif filter_type == "year":
-        if DB_TYPE == "postgres":
-            conditions.append(
-                "expenses.date::date >= CURRENT_DATE - INTERVAL '365 days'"
-            )
-        else:
-            conditions.append("expenses.date >= date('now', '-365 days')")
-    elif from_date and to_date:
-        if DB_TYPE == "postgres":
-            conditions.append("expenses.date::date BETWEEN ? AND ?")
-        else:
-            conditions.append("expenses.date BETWEEN ? AND ?")
-        params.extend([from_date, to_date])
-
-    where_clause = "WHERE " + " AND ".join(conditions)
-    return where_clause, params, " AND ".join(conditions)
-
-
-# -----------------------------
-# Dashboard
-# -----------------------------
-@app.route("/dashboard")
-@login_required
-def dashboard():
-    # Filters
-    user_id = session.get("user_id")
-    filter_type = request.args.get("filter")
-    from_date = request.args.get("from")
-    to_date = request.args.get("to")
-
-    where_clause, params, join_conditions = build_expense_filters(
-        user_id, filter_type, from_date, to_date
-    )
-    conn = get_db_connection()
-
-    # -------- CARDS SHOULD RESPECT FILTER (A) --------
-    # Total for current filter range
-    filtered_total_row = conn.execute(
-        f"SELECT SUM(expenses.amount) AS total FROM expenses {where_clause}",
-        params,
-    ).fetchone()
-    filtered_total = filtered_total_row["total"] or 0
-
-    # For filtered average daily spend, calculate days_spanned for date range
-    if where_clause and ("BETWEEN" in where_clause):
-        # custom from/to range
-        start = datetime.strptime(from_date, "%Y-%m-%d")
-        end = datetime.strptime(to_date, "%Y-%m-%d")
-        days_spanned = (end - start).days + 1
-    elif filter_type == "week":
-        days_spanned = 7
-    elif filter_type == "month":
-        days_spanned = 30
-    elif filter_type == "year":
-        days_spanned = 365
-    else:
-        # no filter -> current month stats
-        days_spanned = datetime.now().day
-
-    avg_daily = round(filtered_total / days_spanned, 2) if days_spanned else 0
-
-    # This month vs last month are still overall (if you want even this filtered,
-    # you can also adjust; yahan maine cards ke liye filtered_total + avg ko use kiya)
-    current_month = datetime.now().strftime("%Y-%m")
-    last_month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime(
-        "%Y-%m"
-    )
-
-    this_month_total = (
-        conn.execute(
-            "SELECT SUM(expenses.amount) AS total FROM expenses WHERE expenses.user_id = ? AND substr(expenses.date,1,7)=?",
-            (user_id, current_month),
-        ).fetchone()["total"]
-        or 0
-    )
-
-    last_month_total = (
-        conn.execute(
-            "SELECT SUM(expenses.amount) AS total FROM expenses WHERE expenses.user_id = ? AND substr(expenses.date,1,7)=?",
-            (user_id, last_month),
-        ).fetchone()["total"]
-        or 0
-    )
-
-    # Percentage change based on overall months
-    if last_month_total > 0:
-        change_percent = round(
-            ((this_month_total - last_month_total) / last_month_total) * 100, 1
-        )
-    else:
-        change_percent = 0
-
-    trend = "up" if change_percent > 0 else "down"
-    trend_color = "red" if change_percent > 0 else "green"
-
-    # Category totals respecting filter (A)
-    category_rows = conn.execute(
-        f"""
-        SELECT
-            categories.name AS category,
-            COALESCE(SUM(expenses.amount), 0) AS total
-        FROM categories
-        LEFT JOIN expenses
-            ON expenses.category_id = categories.id
-            AND {join_conditions}
-        GROUP BY categories.id, categories.name
-        ORDER BY categories.name;
-        """,
-        params,
-    ).fetchall()
-
-    labels = [row["category"] for row in category_rows]
-    values = [row["total"] for row in category_rows]
-
-    # Top spending category in filtered data (A)
-    top_category = conn.execute(
-        f"""
-        SELECT categories.name AS category,
-               SUM(expenses.amount) AS total
-        FROM expenses
-        JOIN categories ON expenses.category_id = categories.id
-        {where_clause}
-        GROUP BY categories.name
-        ORDER BY total DESC
-        LIMIT 1
-        """,
-        params,
-    ).fetchone()
-
-    top_category_name = top_category["category"] if top_category else "N/A"
-    top_category_amount = top_category["total"] if top_category else 0
-
-    # Last 5 expenses (already respecting filter)
-    recent_expenses = conn.execute(
-        f"""
-        SELECT
-            expenses.date,
-            expenses.item,
-            categories.name AS category,
-            expenses.amount
-        FROM expenses
-        LEFT JOIN categories ON expenses.category_id = categories.id
-        {where_clause}
-        ORDER BY expenses.date DESC
-        LIMIT 5
-        """,
-        params,
-    ).fetchall()
-
-    # Auto dashboard summary (based on overall month trend)
-    if trend == "up":
-        summary_text = (
-            f"Your expenses increased compared to last month, mainly due to {top_category_name} category."
-        )
-    else:
-        summary_text = (
-            "Your expenses decreased compared to last month, showing better spending control."
-        )
-
-    # Highest single expense (filtered)
-    highest_expense = conn.execute(
-        f"""
-        SELECT item, amount
-        FROM expenses
-        {where_clause}
-        ORDER BY amount DESC
-        LIMIT 1
-        """,
-        params,
-    ).fetchone()
-
-    highest_item = highest_expense["item"] if highest_expense else "N/A"
-    highest_amount = highest_expense["amount"] if highest_expense else 0
-
-    # Spending trend message
-    trend_message = (
-        "Your spending increased this month"
-        if trend == "up"
-        else "Your spending decreased this month"
-    )
-
-    # Monthly expense trend respecting filter (B)
-    # Idea: we still group by YYYY-MM but apply same filter condition
-    monthly_data = conn.execute(
-        f"""
-        SELECT substr(expenses.date,1,7) AS month, SUM(amount) AS total
-        FROM expenses
-        {where_clause}
-        GROUP BY month
-        ORDER BY month
-        """,
-        params,
-    ).fetchall()
-
-    months = [row["month"] for row in monthly_data]
-    monthly_totals = [row["total"] for row in monthly_data]
-
-    # Highest spending month (within filtered data)
-    highest_month_row = conn.execute(
-        f"""
-        SELECT substr(expenses.date,1,7) AS month, SUM(amount) AS total
-        FROM expenses
-        {where_clause}
-        GROUP BY month
-        ORDER BY total DESC
-        LIMIT 1
-        """,
-        params,
-    ).fetchone()
-
-    highest_month = highest_month_row["month"] if highest_month_row else "N/A"
-    highest_month_amount = (
-        highest_month_row["total"] if highest_month_row else 0
-    )
-
-    # Category-wise monthly trend respecting filter (B)
-    category_month_data = conn.execute(
-        f"""
-        SELECT
-            substr(expenses.date,1,7) AS month,
-            categories.name AS category,
-            SUM(expenses.amount) AS total
-        FROM expenses
-        JOIN categories ON expenses.category_id = categories.id
-        {where_clause}
-        GROUP BY month, categories.name
-        ORDER BY month
-        """,
-        params,
-    ).fetchall()
-
-    category_month_map = defaultdict(dict)
-    for row in category_month_data:
-        category_month_map[row["category"]][row["month"]] = row["total"]
-
-    all_months = sorted(set(months))
-
-    category_datasets = []
-    for category, month_data in category_month_map.items():
-        category_datasets.append(
-            {
-                "label": category,
-                "data": [month_data.get(m, 0) for m in all_months],
-            }
-        )
-
-    conn.close()
-
-    return render_template(
-        "dashboard.html",
-        # Cards (filtered)
-        this_month=filtered_total,  # filtered total instead of raw current month
-        last_month=last_month_total,  # still based on real last month
-        avg_daily=avg_daily,
-        change_percent=abs(change_percent),
-        trend=trend,
-        trend_color=trend_color,
-        # Category data (filtered)
-        labels=labels,
-        values=values,
-        top_category_name=top_category_name,
-        top_category_amount=top_category_amount,
-        # Highest expense (filtered)
-        highest_item=highest_item,
-        highest_amount=highest_amount,
-        # Trend & summary
-        trend_message=trend_message,
-        summary_text=summary_text,
-        # Monthly trend (filtered)
-        months=months,
-        monthly_totals=monthly_totals,
-        highest_month=highest_month,
-        highest_month_amount=highest_month_amount,
-        # Category-wise monthly datasets (filtered)
-        category_month_labels=all_months,
-        category_datasets=category_datasets,
-        # Filtered stats
-        filtered_total=filtered_total,
-        # Recent expenses (filtered)
-        recent_expenses=recent_expenses,
-        # keep filter values in template
-        filter_type=filter_type,
-        from_date=from_date,
-        to_date=to_date,
-    )
-
-
-# -----------------------------
-# All Expenses
-# -----------------------------
-@app.route("/expenses")
-@login_required
-def all_expenses():
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-
-    filter_type = request.args.get("filter")
-    from_date = request.args.get("from")
-    to_date = request.args.get("to")
-
-    where_clause, params, _ = build_expense_filters(
-        user_id, filter_type, from_date, to_date
-    )
-
-    base_query = f"""
-        SELECT
-            expenses.id,
-            expenses.date,
-            expenses.item,
-            categories.name AS category,
-            expenses.amount
-        FROM expenses
-        LEFT JOIN categories ON expenses.category_id = categories.id
-        {where_clause}
-        ORDER BY expenses.date DESC
-    """
-
-    sum_query = f"SELECT SUM(expenses.amount) AS total FROM expenses {where_clause}"
-
-    expenses = conn.execute(base_query, params).fetchall()
-    total = conn.execute(sum_query, params).fetchone()["total"]
-    conn.close()
-
-    if total is None:
-        total = 0
-
-    return render_template(
-        "all_expenses.html",
-        expenses=expenses,
-        total=total,
-        filter_type=filter_type,
-        from_date=from_date,
-        to_date=to_date,
-    )
-
-
-# -----------------------------
-# Delete Expense
-# -----------------------------
-@app.route("/delete/<int:id>")
-@login_required
-def delete_expense(id):
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-    conn.execute("DELETE FROM expenses WHERE id = ? AND user_id = ?", (id, user_id))
-    conn.commit()
-    conn.close()
-    return redirect(url_for("all_expenses"))
-
-
-# -----------------------------
-# Edit Expense
-# -----------------------------
-@app.route("/edit/<int:id>", methods=["GET", "POST"])
-@login_required
-def edit_expense(id):
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-
-    if request.method == "POST":
-        date = request.form.get("date")
-        item = request.form.get("item")
-        category_id = request.form.get("category_id")
-        amount = request.form.get("amount")
-
-        cursor = conn.execute(
-            """
-            UPDATE expenses
-            SET date = ?, item = ?, category_id = ?, amount = ?
-            WHERE id = ? AND user_id = ?
-            """,
-            (date, item, category_id, amount, id, user_id),
-        )
-        conn.commit()
-        if cursor.rowcount == 0:
-            conn.close()
-            flash("Expense not found.", "danger")
-            return redirect(url_for("all_expenses"))
-        conn.close()
-        return redirect(url_for("all_expenses"))
-
-    expense = conn.execute(
-        """
-        SELECT expenses.id, date, item, amount, category_id
-        FROM expenses
-        WHERE expenses.id = ? AND expenses.user_id = ?
-        """,
-        (id, user_id),
-    ).fetchone()
-    conn.close()
-    if not expense:
-        flash("Expense not found.", "danger")
-        return redirect(url_for("all_expenses"))
-
-    categories = get_categories()
-
-    return render_template(
-        "edit_expense.html",
-        expense=expense,
-        categories=categories,
-    )
-
-
-# -----------------------------
-# Categories + Reassignment (D)
-# -----------------------------
-@app.route("/categories")
-@login_required
-def categories_view():
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-    rows = conn.execute(
-        """
-        SELECT categories.id,
-               categories.name,
-               COUNT(expenses.id) AS usage_count
-        FROM categories
-        LEFT JOIN expenses
-            ON categories.id = expenses.category_id
-            AND expenses.user_id = ?
-        GROUP BY categories.id
-        ORDER BY categories.name
-        """,
-        (user_id,),
-    ).fetchall()
-    conn.close()
-    return render_template("categories.html", categories=rows)
-
-
-@app.route("/add-category", methods=["POST"])
-@login_required
-def add_category():
-    name = request.form.get("name", "").strip()
-
-    if not name:
-        flash("Category name cannot be empty.", "warning")
-        return redirect(url_for("categories_view"))
-
-    conn = get_db_connection()
-    try:
-        conn.execute(
-            "INSERT INTO categories (name) VALUES (?)",
-            (name,),
-        )
-        conn.commit()
-        flash("Category added successfully.", "success")
-    except sqlite3.IntegrityError:
-        flash("Category already exists.", "danger")
-    finally:
-        conn.close()
-
-    return redirect(url_for("categories_view"))
-
-
-@app.route("/delete-category/<int:id>", methods=["GET", "POST"])
-@login_required
-def delete_category(id):
-    conn = get_db_connection()
-    user_id = session.get("user_id")
-
-    # Check usage
-    usage_total = conn.execute(
-        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ?",
-        (id,),
-    ).fetchone()["c"]
-    usage_for_user = conn.execute(
-        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ? AND user_id = ?",
-        (id, user_id),
-    ).fetchone()["c"]
-
-    # If no usage, just delete
-    if usage_total == 0 and request.method == "GET":
-        conn.execute("DELETE FROM categories WHERE id = ?", (id,))
-        conn.commit()
-        conn.close()
-        flash("Category deleted.", "success")
-        return redirect(url_for("categories_view"))
-
-    # If in use: show reassignment form (GET)
-    if request.method == "GET":
-        if usage_for_user == 0:
-            conn.close()
-            flash("Category is in use and cannot be deleted.", "warning")
-            return redirect(url_for("categories_view"))
-        categories = conn.execute(
-            "SELECT id, name FROM categories WHERE id != ? ORDER BY name",
-            (id,),
-        ).fetchall()
-        cat = conn.execute(
-            "SELECT id, name FROM categories WHERE id = ?",
-            (id,),
-        ).fetchone()
-        conn.close()
-        if not cat:
-            flash("Category not found.", "danger")
-            return redirect(url_for("categories_view"))
-        flash("Category is in use. Please reassign its expenses before delete.", "warning")
-        return render_template(
-            "reassign_category.html",
-            category=cat,
-            categories=categories,
-            usage=usage_for_user,
-        )
-
-    # POST: reassign and delete
-    new_category_id = request.form.get("new_category_id")
-
-    if not new_category_id:
-        conn.close()
-        flash("Select a category to reassign.", "warning")
-        return redirect(url_for("delete_category", id=id))
-
-    # Reassign all expenses from old category to new_category_id
-    conn.execute(
-        """
-        UPDATE expenses
-        SET category_id = ?
-        WHERE category_id = ? AND user_id = ?
-        """,
-        (new_category_id, id, user_id),
-    )
-    conn.commit()
-
-    usage_total = conn.execute(
-        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ?",
-        (id,),
-    ).fetchone()["c"]
-    if usage_total == 0:
-        conn.execute("DELETE FROM categories WHERE id = ?", (id,))
-        conn.commit()
-        flash("Expenses reassigned and category deleted.", "success")
-    else:
-        flash(
-            "Expenses reassigned. Category is still in use and cannot be deleted.",
-            "warning",
-        )
-    conn.close()
-    return redirect(url_for("categories_view"))
-
-
-# -----------------------------
-# Main
-# -----------------------------
-
-# if __name__ == "__main__":
-#     init_db()
-#     app.run(debug=True)
-
-if __name__ == "__main__":
-    init_db()
-    port = int(os.getenv("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+from flask import (
+    Blueprint,
+    Flask,
+    current_app,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    session,
+    g,
+    has_app_context,
+    has_request_context,
+    jsonify,
+    make_response,
+    Response,
+    send_from_directory,
+    stream_with_context,
+    before_render_template,
+    template_rendered,
+)
+import sqlite3
+from bisect import bisect_left
+from datetime import date as date_type, datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from email.message import EmailMessage
+from functools import lru_cache, wraps
+import click
+from werkzeug.http import is_resource_modified
+from werkzeug.security import check_password_hash
+from werkzeug.utils import safe_join
+import os
+import asyncio
+import base64
+import calendar
+import csv
+import gzip
+import io
+import json
+import logging
+import logging.handlers
+import mimetypes
+import posixpath
+import re
+import secrets
+import hashlib
+import smtplib
+import threading
+import time
+import urllib.request
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Views, hooks, template helpers and CLI commands register on this blueprint;
+# create_app() (end of file) builds the Flask app around it.
+bp = Blueprint("expense_tracker", __name__, cli_group=None)
+
+
+def route(rule, **options):
+    # Like app.route, but keeps endpoint names unprefixed (url_for("dashboard")).
+    def decorator(view):
+        bp.record_once(lambda state: state.app.add_url_rule(rule, view_func=view, **options))
+        return view
+
+    return decorator
+
+
+DB_NAME = "database.db"
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_TYPE = "postgres" if DATABASE_URL else "sqlite"
+
+# Postgres drivers are imported on first use (load_postgres_driver,
+# load_async_postgres_driver), so SQLite deployments never load them.
+psycopg2 = None
+RealDictCursor = None
+TRANSACTION_STATUS_IDLE = TRANSACTION_STATUS_INERROR = None
+INTEGRITY_ERRORS = (sqlite3.IntegrityError,)
+psycopg = None
+dict_row = None
+
+CHART_PALETTE = [
+    "#7f8bff",
+    "#6dc6ff",
+    "#f5b971",
+    "#8ed7b2",
+    "#f28fb1",
+    "#c1c7dd",
+    "#9bb0ff",
+]
+
+
+# -----------------------------
+# Database helpers
+# -----------------------------
+# Pool sizing: keep DB_POOL_SIZE * gunicorn workers below the server's
+# max_connections (minus headroom for migrations/psql sessions).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "30"))
+
+# SQLite profile, applied once per pooled connection. "tuned" (WAL,
+# synchronous=NORMAL, busy timeout, larger page cache, mmap, in-memory temp
+# tables) lets several gunicorn workers read while one writes; "default"
+# keeps SQLite's own settings (rollback journal, FULL sync).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned").lower()
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+SQLITE_WAL_AUTOCHECKPOINT = int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "1000"))
+SQLITE_CHECKPOINT_INTERVAL = float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "300"))
+
+# Postgres statement cache. A query shape executed PG_PREPARE_THRESHOLD times
+# on a pooled connection is PREPAREd there and then runs as EXECUTE, skipping
+# parse/plan; each connection keeps the PG_STATEMENT_CACHE_SIZE most recently
+# used statements (older ones are DEALLOCATEd). Prepared statements live on
+# the server connection, so turn this off behind pgbouncer in transaction
+# pooling mode.
+PG_PREPARED_STATEMENTS = os.getenv("PG_PREPARED_STATEMENTS", "on").lower() != "off"
+PG_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+PG_PREPARE_THRESHOLD = int(os.getenv("PG_PREPARE_THRESHOLD", "2"))
+SQL_PREPARABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+# Observers called as hook(conn, query, params, seconds) after every
+# statement, with seconds covering execute plus fetching the rows; used by
+# the metrics layer and the slow-query log.
+QUERY_HOOKS = []
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+@lru_cache(maxsize=1024)
+def pg_query(query):
+    # "?" placeholders -> psycopg2's "%s", once per query shape.
+    return query.replace("?", "%s")
+
+
+@lru_cache(maxsize=1024)
+def pg_prepared_query(query):
+    # "?" placeholders -> "$1".."$n" for PREPARE; returns (text, n).
+    parts = query.split("?")
+    text = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+    return text, len(parts) - 1
+
+
+class StatementCache:
+    # Prepared statements on one Postgres connection, keyed by query text.
+    # Only used by whoever has the connection checked out.
+    def __init__(self, max_size, threshold):
+        self.max_size = max_size
+        self.threshold = threshold
+        # query -> (statement name, EXECUTE text), least recently used first
+        self._prepared = OrderedDict()
+        # query -> executions so far, for shapes not prepared yet
+        self._seen = OrderedDict()
+        self._unpreparable = set()
+        self._counter = 0
+        self.executions = 0
+        self.prepares = 0
+        self.evictions = 0
+        self.failures = 0
+
+    def execute(self, conn, cursor, query, params):
+        # Runs the query as EXECUTE if it is (or just became) prepared;
+        # returns False when the caller should run it as plain SQL.
+        entry = self._prepared.get(query)
+        if entry is not None:
+            self._prepared.move_to_end(query)
+        else:
+            entry = self._prepare(conn, cursor, query, params)
+            if entry is None:
+                return False
+        self.executions += 1
+        cursor.execute(entry[1], params)
+        return True
+
+    def _prepare(self, conn, cursor, query, params):
+        if query in self._unpreparable:
+            return None
+        if conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+            return None
+        seen = self._seen.pop(query, 0) + 1
+        if seen < self.threshold:
+            self._seen[query] = seen
+            if len(self._seen) > self.max_size * 4:
+                self._seen.popitem(last=False)
+            return None
+        text, count = pg_prepared_query(query)
+        if count != len(params) or not query.lstrip().upper().startswith(SQL_PREPARABLE):
+            self._mark_unpreparable(query)
+            return None
+
+        self._counter += 1
+        name = f"stmt_{self._counter}"
+        statements = []
+        while len(self._prepared) >= self.max_size:
+            _, (old_name, _) = self._prepared.popitem(last=False)
+            statements.append(f"DEALLOCATE {old_name}")
+            self.evictions += 1
+        statements.append(f"PREPARE {name} AS {text}")
+        # One round trip; a statement PREPARE rejects must not abort the
+        # caller's transaction.
+        try:
+            cursor.execute(
+                "SAVEPOINT prepare_statement; "
+                + "; ".join(statements)
+                + "; RELEASE SAVEPOINT prepare_statement"
+            )
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+            cursor.execute("RELEASE SAVEPOINT prepare_statement")
+            self.failures += 1
+            self._mark_unpreparable(query)
+            return None
+        self.prepares += 1
+        placeholders = ", ".join(["%s"] * count)
+        entry = (name, f"EXECUTE {name} ({placeholders})" if count else f"EXECUTE {name}")
+        self._prepared[query] = entry
+        return entry
+
+    def _mark_unpreparable(self, query):
+        if len(self._unpreparable) > self.max_size * 4:
+            self._unpreparable.clear()
+        self._unpreparable.add(query)
+
+    def stats(self):
+        return {
+            "prepared": len(self._prepared),
+            "executions": self.executions,
+            "prepares": self.prepares,
+            "evictions": self.evictions,
+            "failures": self.failures,
+        }
+
+
+class TimedCursor:
+    # SQLite steps through a result lazily, so most of a large SELECT runs
+    # inside fetch*(), after execute() has returned. Fetch time is added to
+    # the statement's duration, and QUERY_HOOKS see the total once: when the
+    # rows run out, or when the connection moves on (next statement,
+    # commit, rollback or close).
+    def __init__(self, cursor, conn, query, params, seconds):
+        self._cursor = cursor
+        self._conn = conn
+        self._query = query
+        self._params = params
+        self._seconds = seconds
+        self._reported = False
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self.finish()
+        return rows
+
+    def fetchmany(self, size=None):
+        if size is None:
+            rows = self._timed(self._cursor.fetchmany)
+        else:
+            rows = self._timed(self._cursor.fetchmany, size)
+        if not rows:
+            self.finish()
+        return rows
+
+    def __iter__(self):
+        rows = iter(self._cursor)
+        while True:
+            try:
+                row = self._timed(next, rows)
+            except StopIteration:
+                self.finish()
+                return
+            yield row
+
+    def finish(self):
+        if not self._reported:
+            self._reported = True
+            self._conn._run_hooks(self._query, self._params, self._seconds)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class DBConnection:
+    def __init__(self, conn, db_type, pool=None):
+        self.conn = conn
+        self.db_type = db_type
+        self._pool = pool
+        self._released = False
+        self._statements = None
+        self._timed_cursor = None
+        if db_type == "postgres" and pool is not None:
+            self._statements = pool.statement_cache(conn)
+
+    def _finish_timed_cursor(self):
+        if self._timed_cursor is not None:
+            self._timed_cursor.finish()
+            self._timed_cursor = None
+
+    def execute(self, query, params=None):
+        params = params or []
+        self._finish_timed_cursor()
+        started = time.perf_counter()
+        if self.db_type == "postgres":
+            cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+            if self._statements is None or not self._statements.execute(
+                self.conn, cursor, query, params
+            ):
+                cursor.execute(pg_query(query), params)
+        elif params:
+            cursor = self.conn.execute(query, params)
+        else:
+            cursor = self.conn.execute(query)
+        if QUERY_HOOKS:
+            seconds = time.perf_counter() - started
+            if cursor.description is None:
+                # No result set (DML, DDL): nothing left to time.
+                self._run_hooks(query, params, seconds)
+            else:
+                cursor = self._timed_cursor = TimedCursor(cursor, self, query, params, seconds)
+        stats = current_request_stats()
+        if stats is not None:
+            return CountingCursor(cursor, stats)
+        return cursor
+
+    def _run_hooks(self, query, params, seconds):
+        for hook in QUERY_HOOKS:
+            hook(self, query, params, seconds)
+
+    def stream(self, query, params=None, batch_size=1000):
+        # Yields rows without materializing the result: a server-side (named)
+        # cursor on Postgres, fetchmany batches on SQLite. The reported
+        # duration counts the fetches, not the time spent in the consumer.
+        params = params or []
+        self._finish_timed_cursor()
+        started = time.perf_counter()
+        if self.db_type == "postgres":
+            cursor = self.conn.cursor(
+                name=f"stream_{secrets.token_hex(4)}", cursor_factory=RealDictCursor
+            )
+            cursor.itersize = batch_size
+            cursor.execute(pg_query(query), params)
+        else:
+            cursor = self.conn.execute(query, params)
+        timed = TimedCursor(cursor, self, query, params, time.perf_counter() - started)
+        try:
+            while True:
+                rows = timed.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            timed.finish()
+            cursor.close()
+
+    def executemany(self, query, seq_of_params):
+        self._finish_timed_cursor()
+        started = time.perf_counter()
+        if self.db_type == "postgres":
+            cursor = self.conn.cursor()
+            cursor.executemany(pg_query(query), seq_of_params)
+        else:
+            cursor = self.conn.executemany(query, seq_of_params)
+        if QUERY_HOOKS:
+            self._run_hooks(query, None, time.perf_counter() - started)
+        return cursor
+
+    def copy_rows(self, table, columns, rows):
+        # Bulk load: COPY on Postgres, executemany on SQLite.
+        if self.db_type == "postgres":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with self.conn.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            return
+        placeholders = ", ".join("?" for _ in columns)
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            rows,
+        )
+
+    def commit(self):
+        self._finish_timed_cursor()
+        self.conn.commit()
+
+    def rollback(self):
+        self._finish_timed_cursor()
+        self.conn.rollback()
+
+    def close(self):
+        # Pooled connections go back to the pool; safe to call more than once.
+        if self._released:
+            return
+        self._finish_timed_cursor()
+        self._released = True
+        if self._pool is not None:
+            self._pool.release(self.conn)
+        else:
+            self.conn.close()
+
+
+class PostgresPool:
+    def __init__(
+        self,
+        connect,
+        max_size,
+        timeout,
+        max_lifetime,
+        check_interval,
+        statement_cache_size=0,
+        prepare_threshold=PG_PREPARE_THRESHOLD,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.statement_cache_size = statement_cache_size
+        self.prepare_threshold = prepare_threshold
+        self._cond = threading.Condition()
+        self._idle = []
+        # conn -> [created_at, last_used] (monotonic seconds)
+        self._meta = {}
+        # conn -> StatementCache, plus counters of discarded connections
+        self._statements = {}
+        self._retired_statements = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # Reserve a slot; the connection is opened outside the lock.
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if conn is not None and not self._is_usable(conn):
+                self._discard(conn, release_slot=False)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+                now = time.monotonic()
+                with self._cond:
+                    self._meta[conn] = [now, now]
+                    if self.statement_cache_size > 0:
+                        self._statements[conn] = StatementCache(
+                            self.statement_cache_size, self.prepare_threshold
+                        )
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        reuse = not conn.closed and not self._expired(conn)
+        if reuse:
+            try:
+                # Never hand out a connection with an open transaction.
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                reuse = False
+        with self._cond:
+            self._in_use -= 1
+            if reuse:
+                self._meta[conn][1] = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+        if not reuse:
+            self._discard(conn)
+
+    def _expired(self, conn):
+        meta = self._meta.get(conn)
+        if meta is None:
+            return True
+        return time.monotonic() - meta[0] > self.max_lifetime
+
+    def _is_usable(self, conn):
+        if conn.closed or self._expired(conn):
+            return False
+        if time.monotonic() - self._meta[conn][1] < self.check_interval:
+            return True
+        # Connection sat idle for a while: make sure the server still has it.
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def statement_cache(self, conn):
+        with self._cond:
+            return self._statements.get(conn)
+
+    def _discard(self, conn, release_slot=True):
+        with self._cond:
+            self._meta.pop(conn, None)
+            cache = self._statements.pop(conn, None)
+            if cache is not None:
+                for key, value in cache.stats().items():
+                    if key != "prepared":
+                        self._retired_statements[key] = (
+                            self._retired_statements.get(key, 0) + value
+                        )
+            if release_slot:
+                self._size -= 1
+                self._cond.notify()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def _statement_stats(self):
+        totals = {"enabled": self.statement_cache_size > 0, "prepared": 0}
+        totals.update(self._retired_statements)
+        for cache in self._statements.values():
+            for key, value in cache.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": "postgres",
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(
+                    self._wait_total * 1000 / self._checkouts, 3
+                )
+                if self._checkouts
+                else 0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+                "statements": self._statement_stats(),
+            }
+
+
+class SQLitePool:
+    # One reusable connection per thread; nested checkouts share it and the
+    # transaction is only rolled back when the outermost checkout is released.
+    def __init__(self, connect, checkpoint_interval=0):
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._checkouts = 0
+        # wal_autocheckpoint only runs on commits that cross its threshold;
+        # a periodic passive checkpoint keeps the WAL short between bursts.
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpointed_at = time.monotonic()
+        self._checkpoints = 0
+
+    def acquire(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._opened += 1
+        self._local.depth += 1
+        with self._lock:
+            self._checkouts += 1
+            if self._local.depth == 1:
+                self._in_use += 1
+        return conn
+
+    def release(self, conn):
+        if getattr(self._local, "conn", None) is not conn:
+            conn.close()
+            return
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        with self._lock:
+            self._in_use -= 1
+        if conn.in_transaction:
+            conn.rollback()
+        if (
+            self.checkpoint_interval
+            and time.monotonic() - self._checkpointed_at > self.checkpoint_interval
+        ):
+            self._checkpoint(conn)
+
+    def _checkpoint(self, conn):
+        with self._lock:
+            if time.monotonic() - self._checkpointed_at <= self.checkpoint_interval:
+                return
+            self._checkpointed_at = time.monotonic()
+            self._checkpoints += 1
+        try:
+            # PASSIVE never waits on readers or writers.
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error as exc:
+            print(f"[DB] WAL checkpoint failed: {exc}")
+
+    def close_all(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "profile": SQLITE_PROFILE,
+                "size": self._opened,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "checkpoints": self._checkpoints,
+                "wait_avg_ms": 0,
+                "wait_max_ms": 0,
+            }
+
+
+def _postgres_dsn():
+    # (url, extra connect kwargs), shared by the sync and async drivers.
+    database_url = DATABASE_URL or ""
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    if database_url and "sslmode=" in database_url:
+        return database_url, {}
+    return database_url, {"sslmode": os.getenv("DB_SSLMODE", "require")}
+
+
+def load_postgres_driver():
+    global psycopg2, RealDictCursor, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+    global INTEGRITY_ERRORS
+    if psycopg2 is None:
+        import psycopg2
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+        from psycopg2.extras import RealDictCursor
+
+        INTEGRITY_ERRORS = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+
+
+def _connect_postgres():
+    load_postgres_driver()
+    database_url, kwargs = _postgres_dsn()
+    return psycopg2.connect(database_url, **kwargs)
+
+
+def _connect_sqlite():
+    timeout = SQLITE_BUSY_TIMEOUT_MS / 1000 if SQLITE_PROFILE == "tuned" else 5.0
+    conn = sqlite3.connect(DB_NAME, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    # Enforce foreign keys (SQLite only)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if SQLITE_PROFILE == "tuned":
+        apply_sqlite_profile(conn)
+    return conn
+
+
+def apply_sqlite_profile(conn):
+    # journal_mode is stored in the database file; the rest is per connection.
+    conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size = -{int(SQLITE_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(SQLITE_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA temp_store = {SQLITE_TEMP_STORE}")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {int(SQLITE_WAL_AUTOCHECKPOINT)}")
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool, _pool_pid
+    # Connections must not be shared across forked gunicorn workers.
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if DB_TYPE == "postgres":
+                    _pool = PostgresPool(
+                        _connect_postgres,
+                        max_size=DB_POOL_SIZE,
+                        timeout=DB_POOL_TIMEOUT,
+                        max_lifetime=DB_POOL_MAX_LIFETIME,
+                        check_interval=DB_POOL_CHECK_INTERVAL,
+                        statement_cache_size=PG_STATEMENT_CACHE_SIZE
+                        if PG_PREPARED_STATEMENTS
+                        else 0,
+                    )
+                else:
+                    checkpoint_interval = 0
+                    if SQLITE_PROFILE == "tuned" and SQLITE_JOURNAL_MODE.upper() == "WAL":
+                        checkpoint_interval = SQLITE_CHECKPOINT_INTERVAL
+                    _pool = SQLitePool(_connect_sqlite, checkpoint_interval)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def get_db_connection():
+    pool = get_pool()
+    started = time.perf_counter()
+    raw = pool.acquire()
+    stats = current_request_stats()
+    if stats is not None:
+        stats.acquire_seconds += time.perf_counter() - started
+    conn = DBConnection(raw, DB_TYPE, pool)
+    if has_app_context():
+        # Released at teardown in case a view returns (or raises) without closing.
+        g.setdefault("_db_connections", []).append(conn)
+    return conn
+
+
+def release_db_connections(exc):
+    for conn in g.pop("_db_connections", []):
+        conn.close()
+
+
+# -----------------------------
+# Async data layer
+# -----------------------------
+# Awaitable counterpart of get_db_connection()/DBConnection for code running
+# on the asgi_app event loop: psycopg 3's async driver on Postgres, and on
+# SQLite (no async API) one dedicated thread per connection. Statements
+# autocommit; the layer serves independent reads. The pool holds up to
+# ASYNC_DB_POOL_SIZE connections per process, on top of the DB_POOL_SIZE
+# synchronous ones.
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", str(DB_POOL_SIZE)))
+
+
+class AsyncResult:
+    # Rows are fetched before execute() returns; mirrors the cursor API.
+    def __init__(self, rows, rowcount):
+        self._rows = rows
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class SQLiteThread:
+    # One sqlite3 connection, only ever touched by its own thread.
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite-async"
+        )
+        self._conn = None
+        self.closed = False
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    def _call(self, fn, args):
+        if self._conn is None:
+            self._conn = _connect_sqlite()
+            self._conn.isolation_level = None
+        return fn(self._conn, *args)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        await self.run(lambda conn: conn.close())
+        self._executor.shutdown(wait=False)
+
+
+def _sqlite_fetch(conn, query, params):
+    cursor = conn.execute(query, params)
+    return cursor.fetchall(), cursor.rowcount
+
+
+def load_async_postgres_driver():
+    global psycopg, dict_row
+    if psycopg is None:
+        try:
+            import psycopg
+            from psycopg.rows import dict_row
+        except ImportError:
+            raise RuntimeError("The async data layer needs psycopg 3 on Postgres")
+
+
+async def _connect_postgres_async():
+    database_url, kwargs = _postgres_dsn()
+    conn = await psycopg.AsyncConnection.connect(
+        database_url,
+        autocommit=True,
+        row_factory=dict_row,
+        # psycopg 3 prepares repeated statements itself; same knobs as the
+        # sync StatementCache.
+        prepare_threshold=PG_PREPARE_THRESHOLD if PG_PREPARED_STATEMENTS else None,
+        **kwargs,
+    )
+    conn.prepared_max = PG_STATEMENT_CACHE_SIZE
+    return conn
+
+
+async def _connect_sqlite_async():
+    conn = SQLiteThread()
+    await conn.run(lambda raw: None)
+    return conn
+
+
+class AsyncPool:
+    # Bound to the event loop that first uses it; not thread-safe.
+    def __init__(self, connect, max_size, timeout):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self._slots = None
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(
+                f"No async database connection available after {self.timeout}s "
+                f"(pool size {self.max_size})"
+            )
+        self._in_use += 1
+        self._checkouts += 1
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.closed:
+                return conn
+            self._size -= 1
+        try:
+            conn = await self._connect()
+        except Exception:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+        self._size += 1
+        return conn
+
+    def release(self, conn):
+        self._in_use -= 1
+        if conn.closed:
+            self._size -= 1
+        else:
+            self._idle.append(conn)
+        self._slots.release()
+
+    async def close_all(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+            self._size -= 1
+
+    def stats(self):
+        return {
+            "max_size": self.max_size,
+            "size": self._size,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+        }
+
+
+class AsyncDBConnection:
+    def __init__(self, conn, db_type, pool, request_stats=None):
+        self.conn = conn
+        self.db_type = db_type
+        self._pool = pool
+        self._released = False
+        # Query hooks run on the event loop, outside any request context.
+        self.request_stats = request_stats
+
+    async def execute(self, query, params=None):
+        params = params or []
+        started = time.perf_counter()
+        if self.db_type == "postgres":
+            cursor = await self.conn.execute(pg_query(query), params)
+            rows = await cursor.fetchall() if cursor.description else []
+            rowcount = cursor.rowcount
+        else:
+            rows, rowcount = await self.conn.run(_sqlite_fetch, query, params)
+        self._run_hooks(query, params, time.perf_counter() - started)
+        return AsyncResult(rows, rowcount)
+
+    async def execute_pipeline(self, statements):
+        # Postgres: sends every (query, params) before reading any result,
+        # so independent statements cost one round trip instead of one each.
+        started = time.perf_counter()
+        async with self.conn.pipeline():
+            cursors = [
+                await self.conn.execute(pg_query(query), params or [])
+                for query, params in statements
+            ]
+        results = []
+        for cursor in cursors:
+            rows = await cursor.fetchall() if cursor.description else []
+            results.append(AsyncResult(rows, cursor.rowcount))
+        # The statements share one round trip, so the hooks see the pipeline
+        # once, with its total time, rather than each statement charged for it.
+        self._run_hooks(
+            ";\n".join(query for query, _ in statements),
+            [value for _, params in statements for value in params or []],
+            time.perf_counter() - started,
+        )
+        return results
+
+    def _run_hooks(self, query, params, seconds):
+        for hook in QUERY_HOOKS:
+            hook(self, query, params, seconds)
+
+    async def close(self):
+        if self._released:
+            return
+        self._released = True
+        # Broken connections report closed; the pool drops those.
+        self._pool.release(self.conn)
+
+
+_async_pool = None
+
+
+def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        if DB_TYPE == "postgres":
+            load_async_postgres_driver()
+            connect = _connect_postgres_async
+        else:
+            connect = _connect_sqlite_async
+        _async_pool = AsyncPool(connect, ASYNC_DB_POOL_SIZE, DB_POOL_TIMEOUT)
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close_all()
+        _async_pool = None
+
+
+async def get_async_db_connection(request_stats=None):
+    pool = get_async_pool()
+    return AsyncDBConnection(await pool.acquire(), DB_TYPE, pool, request_stats)
+
+
+async def fetch_all_async(parts, request_stats=None):
+    # Independent (kind, query, params) parts; returns the rows of every
+    # part, in order. Postgres gets them all in one pipelined round trip on
+    # one connection; SQLite runs them in parallel, one thread each.
+    if DB_TYPE == "postgres":
+        conn = await get_async_db_connection(request_stats)
+        try:
+            results = await conn.execute_pipeline(
+                [(query, params) for _, query, params in parts]
+            )
+            return [result.fetchall() for result in results]
+        finally:
+            await conn.close()
+
+    async def fetch(query, params):
+        conn = await get_async_db_connection(request_stats)
+        try:
+            return (await conn.execute(query, params)).fetchall()
+        finally:
+            await conn.close()
+
+    return await asyncio.gather(*(fetch(query, params) for _, query, params in parts))
+
+
+# -----------------------------
+# Metrics
+# -----------------------------
+# Per-request counters (queries, query time, rows, connection wait, template
+# render time) are collected in g and folded into a process-wide registry
+# after each request; /metrics renders it in Prometheus text format. With
+# METRICS_DIR set, every worker also snapshots its registry to
+# METRICS_DIR/metrics-<pid>.json and /metrics sums all snapshots, so any
+# gunicorn worker can answer a scrape. Empty the directory on deploy.
+METRICS = os.getenv("METRICS", "on").lower() != "off"
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_HELP = {
+    "expense_http_requests_total": ("counter", "Requests by route, method and status."),
+    "expense_http_request_duration_seconds": ("histogram", "Request latency by route."),
+    "expense_db_queries_total": ("counter", "SQL statements run, by route."),
+    "expense_db_query_seconds_total": ("counter", "Time spent executing and fetching SQL, by route."),
+    "expense_db_rows_total": ("counter", "Rows fetched, by route."),
+    "expense_db_acquire_seconds_total": ("counter", "Time spent waiting for a pooled connection, by route."),
+    "expense_template_render_seconds": ("histogram", "Template render time by template."),
+}
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "rows", "acquire_seconds", "render_started")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.acquire_seconds = 0.0
+        self.render_started = None
+
+
+def current_request_stats():
+    if METRICS and has_request_context():
+        return g.get("_request_stats")
+    return None
+
+
+class CountingCursor:
+    # Counts fetched rows for the current request (fetch time reaches
+    # _count_query through TimedCursor); everything else is delegated to
+    # the real cursor.
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchmany(self, size=None):
+        if size is None:
+            rows = self._cursor.fetchmany()
+        else:
+            rows = self._cursor.fetchmany(size)
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class MetricsRegistry:
+    # Recording only touches the calling thread's shard, so the request path
+    # takes no lock; snapshot() merges the shards (dict copies are atomic
+    # under the GIL). Shards are dropped after a fork.
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._pid = os.getpid()
+
+    def _shard(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._shards = []
+                    self._pid = os.getpid()
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = ({}, {})
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels, value=1):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard()[1]
+        key = (name, labels)
+        bucket_counts = histograms.get(key)
+        if bucket_counts is None:
+            # One slot per bucket, +Inf, then the running sum.
+            bucket_counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        bucket_counts[bisect_left(self.buckets, value)] += 1
+        bucket_counts[-1] += value
+
+    def snapshot(self):
+        counters, histograms = {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard_counters, shard_histograms in shards:
+            for key, value in dict(shard_counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, values in dict(shard_histograms).items():
+                merged = histograms.setdefault(key, [0] * len(values))
+                for i, value in enumerate(list(values)):
+                    merged[i] += value
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [
+                [name, list(labels), values] for (name, labels), values in histograms.items()
+            ],
+        }
+
+
+metrics = MetricsRegistry(LATENCY_BUCKETS)
+_metrics_flushed_at = 0.0
+
+
+def _metrics_file():
+    return os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+
+
+def flush_metrics():
+    # Atomic replace, so readers never see a partial snapshot.
+    global _metrics_flushed_at
+    _metrics_flushed_at = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _metrics_file()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(metrics.snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+def collect_metrics():
+    if not METRICS_DIR:
+        return metrics.snapshot()
+    flush_metrics()
+    counters, histograms = {}, {}
+    for name in os.listdir(METRICS_DIR):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in snapshot["counters"]:
+            key = (metric, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, values in snapshot["histograms"]:
+            key = (metric, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), values] for (name, labels), values in histograms.items()],
+    }
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels, extra=()):
+    pairs = [(key, value) for key, value in labels] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in pairs) + "}"
+
+
+def render_metrics(snapshot):
+    lines = []
+    by_name = {}
+    for name, labels, value in snapshot["counters"]:
+        by_name.setdefault(name, []).append(("counter", labels, value))
+    for name, labels, values in snapshot["histograms"]:
+        by_name.setdefault(name, []).append(("histogram", labels, values))
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, (by_name[name][0][0], name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_kind, labels, value in sorted(by_name[name], key=lambda s: s[1]):
+            if sample_kind == "counter":
+                lines.append(f"{name}{_label_text(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_label_text(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _count_query(conn, query, params, seconds):
+    stats = getattr(conn, "request_stats", None) or current_request_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += seconds
+
+
+if METRICS:
+    QUERY_HOOKS.append(_count_query)
+
+
+@bp.before_app_request
+def start_request_metrics():
+    if METRICS:
+        g._request_started = time.perf_counter()
+        g._request_stats = RequestStats()
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    stats = current_request_stats()
+    if stats is None:
+        return response
+    route = (("route", request.endpoint or "unmatched"),)
+    metrics.inc(
+        "expense_http_requests_total",
+        route + (("method", request.method), ("status", str(response.status_code))),
+    )
+    metrics.observe(
+        "expense_http_request_duration_seconds",
+        route,
+        time.perf_counter() - g._request_started,
+    )
+    if stats.queries:
+        metrics.inc("expense_db_queries_total", route, stats.queries)
+        metrics.inc("expense_db_query_seconds_total", route, stats.query_seconds)
+        metrics.inc("expense_db_rows_total", route, stats.rows)
+    if stats.acquire_seconds:
+        metrics.inc("expense_db_acquire_seconds_total", route, stats.acquire_seconds)
+    if METRICS_DIR and time.monotonic() - _metrics_flushed_at > METRICS_FLUSH_INTERVAL:
+        flush_metrics()
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    stats = current_request_stats()
+    if stats is not None:
+        stats.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    stats = current_request_stats()
+    if stats is not None and stats.render_started is not None:
+        metrics.observe(
+            "expense_template_render_seconds",
+            (("template", template.name),),
+            time.perf_counter() - stats.render_started,
+        )
+        stats.render_started = None
+
+
+# -----------------------------
+# Slow query log
+# -----------------------------
+# Opt-in (SLOW_QUERY_LOG=path): statements slower than SLOW_QUERY_MS are
+# written as JSON lines to a rotating file with normalized SQL, redacted
+# parameters (types only), duration and route. The first time a shape is
+# seen its plan is captured (EXPLAIN QUERY PLAN / EXPLAIN, never ANALYZE);
+# after that a shape is logged at most once per SLOW_QUERY_DEDUP_SECONDS,
+# carrying the number of suppressed repeats and their worst duration.
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_DEDUP_SECONDS = float(os.getenv("SLOW_QUERY_DEDUP_SECONDS", "60"))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+SLOW_QUERY_MAX_SHAPES = 1000
+SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+SQL_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+SQL_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def normalize_sql(query):
+    query = SQL_STRING_LITERAL.sub("?", query)
+    query = SQL_NUMBER_LITERAL.sub("?", query)
+    query = SQL_IN_LIST.sub("IN (...)", query)
+    return " ".join(query.split())
+
+
+def redact_params(params):
+    if params is None:
+        return None
+    return ["null" if value is None else type(value).__name__ for value in params]
+
+
+def explain_query(conn, query, params):
+    # Runs on the raw connection so it is not itself timed or logged.
+    if not isinstance(conn, DBConnection):
+        return None
+    if not query.lstrip().upper().startswith(SQL_EXPLAINABLE):
+        return None
+    if params is None and "?" in query:
+        return None
+    try:
+        if conn.db_type == "postgres":
+            # A failed EXPLAIN must not abort the caller's transaction.
+            with conn.conn.cursor() as cursor:
+                cursor.execute("SAVEPOINT slow_query_explain")
+                try:
+                    cursor.execute("EXPLAIN " + pg_query(query), params)
+                    plan = [row[0] for row in cursor.fetchall()]
+                finally:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        rows = conn.conn.execute("EXPLAIN QUERY PLAN " + query, params or []).fetchall()
+        return [row[3] for row in rows]
+    except Exception as exc:
+        return [f"EXPLAIN failed: {exc}"]
+
+
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms, dedup_seconds):
+        self.threshold = threshold_ms / 1000
+        self.dedup_seconds = dedup_seconds
+        self._lock = threading.Lock()
+        self._shapes = OrderedDict()
+        self._logger = logging.getLogger("expense_tracker.slow_query")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=SLOW_QUERY_LOG_BACKUPS,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(handler)
+
+    def __call__(self, conn, query, params, seconds):
+        if seconds < self.threshold:
+            return
+        sql = normalize_sql(query)
+        shape = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]
+        now = time.monotonic()
+        with self._lock:
+            state = self._shapes.get(shape)
+            is_new = state is None
+            if is_new:
+                state = {"last_logged": now, "repeats": 0, "max_ms": 0.0}
+                self._shapes[shape] = state
+                if len(self._shapes) > SLOW_QUERY_MAX_SHAPES:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(shape)
+                if now - state["last_logged"] < self.dedup_seconds:
+                    state["repeats"] += 1
+                    state["max_ms"] = max(state["max_ms"], seconds * 1000)
+                    return
+                state["last_logged"] = now
+            repeats, repeat_max_ms = state["repeats"], state["max_ms"]
+            state["repeats"], state["max_ms"] = 0, 0.0
+
+        entry = {
+            "ts": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "shape": shape,
+            "ms": round(seconds * 1000, 2),
+            "route": request.endpoint if has_request_context() else None,
+            "backend": conn.db_type,
+            "sql": sql,
+            "params": redact_params(params),
+        }
+        if repeats:
+            entry["repeats"] = repeats
+            entry["repeats_max_ms"] = round(repeat_max_ms, 2)
+        if is_new:
+            entry["plan"] = explain_query(conn, query, params)
+        self._logger.info(json.dumps(entry, default=str))
+
+
+if SLOW_QUERY_LOG:
+    QUERY_HOOKS.append(SlowQueryLog(SLOW_QUERY_LOG, SLOW_QUERY_MS, SLOW_QUERY_DEDUP_SECONDS))
+
+
+def init_db():
+    conn = get_db_connection()
+    if DB_TYPE == "postgres":
+        # Users table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE,
+                password TEXT NOT NULL
+            );
+        """)
+        # Categories table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS categories (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+        """)
+        # Expenses table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                id SERIAL PRIMARY KEY,
+                date DATE NOT NULL,
+                item TEXT NOT NULL,
+                category_id INTEGER REFERENCES categories(id),
+                amount REAL NOT NULL,
+                user_id INTEGER REFERENCES users(id)
+            );
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                token_hash TEXT NOT NULL UNIQUE,
+                expires_at TIMESTAMP NOT NULL,
+                used_at TIMESTAMP,
+                created_at TIMESTAMP NOT NULL
+            );
+        """)
+    else:
+        # Users table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE,
+                password TEXT NOT NULL
+            );
+        """)
+        # Categories table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            );
+        """)
+        # Expenses table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                item TEXT NOT NULL,
+                category_id INTEGER,
+                amount REAL NOT NULL,
+                user_id INTEGER,
+                FOREIGN KEY (category_id) REFERENCES categories(id),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                token_hash TEXT NOT NULL UNIQUE,
+                expires_at TEXT NOT NULL,
+                used_at TEXT,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+        """)
+
+    # Add user_id column for existing databases
+    if DB_TYPE == "postgres":
+        conn.execute(
+            "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id)"
+        )
+    else:
+        columns = conn.execute("PRAGMA table_info(expenses)").fetchall()
+        column_names = {col["name"] for col in columns}
+        if "user_id" not in column_names:
+            conn.execute(
+                "ALTER TABLE expenses ADD COLUMN user_id INTEGER REFERENCES users(id)"
+            )
+    conn.commit()
+    run_migrations(conn)
+    conn.close()
+
+
+# -----------------------------
+# Schema migrations
+# -----------------------------
+# Ordered, idempotent schema steps applied on top of the base tables in
+# init_db(). Each step runs once and is recorded in schema_version; never
+# edit a released step, add a new one instead.
+MIGRATIONS = []
+MIGRATION_LOCK_ID = 7428301
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return register
+
+
+def _applied_migrations(conn):
+    if conn.db_type == "postgres":
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            );
+        """)
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            );
+        """)
+    rows = conn.execute("SELECT version FROM schema_version").fetchall()
+    return {row["version"] for row in rows}
+
+
+def run_migrations(conn):
+    if conn.db_type == "postgres":
+        # Serialize concurrent workers starting at the same time.
+        conn.execute("SELECT pg_advisory_lock(?)", (MIGRATION_LOCK_ID,))
+    try:
+        applied = _applied_migrations(conn)
+        conn.commit()
+        for version, description, fn in MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                fn(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, _to_db_datetime(datetime.utcnow())),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"[Migrate] Applied {version}: {description}")
+    finally:
+        if conn.db_type == "postgres":
+            conn.execute("SELECT pg_advisory_unlock(?)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+
+
+@bp.cli.command("migrate")
+def migrate_command():
+    """Create the tables and apply pending schema migrations."""
+    init_db()
+    click.echo(f"Schema is at version {MIGRATIONS[-1][0]}.")
+
+
+@migration(1, "Index expenses by user and date")
+def _migrate_expense_user_date_index(conn):
+    # build_expense_filters always filters on user_id plus a date range.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date)"
+    )
+
+
+@migration(2, "Index expenses by user, category and date")
+def _migrate_expense_user_category_index(conn):
+    # Category joins/counts per user (dashboard, categories_view, delete_category).
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date "
+        "ON expenses (user_id, category_id, date)"
+    )
+    # Cross-user usage check in delete_category.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category_id)"
+    )
+
+
+@migration(3, "Index password reset tokens by user")
+def _migrate_reset_token_user_index(conn):
+    # _store_reset_token invalidates active tokens by (user_id, used_at IS NULL).
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reset_tokens_user_used "
+        "ON password_reset_tokens (user_id, used_at)"
+    )
+
+
+@migration(4, "Add per-user monthly expense rollup")
+def _migrate_expense_rollup(conn):
+    # category_id 0 stands for uncategorized expenses so the key stays NOT NULL.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS expense_rollup (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category_id INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            max_amount REAL NOT NULL,
+            PRIMARY KEY (user_id, month, category_id)
+        );
+    """)
+    # Filled by migration 5, once dates are normalized: on an older Postgres
+    # database expenses.date is still TEXT at this point.
+
+
+@migration(5, "Store expense dates natively")
+def _migrate_native_expense_dates(conn):
+    # Postgres gets a real DATE column; SQLite keeps TEXT but every value is
+    # normalized to ISO YYYY-MM-DD so range predicates compare correctly.
+    if conn.db_type == "postgres":
+        column = conn.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'expenses' AND column_name = 'date'
+        """).fetchone()
+        if column and column["data_type"] != "date":
+            conn.execute("""
+                ALTER TABLE expenses ALTER COLUMN date TYPE DATE USING (
+                    CASE
+                        WHEN date ~ '^[0-9]{2}-[0-9]{2}-[0-9]{4}$'
+                            THEN to_date(date, 'DD-MM-YYYY')
+                        ELSE substr(date, 1, 10)::date
+                    END
+                )
+            """)
+    else:
+        conn.execute("""
+            UPDATE expenses
+            SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+            WHERE date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]'
+        """)
+        conn.execute("""
+            UPDATE expenses
+            SET date = substr(date, 1, 10)
+            WHERE length(date) > 10
+              AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+        """)
+    # Normalizing can move rows between months.
+    refresh_rollup(conn)
+
+
+@migration(6, "Add per-user and catalog data versions")
+def _migrate_data_versions(conn):
+    if conn.db_type == "postgres":
+        conn.execute(
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0"
+        )
+    else:
+        columns = conn.execute("PRAGMA table_info(users)").fetchall()
+        if "data_version" not in {col["name"] for col in columns}:
+            conn.execute(
+                "ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"
+            )
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """)
+    conn.execute(
+        "INSERT INTO catalog_versions (name, version) VALUES ('categories', 0) "
+        "ON CONFLICT (name) DO NOTHING"
+    )
+
+
+@migration(7, "Add email outbox")
+def _migrate_email_outbox(conn):
+    if conn.db_type == "postgres":
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id SERIAL PRIMARY KEY,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP,
+                claim TEXT,
+                claimed_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP NOT NULL,
+                sent_at TIMESTAMP
+            );
+        """)
+    else:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TEXT NOT NULL,
+                expires_at TEXT,
+                claim TEXT,
+                claimed_at TEXT,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                sent_at TEXT
+            );
+        """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_status_next "
+        "ON email_outbox (status, next_attempt_at)"
+    )
+
+
+@migration(8, "Track when user data and catalogs last changed")
+def _migrate_data_modified_at(conn):
+    # Unix seconds, set next to every data/catalog version bump.
+    if conn.db_type == "postgres":
+        conn.execute(
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS data_modified_at BIGINT NOT NULL DEFAULT 0"
+        )
+        conn.execute(
+            "ALTER TABLE catalog_versions ADD COLUMN IF NOT EXISTS modified_at BIGINT NOT NULL DEFAULT 0"
+        )
+        return
+    for table, column in (("users", "data_modified_at"), ("catalog_versions", "modified_at")):
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if column not in {col["name"] for col in columns}:
+            conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+            )
+
+
+@migration(9, "Full-text search over expense items")
+def _migrate_expense_search(conn):
+    # Both indexes know the owner, so a search only ever reads that user's
+    # entries instead of every match in the table (a common word can match
+    # a quarter of it). On Postgres each word is stored as '<user_id>:<word>'
+    # in a generated tsvector column, which COPY and every UPDATE keep in
+    # sync by themselves. On SQLite an external-content FTS5 table, kept in
+    # sync by triggers, indexes user_id next to item; prefixes up to 6
+    # characters are indexed, longer ones are resolved from the word index.
+    if conn.db_type == "postgres":
+        conn.execute("""
+            CREATE OR REPLACE FUNCTION expense_search_vector(user_id INTEGER, item TEXT)
+            RETURNS tsvector LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+                SELECT array_to_tsvector(ARRAY(
+                    SELECT user_id || ':' || lexeme FROM unnest(to_tsvector('simple', item))
+                ))
+            $$
+        """)
+        conn.execute("""
+            ALTER TABLE expenses ADD COLUMN IF NOT EXISTS item_tsv tsvector
+            GENERATED ALWAYS AS (expense_search_vector(user_id, item)) STORED
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_expenses_item_tsv ON expenses USING GIN (item_tsv)"
+        )
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+            item,
+            user_id,
+            content = 'expenses',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4 5 6',
+            detail = 'column'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, item, user_id) VALUES (new.id, new.item, new.user_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, item, user_id)
+            VALUES ('delete', old.id, old.item, old.user_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF item, user_id ON expenses
+        BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, item, user_id)
+            VALUES ('delete', old.id, old.item, old.user_id);
+            INSERT INTO expenses_fts (rowid, item, user_id) VALUES (new.id, new.item, new.user_id);
+        END
+    """)
+    conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+
+
+# -----------------------------
+# Category catalog
+# -----------------------------
+CATEGORY_CACHE_CHECK_INTERVAL = float(os.getenv("CATEGORY_CACHE_CHECK_INTERVAL", "5"))
+
+
+class CategoryCatalog:
+    # Process-wide copy of the (small, global) categories table. Local writes
+    # invalidate it directly; changes made by other workers are picked up by
+    # comparing catalog_versions['categories'], at most once per interval.
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._rows = None
+        self._names = {}
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    def rows(self, conn, version=None):
+        with self._lock:
+            rows = self._rows
+            if rows is not None:
+                if version is not None and version == self._version:
+                    return rows
+                if (
+                    version is None
+                    and time.monotonic() - self._checked_at < self.check_interval
+                ):
+                    return rows
+        if version is None:
+            row = conn.execute(
+                "SELECT version FROM catalog_versions WHERE name = 'categories'"
+            ).fetchone()
+            version = row["version"] if row else 0
+        with self._lock:
+            if self._rows is not None and version == self._version:
+                self._checked_at = time.monotonic()
+                return self._rows
+        return self._load(conn, version)
+
+    def names(self, conn, ids=()):
+        # id -> name; reloads once if an id is unknown (created elsewhere).
+        self.rows(conn)
+        with self._lock:
+            names = self._names
+        if any(i is not None and i not in names for i in ids):
+            self._load(conn)
+            with self._lock:
+                names = self._names
+        return names
+
+    def _load(self, conn, version=None):
+        if version is None:
+            row = conn.execute(
+                "SELECT version FROM catalog_versions WHERE name = 'categories'"
+            ).fetchone()
+            version = row["version"] if row else 0
+        rows = [
+            {"id": row["id"], "name": row["name"]}
+            for row in conn.execute(
+                "SELECT id, name FROM categories ORDER BY name"
+            ).fetchall()
+        ]
+        with self._lock:
+            self._rows = rows
+            self._names = {row["id"]: row["name"] for row in rows}
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.loads += 1
+        return rows
+
+
+category_catalog = CategoryCatalog(CATEGORY_CACHE_CHECK_INTERVAL)
+
+
+def get_categories(conn=None, version=None):
+    if conn is not None:
+        return category_catalog.rows(conn, version)
+    conn = get_db_connection()
+    categories = category_catalog.rows(conn, version)
+    conn.close()
+    return categories
+
+
+def _stable_index(text, length):
+    if not text:
+        return 0
+    total = 0
+    for i, ch in enumerate(str(text).lower()):
+        total += (i + 1) * ord(ch)
+    return total % length
+
+
+def _hex_to_rgba(hex_color, alpha=0.18):
+    hex_color = hex_color.lstrip("#")
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return f"rgba({r}, {g}, {b}, {alpha})"
+
+
+def format_pretty_date(value):
+    if not value:
+        return ""
+    if isinstance(value, date_type):
+        dt = value
+    else:
+        # Dates are stored as ISO (see migration 5), so one parse per row.
+        try:
+            dt = date_type.fromisoformat(str(value)[:10])
+        except ValueError:
+            return str(value)
+    return f"{dt.day} {dt.strftime('%B')} {dt.year}"
+
+
+def category_style(value):
+    index = _stable_index(value, len(CHART_PALETTE))
+    color = CHART_PALETTE[index]
+    return f"background: {_hex_to_rgba(color)}; color: {color};"
+
+
+@bp.app_template_filter("pretty_date")
+def pretty_date_filter(value):
+    return format_pretty_date(value)
+
+
+@bp.app_template_filter("category_style")
+def category_style_filter(value):
+    return category_style(value)
+
+
+# -----------------------------
+# Static assets
+# -----------------------------
+# `flask assets-build` copies static/ into static/build/ under content-hashed
+# names, precompresses text files to .gz/.br and writes manifest.json.
+# Templates link through asset_url(), which points at the fingerprinted copy
+# under /assets/ (immutable, variant picked by Accept-Encoding); without a
+# build (local dev) it falls back to the plain /static/ URL. Third-party files
+# are pinned in VENDOR_ASSETS and fetched into static/ by `assets-vendor` (and
+# by `assets-build`, which refuses to build without them); until they exist,
+# asset_url links the pinned upstream copy instead.
+ASSET_BUILD_DIR = "build"
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_COMPRESS_SUFFIXES = (".css", ".js", ".json", ".map", ".svg", ".txt")
+ASSET_MIN_COMPRESS_SIZE = 256
+ASSET_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+VENDOR_ASSETS = {
+    "vendor/chart.umd.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js",
+}
+for _weight in (400, 500, 600, 700):
+    VENDOR_ASSETS[f"vendor/fonts/plus-jakarta-sans-latin-{_weight}-normal.woff2"] = (
+        "https://cdn.jsdelivr.net/npm/@fontsource/plus-jakarta-sans@5/files/"
+        f"plus-jakarta-sans-latin-{_weight}-normal.woff2"
+    )
+for _weight in (600, 700):
+    VENDOR_ASSETS[f"vendor/fonts/sora-latin-{_weight}-normal.woff2"] = (
+        "https://cdn.jsdelivr.net/npm/@fontsource/sora@5/files/"
+        f"sora-latin-{_weight}-normal.woff2"
+    )
+# Local stylesheets that only work once their vendored files exist:
+# (upstream equivalent, files needed).
+VENDOR_FALLBACKS = {
+    "vendor/fonts.css": (
+        "https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700"
+        "&family=Sora:wght@600;700&display=swap",
+        [name for name in VENDOR_ASSETS if name.startswith("vendor/fonts/")],
+    ),
+}
+mimetypes.add_type("font/woff2", ".woff2")
+_asset_manifest = None
+
+
+def asset_manifest():
+    # Loaded once per process; a deploy runs assets-build before starting.
+    global _asset_manifest
+    if _asset_manifest is None:
+        path = os.path.join(current_app.static_folder, ASSET_BUILD_DIR, "manifest.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                _asset_manifest = json.load(f)
+        except (OSError, ValueError):
+            _asset_manifest = {}
+    return _asset_manifest
+
+
+@bp.app_template_global()
+def asset_url(filename):
+    built = asset_manifest().get(filename)
+    if built:
+        # assets-build only succeeds with every vendored file in place.
+        return url_for("built_asset", filename=built)
+    if filename in VENDOR_ASSETS:
+        upstream, needed = VENDOR_ASSETS[filename], [filename]
+    elif filename in VENDOR_FALLBACKS:
+        upstream, needed = VENDOR_FALLBACKS[filename]
+    else:
+        return url_for("static", filename=filename)
+    if missing_vendor_assets(current_app.static_folder, needed):
+        # Not fetched yet: use the pinned upstream copy.
+        return upstream
+    return url_for("static", filename=filename)
+
+
+def missing_vendor_assets(static_dir, names=VENDOR_ASSETS):
+    return [name for name in names if not os.path.isfile(os.path.join(static_dir, name))]
+
+
+def fetch_vendor_assets(static_dir, names):
+    # Yields (name, url, size) per downloaded file.
+    for name in names:
+        url = VENDOR_ASSETS[name]
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        path = os.path.join(static_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        yield name, url, len(data)
+
+
+@route("/assets/<path:filename>")
+def built_asset(filename):
+    build_dir = os.path.join(current_app.static_folder, ASSET_BUILD_DIR)
+    served, encoding = filename, None
+    for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+        variant = safe_join(build_dir, filename + suffix)
+        if request.accept_encodings[name] and variant and os.path.isfile(variant):
+            served, encoding = filename + suffix, name
+            break
+    response = send_from_directory(
+        build_dir,
+        served,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        max_age=ASSET_MAX_AGE,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
+
+
+def _fingerprint(name, data):
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _rewrite_css_urls(name, text, manifest):
+    # Point url(...) references at the fingerprinted copies, relative to the
+    # stylesheet so the build directory can be served from any prefix.
+    folder = posixpath.dirname(name)
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        path = ref.split("?", 1)[0].split("#", 1)[0]
+        target = posixpath.normpath(posixpath.join(folder, path))
+        if target not in manifest:
+            return match.group(0)
+        return f'url("{posixpath.relpath(manifest[target], folder or ".")}")'
+
+    return ASSET_CSS_URL.sub(replace, text)
+
+
+def build_assets(static_dir, build_dir):
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != build_dir]
+        for file in files:
+            path = os.path.join(root, file)
+            sources.append(os.path.relpath(path, static_dir).replace(os.sep, "/"))
+    # Stylesheets last, so the files they reference are already hashed.
+    sources.sort(key=lambda name: (name.endswith(".css"), name))
+
+    manifest = {}
+    stats = {"files": 0, "bytes": 0, "gzip": 0, "br": 0}
+    for name in sources:
+        with open(os.path.join(static_dir, name), "rb") as f:
+            data = f.read()
+        if name.endswith(".css"):
+            data = _rewrite_css_urls(name, data.decode("utf-8"), manifest).encode("utf-8")
+        built = _fingerprint(name, data)
+        manifest[name] = built
+        target = os.path.join(build_dir, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+
+        if not name.endswith(ASSET_COMPRESS_SUFFIXES) or len(data) < ASSET_MIN_COMPRESS_SIZE:
+            continue
+        variants = [("gzip", ".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(("br", ".br", brotli.compress(data, quality=11)))
+        for key, suffix, encoded in variants:
+            # Only keep a variant that actually saves bytes.
+            if len(encoded) < len(data):
+                with open(target + suffix, "wb") as f:
+                    f.write(encoded)
+                stats[key] += len(data) - len(encoded)
+
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    stats["brotli"] = brotli is not None
+    return manifest, stats
+
+
+@bp.cli.command("assets-build")
+def assets_build_command():
+    """Fingerprint and precompress static files into static/build."""
+    build_dir = os.path.join(current_app.static_folder, ASSET_BUILD_DIR)
+    # A build must serve every third-party file itself: fetch what is
+    # missing, and stop rather than ship pages that still load from a CDN.
+    try:
+        for name, url, size in fetch_vendor_assets(
+            current_app.static_folder, missing_vendor_assets(current_app.static_folder)
+        ):
+            click.echo(f"{name}: {size} bytes from {url}")
+    except OSError as exc:
+        raise click.ClickException(
+            f"Could not fetch vendored assets ({exc}); run assets-vendor where "
+            "the network is reachable, or commit the files under static/vendor."
+        )
+    manifest, stats = build_assets(current_app.static_folder, build_dir)
+    click.echo(
+        f"Built {stats['files']} file(s), {stats['bytes']} bytes; precompression "
+        f"saves {stats['gzip']} bytes (gzip) / {stats['br']} bytes (brotli)."
+    )
+    if not stats["brotli"]:
+        click.echo("brotli is not installed; only .gz variants were written.")
+
+
+@bp.cli.command("assets-vendor")
+@click.option("--force", is_flag=True, help="Download files that already exist.")
+def assets_vendor_command(force):
+    """Download the pinned third-party assets into static/vendor."""
+    names = list(VENDOR_ASSETS) if force else missing_vendor_assets(current_app.static_folder)
+    for name, url, size in fetch_vendor_assets(current_app.static_folder, names):
+        click.echo(f"{name}: {size} bytes from {url}")
+
+
+# -----------------------------
+# Response compression
+# -----------------------------
+# Compresses HTML/JSON/CSV responses on the way out (brotli or gzip, by
+# Accept-Encoding). Small bodies are left alone; streamed bodies are
+# compressed chunk by chunk and flushed so exports still stream. Responses
+# that already carry a Content-Encoding (the precompressed /assets/) and
+# send_file responses are never touched.
+COMPRESS = os.getenv("COMPRESS", "on").lower() != "off"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESS_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+}
+
+
+def negotiate_encoding(accept_encodings):
+    # Highest q wins; brotli on ties.
+    best, best_q = None, 0
+    for name in ("br", "gzip"):
+        if name == "br" and brotli is None:
+            continue
+        quality = accept_encodings[name]
+        if quality > best_q:
+            best, best_q = name, quality
+    return best
+
+
+def compress_body(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def _stream_compressor(encoding):
+    # (compress, flush, finish) for incremental output.
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def _compress_stream(chunks, encoding):
+    compress, flush, finish = _stream_compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            # Flush per chunk so each batch reaches the client immediately.
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+@bp.after_app_request
+def compress_response(response):
+    if (
+        not COMPRESS
+        or response.mimetype not in COMPRESS_MIMETYPES
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.cache_control.no_transform
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None or request.method == "HEAD":
+        return response
+    if response.status_code == 304:
+        # Match the validator the full (compressed) response would carry.
+        _weaken_etag(response)
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206):
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress_body(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # The bytes differ from the identity body, so a strong ETag no longer holds.
+    _weaken_etag(response)
+    return response
+
+
+def _weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+# -----------------------------
+# Auth helpers
+# -----------------------------
+def _initials_from_name(name, email=None):
+    if name:
+        parts = [part for part in name.strip().split() if part]
+        initials = "".join([p[0].upper() for p in parts[:2]])
+        if initials:
+            return initials
+    if email:
+        return email.strip()[:2].upper()
+    return "U"
+
+
+def get_current_user():
+    if not session.get("user_id"):
+        return None
+    return {
+        "id": session.get("user_id"),
+        "name": session.get("user_name"),
+        "email": session.get("user_email"),
+    }
+
+
+@bp.app_context_processor
+def inject_current_user():
+    user = get_current_user()
+    initials = None
+    if user:
+        initials = _initials_from_name(user.get("name"), user.get("email"))
+    return {"current_user": user, "user_initials": initials}
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get("user_id"):
+            return redirect(url_for("login"))
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+# -----------------------------
+# Password helpers
+# -----------------------------
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "16"))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+def _bcrypt_hash(password, rounds):
+    # Use bcrypt for new passwords (stronger than default PBKDF2).
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode(
+        "utf-8"
+    )
+
+
+def _check_password(stored_hash, password):
+    # Support legacy Werkzeug hashes and new bcrypt hashes.
+    if stored_hash.startswith("$2"):
+        import bcrypt
+
+        return bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
+    return check_password_hash(stored_hash, password)
+
+
+class HashingPool:
+    # bcrypt runs in a small process pool. At most workers + queue_size jobs
+    # may be in flight; anything beyond that is shed immediately instead of
+    # queueing behind a login burst. workers=0 hashes inline (dev/tests).
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.capacity = workers + queue_size if workers else queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._in_flight = 0
+        self._completed = 0
+        self._shed = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._shed += 1
+            raise HashingOverloaded("Password hashing queue is full")
+        with self._lock:
+            self._in_flight += 1
+        started = time.perf_counter()
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            self._done(started)
+            return future
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._done(started, record=False)
+            raise
+        future.add_done_callback(lambda _: self._done(started))
+        return future
+
+    def run(self, fn, *args):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise HashingOverloaded("Password hashing timed out")
+
+    def _done(self, started, record=True):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._in_flight -= 1
+            if record:
+                self._completed += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "queue_depth": self._in_flight,
+                "completed": self._completed,
+                "shed": self._shed,
+                "latency_avg_ms": round(
+                    self._latency_total * 1000 / self._completed, 3
+                )
+                if self._completed
+                else 0,
+                "latency_max_ms": round(self._latency_max * 1000, 3),
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+            }
+
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_QUEUE_SIZE, HASH_TIMEOUT)
+
+
+def _hash_password(password):
+    return hashing_pool.run(_bcrypt_hash, password, BCRYPT_ROUNDS)
+
+
+def _verify_password(stored_hash, password):
+    return hashing_pool.run(_check_password, stored_hash, password)
+
+
+def _needs_rehash(stored_hash):
+    # Legacy Werkzeug hashes and bcrypt hashes below the configured cost.
+    if not stored_hash.startswith("$2"):
+        return True
+    try:
+        return int(stored_hash.split("$")[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+_rehash_writer = None
+_rehash_writer_pid = None
+_rehash_writer_lock = threading.Lock()
+
+
+def _get_rehash_writer():
+    # The UPDATE must not run in the done callback: that is the process
+    # pool's result-handling thread, which every other hash waits on.
+    global _rehash_writer, _rehash_writer_pid
+    if _rehash_writer is None or _rehash_writer_pid != os.getpid():
+        with _rehash_writer_lock:
+            if _rehash_writer is None or _rehash_writer_pid != os.getpid():
+                _rehash_writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="password-rehash"
+                )
+                _rehash_writer_pid = os.getpid()
+    return _rehash_writer
+
+
+def _rehash_in_background(user_id, stored_hash, password):
+    try:
+        future = hashing_pool.submit(_bcrypt_hash, password, BCRYPT_ROUNDS)
+    except HashingOverloaded:
+        # Busy: the next successful login will try again.
+        return
+
+    def store(done):
+        try:
+            conn = get_db_connection()
+            try:
+                # Only replace the hash we verified against (not a newer reset).
+                conn.execute(
+                    "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                    (done.result(), user_id, stored_hash),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as exc:
+            print(f"[Password Rehash] Failed for user {user_id}: {exc}")
+
+    future.add_done_callback(lambda done: _get_rehash_writer().submit(store, done))
+
+
+def _busy_response(template, **context):
+    flash("The server is busy. Please try again in a moment.", "warning")
+    return render_template(template, **context), 503
+
+
+# -----------------------------
+# Rate limiting
+# -----------------------------
+# Token buckets keyed by client IP and by email, checked before any bcrypt or
+# database work. Limits are "<requests>/<seconds>".
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "ratelimit.db")
+# Reverse proxies in front of the app (0: none). Each appends the address it
+# saw to X-Forwarded-For, so the client is the entry added by the outermost
+# trusted proxy, N from the right; anything left of it is up to the client.
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", "0"))
+RATE_LIMITS = {
+    "login_ip": os.getenv("LOGIN_IP_RATE_LIMIT", "20/60"),
+    "login_email": os.getenv("LOGIN_EMAIL_RATE_LIMIT", "5/60"),
+    "reset_ip": os.getenv("RESET_IP_RATE_LIMIT", "5/300"),
+    "reset_email": os.getenv("RESET_EMAIL_RATE_LIMIT", "3/900"),
+}
+
+
+def _parse_rate(value):
+    count, seconds = value.split("/")
+    return float(count), float(count) / float(seconds)
+
+
+class MemoryBucketStore:
+    # key -> (tokens, updated_at, full_at). full_at is when the bucket has
+    # refilled at its own limit's rate; past it the bucket carries no state
+    # and is swept, so memory tracks recently active clients only.
+    def __init__(self, sweep_interval=60):
+        self.sweep_interval = sweep_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            retry_after = 0 if tokens >= 1 else (1 - tokens) / rate
+            if tokens >= 1:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return retry_after
+
+    def _sweep(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if bucket[2] > now
+        }
+        self._last_sweep = now
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    # Shared by every worker on the host through a local SQLite file.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                retry_after = 0 if tokens >= 1 else (1 - tokens) / rate
+                if tokens >= 1:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                if secrets.randbelow(1000) == 0:
+                    conn.execute(
+                        "DELETE FROM buckets WHERE updated_at < ?", (now - 86400,)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return retry_after
+        except sqlite3.Error:
+            # Fail open: a busy limiter file must not lock users out.
+            return 0
+
+    def size(self):
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+
+class RateLimiter:
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = {name: _parse_rate(value) for name, value in limits.items()}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, *checks):
+        # checks: (limit_name, key) pairs; returns seconds to wait, 0 if allowed.
+        for name, key in checks:
+            if not key:
+                continue
+            capacity, rate = self.limits[name]
+            retry_after = self.store.take(f"{name}:{key}", capacity, rate)
+            if retry_after:
+                with self._lock:
+                    self.rejected += 1
+                return retry_after
+        with self._lock:
+            self.allowed += 1
+        return 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": RATE_LIMIT_BACKEND,
+                "keys": self.store.size(),
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+            }
+
+
+if RATE_LIMIT_BACKEND == "sqlite":
+    rate_limiter = RateLimiter(SQLiteBucketStore(RATE_LIMIT_PATH), RATE_LIMITS)
+else:
+    rate_limiter = RateLimiter(MemoryBucketStore(), RATE_LIMITS)
+
+
+def client_ip():
+    if RATE_LIMIT_TRUST_PROXY and "X-Forwarded-For" in request.headers:
+        route = request.access_route
+        if len(route) >= RATE_LIMIT_TRUST_PROXY:
+            return route[-RATE_LIMIT_TRUST_PROXY]
+    return request.remote_addr
+
+
+def _rate_limited_response(template, retry_after, **context):
+    flash("Too many attempts. Please wait a moment and try again.", "danger")
+    response = make_response(render_template(template, **context), 429)
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def _parse_db_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _to_db_datetime(value):
+    if DB_TYPE == "postgres":
+        return value
+    return value.isoformat()
+
+
+def _store_reset_token(user_id, token_hash, expires_at, created_at, email=None):
+    # email: optional (to, subject, body) queued in the same transaction.
+    conn = get_db_connection()
+    expires_at_db = _to_db_datetime(expires_at)
+    created_at_db = _to_db_datetime(created_at)
+    # Invalidate any existing active tokens for this user.
+    conn.execute(
+        "UPDATE password_reset_tokens SET used_at = ? WHERE user_id = ? AND used_at IS NULL",
+        (created_at_db, user_id),
+    )
+    conn.execute(
+        """
+        INSERT INTO password_reset_tokens (user_id, token_hash, expires_at, used_at, created_at)
+        VALUES (?, ?, ?, NULL, ?)
+        """,
+        (user_id, token_hash, expires_at_db, created_at_db),
+    )
+    if email:
+        enqueue_email(conn, *email, expires_at=expires_at)
+    conn.commit()
+    conn.close()
+    if email:
+        outbox_worker.wake()
+
+
+def _get_reset_token(token_hash):
+    conn = get_db_connection()
+    token_row = conn.execute(
+        """
+        SELECT id, user_id, expires_at, used_at
+        FROM password_reset_tokens
+        WHERE token_hash = ?
+        """,
+        (token_hash,),
+    ).fetchone()
+    conn.close()
+    return token_row
+
+
+def _mark_token_used(token_id, used_at):
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE password_reset_tokens SET used_at = ? WHERE id = ?",
+        (_to_db_datetime(used_at), token_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _reset_email(to_email, reset_link):
+    return (
+        to_email,
+        "Reset your Expense Tracker password",
+        "Use the link below to reset your password. It expires in 15 minutes.\n\n"
+        f"{reset_link}\n\n"
+        "If you did not request a reset, you can ignore this email.",
+    )
+
+
+# -----------------------------
+# Email outbox
+# -----------------------------
+# Requests only insert into email_outbox; a background worker claims due rows
+# in batches and hands them to the configured transport, retrying with
+# exponential backoff until OUTBOX_MAX_ATTEMPTS, after which the row is
+# dead-lettered (status 'dead') for inspection.
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "console")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "10"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "900"))
+OUTBOX_CLAIM_TIMEOUT = 600
+# "thread" drains the outbox inside each web process; set to "off" when a
+# dedicated `flask outbox-worker` process runs instead (the Procfile does).
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "thread")
+
+
+class ConsoleTransport:
+    def send(self, to_email, subject, body):
+        # For local development: log the message instead of sending it.
+        print(f"[Email] To {to_email}: {subject}\n{body}")
+
+
+class SMTPTransport:
+    def __init__(self, host, port, username=None, password=None, sender=None,
+                 starttls=True, timeout=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, to_email, subject, body):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to_email
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+def get_email_transport():
+    if EMAIL_TRANSPORT == "smtp":
+        return SMTPTransport(
+            os.getenv("SMTP_HOST", "localhost"),
+            int(os.getenv("SMTP_PORT", "587")),
+            username=os.getenv("SMTP_USERNAME"),
+            password=os.getenv("SMTP_PASSWORD"),
+            sender=os.getenv("SMTP_FROM"),
+            starttls=os.getenv("SMTP_STARTTLS", "1") == "1",
+        )
+    return ConsoleTransport()
+
+
+def enqueue_email(conn, to_email, subject, body, expires_at=None):
+    now = _to_db_datetime(datetime.utcnow())
+    conn.execute(
+        """
+        INSERT INTO email_outbox
+            (to_email, subject, body, status, attempts, next_attempt_at, expires_at, created_at)
+        VALUES (?, ?, ?, 'pending', 0, ?, ?, ?)
+        """,
+        (
+            to_email,
+            subject,
+            body,
+            now,
+            _to_db_datetime(expires_at) if expires_at else None,
+            now,
+        ),
+    )
+
+
+def _outbox_backoff(attempts):
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+    # Jitter so retries from many workers do not line up.
+    return delay * (0.5 + secrets.randbelow(1000) / 1000)
+
+
+def _claim_outbox_batch(conn, batch_size):
+    now = datetime.utcnow()
+    claim = secrets.token_hex(8)
+    stale = now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+    due = """
+        (status = 'pending' AND next_attempt_at <= ?)
+        OR (status = 'sending' AND claimed_at < ?)
+    """
+    # The status condition is repeated outside the subquery so concurrent
+    # workers on Postgres cannot claim the same row twice.
+    conn.execute(
+        f"""
+        UPDATE email_outbox
+        SET status = 'sending', claim = ?, claimed_at = ?
+        WHERE ({due}) AND id IN (
+            SELECT id FROM email_outbox
+            WHERE {due}
+            ORDER BY id
+            LIMIT ?
+        )
+        """,
+        (
+            claim,
+            _to_db_datetime(now),
+            _to_db_datetime(now),
+            _to_db_datetime(stale),
+            _to_db_datetime(now),
+            _to_db_datetime(stale),
+            batch_size,
+        ),
+    )
+    conn.commit()
+    return conn.execute(
+        """
+        SELECT id, to_email, subject, body, attempts, expires_at
+        FROM email_outbox
+        WHERE claim = ? AND status = 'sending'
+        ORDER BY id
+        """,
+        (claim,),
+    ).fetchall()
+
+
+def process_outbox(transport=None, batch_size=OUTBOX_BATCH_SIZE):
+    # Sends one batch; returns the number of rows handled.
+    transport = transport or get_email_transport()
+    conn = get_db_connection()
+    try:
+        rows = _claim_outbox_batch(conn, batch_size)
+        for row in rows:
+            now = datetime.utcnow()
+            expires_at = _parse_db_datetime(row["expires_at"])
+            if expires_at and expires_at < now:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'dead', last_error = ?, body = '' WHERE id = ?",
+                    ("expired before delivery", row["id"]),
+                )
+                conn.commit()
+                continue
+            try:
+                transport.send(row["to_email"], row["subject"], row["body"])
+            except Exception as exc:
+                attempts = row["attempts"] + 1
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE email_outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, str(exc)[:500], row["id"]),
+                    )
+                else:
+                    retry_at = now + timedelta(seconds=_outbox_backoff(attempts))
+                    conn.execute(
+                        """
+                        UPDATE email_outbox
+                        SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?
+                        WHERE id = ?
+                        """,
+                        (attempts, str(exc)[:500], _to_db_datetime(retry_at), row["id"]),
+                    )
+            else:
+                # The body holds a live reset link; drop it once delivered.
+                conn.execute(
+                    """
+                    UPDATE email_outbox
+                    SET status = 'sent', attempts = attempts + 1, sent_at = ?, body = ''
+                    WHERE id = ?
+                    """,
+                    (_to_db_datetime(now), row["id"]),
+                )
+            conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
+
+class OutboxWorker:
+    # Daemon thread per process, started when the process begins serving
+    # (not in a preloading gunicorn master: threads do not survive fork).
+    # It drains right away, so rows left pending by a restart go out without
+    # waiting for a new enqueue; wake() skips the poll wait after one.
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        if OUTBOX_WORKER != "thread":
+            return
+        self.start()
+        self._event.set()
+
+    def start(self):
+        if OUTBOX_WORKER != "thread":
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(
+                    target=self._run, name="email-outbox", daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        transport = get_email_transport()
+        while True:
+            try:
+                while process_outbox(transport) == OUTBOX_BATCH_SIZE:
+                    pass
+            except Exception as exc:
+                print(f"[Email Outbox] Worker error: {exc}")
+            self._event.wait(self.poll_interval)
+            self._event.clear()
+
+
+outbox_worker = OutboxWorker(OUTBOX_POLL_INTERVAL)
+
+
+@bp.before_app_request
+def start_outbox_worker():
+    # Only the first request in each process starts anything; gunicorn
+    # workers already did in post_worker_init (gunicorn.conf.py).
+    outbox_worker.start()
+
+
+@bp.cli.command("outbox-worker")
+@click.option("--once", is_flag=True, help="Drain due messages and exit.")
+def outbox_worker_command(once):
+    """Deliver queued emails from email_outbox."""
+    transport = get_email_transport()
+    while True:
+        handled = process_outbox(transport)
+        if once and handled < OUTBOX_BATCH_SIZE:
+            break
+        if handled < OUTBOX_BATCH_SIZE:
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+# -----------------------------
+# Authentication
+# -----------------------------
+@route("/register", methods=["GET", "POST"])
+def register():
+    if session.get("user_id"):
+        return redirect(url_for("dashboard"))
+
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        email = request.form.get("email", "").strip().lower()
+        password = request.form.get("password", "")
+
+        if not name or not email or not password:
+            flash("All fields are required.", "warning")
+            return render_template("register.html", name=name, email=email)
+
+        try:
+            password_hash = _hash_password(password)
+        except HashingOverloaded:
+            return _busy_response("register.html", name=name, email=email)
+
+        conn = get_db_connection()
+        try:
+            if DB_TYPE == "postgres":
+                cursor = conn.execute(
+                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?) RETURNING id",
+                    (name, email, password_hash),
+                )
+                user_id = cursor.fetchone()["id"]
+            else:
+                cursor = conn.execute(
+                    "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                    (name, email, password_hash),
+                )
+                user_id = cursor.lastrowid
+            conn.commit()
+        except INTEGRITY_ERRORS:
+            conn.close()
+            flash("An account with that email already exists.", "danger")
+            return render_template("register.html", name=name, email=email)
+
+        session.permanent = True
+        session["user_id"] = user_id
+        session["user_name"] = name
+        session["user_email"] = email
+        conn.close()
+        return redirect(url_for("dashboard"))
+
+    return render_template("register.html")
+
+
+@route("/login", methods=["GET", "POST"])
+def login():
+    if session.get("user_id"):
+        return redirect(url_for("dashboard"))
+
+    if request.method == "POST":
+        email = request.form.get("email", "").strip().lower()
+        password = request.form.get("password", "")
+
+        if not email or not password:
+            flash("Email and password are required.", "warning")
+            return render_template("login.html", email=email)
+
+        retry_after = rate_limiter.check(
+            ("login_ip", client_ip()), ("login_email", email)
+        )
+        if retry_after:
+            return _rate_limited_response("login.html", retry_after, email=email)
+
+        conn = get_db_connection()
+        user = conn.execute(
+            "SELECT id, name, email, password FROM users WHERE email = ?",
+            (email,),
+        ).fetchone()
+        conn.close()
+
+        try:
+            valid = bool(user) and _verify_password(user["password"], password)
+        except HashingOverloaded:
+            return _busy_response("login.html", email=email)
+
+        if not valid:
+            flash("Invalid email or password.", "danger")
+            return render_template("login.html", email=email)
+
+        if _needs_rehash(user["password"]):
+            _rehash_in_background(user["id"], user["password"], password)
+
+        session.permanent = True
+        session["user_id"] = user["id"]
+        session["user_name"] = user["name"]
+        session["user_email"] = user["email"]
+        return redirect(url_for("dashboard"))
+
+    return render_template("login.html")
+
+
+@route("/logout")
+def logout():
+    session.clear()
+    return redirect(url_for("login"))
+
+
+# -----------------------------
+# Password reset
+# -----------------------------
+@route("/forgot-password", methods=["GET", "POST"])
+def forgot_password():
+    if session.get("user_id"):
+        return redirect(url_for("dashboard"))
+
+    if request.method == "POST":
+        email = request.form.get("email", "").strip().lower()
+        if not email:
+            flash("Please enter your email.", "warning")
+            return render_template("forgot_password.html", email=email)
+
+        retry_after = rate_limiter.check(
+            ("reset_ip", client_ip()), ("reset_email", email)
+        )
+        if retry_after:
+            return _rate_limited_response(
+                "forgot_password.html", retry_after, email=email
+            )
+
+        conn = get_db_connection()
+        user = conn.execute(
+            "SELECT id, email FROM users WHERE email = ?",
+            (email,),
+        ).fetchone()
+        conn.close()
+
+        # Always show the same message to avoid leaking user existence.
+        if user:
+            token = secrets.token_urlsafe(32)
+            token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+            now = datetime.utcnow()
+            expires_at = now + timedelta(minutes=15)
+            reset_link = url_for(
+                "reset_password",
+                token=token,
+                _external=True,
+            )
+            # The email is queued with the token; delivery happens off-request.
+            _store_reset_token(
+                user["id"],
+                token_hash,
+                expires_at,
+                now,
+                email=_reset_email(user["email"], reset_link),
+            )
+
+        flash("If that email exists, a reset link has been sent.", "success")
+        return render_template("forgot_password.html", email=email)
+
+    return render_template("forgot_password.html")
+
+
+@route("/reset-password/<token>", methods=["GET", "POST"])
+def reset_password(token):
+    if session.get("user_id"):
+        return redirect(url_for("dashboard"))
+
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    token_row = _get_reset_token(token_hash)
+
+    if not token_row:
+        flash("Invalid or expired reset link.", "danger")
+        return render_template("reset_password.html", token=token)
+
+    expires_at = _parse_db_datetime(token_row["expires_at"])
+    used_at = _parse_db_datetime(token_row["used_at"])
+    if used_at or (expires_at and expires_at < datetime.utcnow()):
+        flash("This reset link has expired. Please request a new one.", "danger")
+        return render_template("reset_password.html", token=token)
+
+    if request.method == "POST":
+        password = request.form.get("password", "")
+        confirm_password = request.form.get("confirm_password", "")
+
+        if not password or not confirm_password:
+            flash("Please fill in both password fields.", "warning")
+            return render_template("reset_password.html", token=token)
+
+        if password != confirm_password:
+            flash("Passwords do not match.", "danger")
+            return render_template("reset_password.html", token=token)
+
+        try:
+            password_hash = _hash_password(password)
+        except HashingOverloaded:
+            return _busy_response("reset_password.html", token=token)
+
+        conn = get_db_connection()
+        conn.execute(
+            "UPDATE users SET password = ? WHERE id = ?",
+            (password_hash, token_row["user_id"]),
+        )
+        conn.commit()
+        conn.close()
+
+        _mark_token_used(token_row["id"], datetime.utcnow())
+
+        flash("Password reset successful. Please log in.", "success")
+        return redirect(url_for("login"))
+
+    return render_template("reset_password.html", token=token)
+
+
+# -----------------------------
+# Public Home
+# -----------------------------
+@route("/home")
+def home():
+    if session.get("user_id"):
+        return redirect(url_for("dashboard"))
+    return render_template("home.html")
+
+
+# -----------------------------
+# Add Expense
+# -----------------------------
+@route("/", methods=["GET", "POST"])
+@login_required
+def add_expense():
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+
+    categories = get_categories(conn)
+
+    if request.method == "POST":
+        date = request.form.get("date")
+        item = request.form.get("item")
+        category_id = request.form.get("category_id")
+        amount = request.form.get("amount")
+
+        conn.execute(
+            """
+            INSERT INTO expenses (date, item, category_id, amount, user_id)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (date, item, category_id, amount, user_id),
+        )
+        refresh_rollup_groups(conn, user_id, [(date, category_id)])
+        bump_data_version(conn, user_id)
+        conn.commit()
+        conn.close()
+        return redirect(url_for("add_expense"))
+
+    conn.close()
+    return render_template("add_expense.html", categories=categories)
+
+
+# -----------------------------
+# Helper: build filter clause
+# -----------------------------
+FILTER_DAYS = {"week": 7, "month": 30, "year": 365}
+
+
+def month_sql():
+    # "YYYY-MM" bucket of expenses.date. Both forms are cheap per-row
+    # expressions evaluated after the index range scan on (user_id, date).
+    if DB_TYPE == "postgres":
+        return "to_char(expenses.date, 'YYYY-MM')"
+    return "substr(expenses.date,1,7)"
+
+
+def build_expense_filters(
+    user_id, filter_type, from_date, to_date, category_id=None, search=None
+):
+    # A search on SQLite is driven from the FTS match, which is already
+    # limited to the user: the unary "+" keeps the planner off the user and
+    # category indexes, which would walk every one of the user's rows.
+    indexed = "+" if search and DB_TYPE != "postgres" else ""
+    conditions = [f"{indexed}expenses.user_id = ?"]
+    params = [user_id]
+
+    if filter_type in FILTER_DAYS:
+        # Lower bound computed here (UTC, like SQLite's date('now')) so both
+        # backends get a plain range predicate on the indexed date column.
+        since = datetime.utcnow().date() - timedelta(days=FILTER_DAYS[filter_type])
+        conditions.append("expenses.date >= ?")
+        params.append(since.isoformat())
+    elif from_date and to_date:
+        conditions.append("expenses.date BETWEEN ? AND ?")
+        params.extend([from_date, to_date])
+
+    if category_id:
+        conditions.append(f"{indexed}expenses.category_id = ?")
+        params.append(category_id)
+    if search:
+        condition, search_params = search_condition(user_id, search)
+        conditions.append(condition)
+        params.extend(search_params)
+
+    where_clause = "WHERE " + " AND ".join(conditions)
+    return where_clause, params, " AND ".join(conditions)
+
+
+# -----------------------------
+# Expense search
+# -----------------------------
+# Full-text search over expenses.item, indexed by migration 9 (FTS5 on
+# SQLite, a tsvector column with a GIN index on Postgres). Every search word
+# must match the start of a word in the item: "cof tax" finds "Taxi to the
+# coffee shop".
+#
+# Results are ranked by how many search words match a whole word, then
+# shorter items, then newest. Not FTS5's bm25(): it reads every match in the
+# whole table to weigh the words, and since each result contains all of them
+# it would only end up preferring shorter items anyway.
+SEARCH_MAX_TERMS = 8
+SEARCH_TERM_RE = re.compile(r"[^\W_]+")
+
+
+def search_terms(text):
+    return [term.lower() for term in SEARCH_TERM_RE.findall(text or "")][:SEARCH_MAX_TERMS]
+
+
+def search_condition(user_id, terms, prefix=True):
+    # (condition, params) matching the user's expenses that contain every
+    # term, as a word prefix or (prefix=False) as a whole word. Terms are
+    # only letters and digits, so they are quoted into the query as they are.
+    if DB_TYPE == "postgres":
+        query = " & ".join(
+            f"'{int(user_id)}:{term}'" + (":*" if prefix else "") for term in terms
+        )
+        return "expenses.item_tsv @@ ?::tsquery", [query]
+    words = " ".join(f'"{term}"' + ("*" if prefix else "") for term in terms)
+    query = f'user_id : "{int(user_id)}" AND item : ({words})'
+    return "expenses.id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)", [query]
+
+
+def search_rank(user_id, terms):
+    # (expression, params): number of terms matching a whole word.
+    parts = []
+    params = []
+    for term in terms:
+        condition, term_params = search_condition(user_id, [term], prefix=False)
+        parts.append(f"CASE WHEN {condition} THEN 1 ELSE 0 END")
+        params.extend(term_params)
+    return " + ".join(parts), params
+
+
+# -----------------------------
+# Data versions
+# -----------------------------
+# users.data_version changes with every write to a user's expenses and
+# catalog_versions['categories'] with every category insert/delete. Both are
+# bumped inside the writing transaction; caches key on them, so a cached
+# value can never outlive the data it was computed from. The matching
+# *modified_at columns feed Last-Modified on the HTML views.
+def bump_data_version(conn, user_id):
+    conn.execute(
+        "UPDATE users SET data_version = data_version + 1, data_modified_at = ? WHERE id = ?",
+        (int(time.time()), user_id),
+    )
+
+
+def bump_catalog_version(conn, name):
+    conn.execute(
+        "UPDATE catalog_versions SET version = version + 1, modified_at = ? WHERE name = ?",
+        (int(time.time()), name),
+    )
+
+
+def get_data_state(conn, user_id):
+    # ((data_version, categories_version), modified_at) in one query.
+    row = conn.execute(
+        """
+        SELECT
+            users.data_version AS data_version,
+            users.data_modified_at AS data_modified_at,
+            catalog_versions.version AS categories_version,
+            catalog_versions.modified_at AS categories_modified_at
+        FROM users
+        LEFT JOIN catalog_versions ON catalog_versions.name = 'categories'
+        WHERE users.id = ?
+        """,
+        (user_id,),
+    ).fetchone()
+    if not row:
+        return (0, 0), 0
+    versions = (row["data_version"], row["categories_version"] or 0)
+    modified_at = max(row["data_modified_at"], row["categories_modified_at"] or 0)
+    return versions, modified_at
+
+
+def get_data_versions(conn, user_id):
+    return get_data_state(conn, user_id)[0]
+
+
+# -----------------------------
+# Conditional responses
+# -----------------------------
+# Authenticated views are validated against the user's data state: the ETag
+# hashes the data versions with everything else the page depends on and
+# Last-Modified is the latest write (or the start of the day, since date
+# filters roll over). A matching revalidation is answered with 304 before
+# any aggregation runs. Cache-Control is private so shared caches never
+# store these pages.
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+_templates_stamp = None
+
+
+def templates_stamp():
+    # (digest, mtime) of the templates and the asset manifest, so a deploy
+    # invalidates cached pages.
+    global _templates_stamp
+    if _templates_stamp is None:
+        digest = hashlib.sha1()
+        mtime = 0
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            with open(path, "rb") as f:
+                digest.update(name.encode("utf-8") + b"\0" + f.read())
+            mtime = max(mtime, int(os.path.getmtime(path)))
+        digest.update(json.dumps(asset_manifest(), sort_keys=True).encode("utf-8"))
+        _templates_stamp = (digest.hexdigest()[:12], mtime)
+    return _templates_stamp
+
+
+def make_etag(*parts):
+    raw = json.dumps(parts, default=str).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _day_start():
+    # Date filters use both the local and the UTC day; take the later rollover.
+    local = datetime.combine(datetime.now().date(), datetime.min.time()).timestamp()
+    utc = calendar.timegm(datetime.utcnow().date().timetuple())
+    return int(max(local, utc))
+
+
+def view_validators(view, state, *parts):
+    versions, modified_at = state
+    digest, built_at = templates_stamp()
+    etag = make_etag(
+        view,
+        session.get("user_id"),
+        session.get("user_name"),
+        versions,
+        digest,
+        datetime.now().date(),
+        datetime.utcnow().date(),
+        *parts,
+    )
+    last_modified = datetime.utcfromtimestamp(max(modified_at, built_at, _day_start()))
+    return etag, last_modified
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    # Pending flash messages are part of the page, so always render them.
+    if session.get("_flashes"):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def render_conditional(template, etag, last_modified, **context):
+    has_flashes = bool(session.get("_flashes"))
+    response = make_response(render_template(template, **context))
+    if has_flashes:
+        response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+        return response
+    return with_validators(response, etag, last_modified)
+
+
+# -----------------------------
+# Monthly rollup
+# -----------------------------
+# expense_rollup holds SUM/COUNT/MAX per (user_id, month, category_id). Write
+# routes refresh the groups they touch inside their own transaction, so the
+# rollup commits (or rolls back) together with the expense rows.
+def _rollup_category_key(category_id):
+    if category_id in (None, ""):
+        return 0
+    return int(category_id)
+
+
+def _rollup_month(date_value):
+    return str(date_value)[:7]
+
+
+def refresh_rollup(conn, user_id=None, month=None, category_ids=None):
+    rollup_conditions = []
+    rollup_params = []
+    expense_conditions = []
+    expense_params = []
+
+    if user_id is not None:
+        rollup_conditions.append("user_id = ?")
+        rollup_params.append(user_id)
+        expense_conditions.append("expenses.user_id = ?")
+        expense_params.append(user_id)
+    if month is not None:
+        rollup_conditions.append("month = ?")
+        rollup_params.append(month)
+        expense_conditions.append("expenses.date >= ? AND expenses.date < ?")
+        expense_params.extend(_month_bounds(month))
+    if category_ids is not None:
+        keys = sorted({_rollup_category_key(c) for c in category_ids})
+        placeholders = ", ".join("?" for _ in keys)
+        rollup_conditions.append(f"category_id IN ({placeholders})")
+        rollup_params.extend(keys)
+        ids = [key for key in keys if key != 0]
+        category_conditions = []
+        if ids:
+            placeholders = ", ".join("?" for _ in ids)
+            category_conditions.append(f"expenses.category_id IN ({placeholders})")
+            expense_params.extend(ids)
+        if 0 in keys:
+            category_conditions.append("expenses.category_id IS NULL")
+        expense_conditions.append("(" + " OR ".join(category_conditions) + ")")
+
+    rollup_where = ""
+    if rollup_conditions:
+        rollup_where = "WHERE " + " AND ".join(rollup_conditions)
+    expense_where = "WHERE expenses.user_id IS NOT NULL"
+    if expense_conditions:
+        expense_where += " AND " + " AND ".join(expense_conditions)
+
+    month = month_sql()
+    conn.execute(f"DELETE FROM expense_rollup {rollup_where}", rollup_params)
+    conn.execute(
+        f"""
+        INSERT INTO expense_rollup (user_id, month, category_id, total, count, max_amount)
+        SELECT
+            expenses.user_id,
+            {month},
+            COALESCE(expenses.category_id, 0),
+            SUM(expenses.amount),
+            COUNT(*),
+            MAX(expenses.amount)
+        FROM expenses
+        {expense_where}
+        GROUP BY expenses.user_id, {month}, COALESCE(expenses.category_id, 0)
+        """,
+        expense_params,
+    )
+
+
+def refresh_rollup_groups(conn, user_id, groups):
+    # groups: (date, category_id) pairs touched by a write.
+    seen = set()
+    for date_value, category_id in groups:
+        key = (_rollup_month(date_value), _rollup_category_key(category_id))
+        if key in seen:
+            continue
+        seen.add(key)
+        refresh_rollup(conn, user_id, month=key[0], category_ids=[key[1]])
+
+
+def add_to_rollup(conn, user_id, rows):
+    # Insert-only fast path (bulk import): fold new (date, category_id, amount)
+    # rows into their groups arithmetically instead of re-aggregating them.
+    groups = {}
+    for date_value, category_id, amount in rows:
+        key = (_rollup_month(date_value), _rollup_category_key(category_id))
+        total, count, max_amount = groups.get(key, (0, 0, amount))
+        groups[key] = (total + amount, count + 1, max(max_amount, amount))
+    greatest = "GREATEST" if conn.db_type == "postgres" else "MAX"
+    conn.executemany(
+        f"""
+        INSERT INTO expense_rollup (user_id, month, category_id, total, count, max_amount)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, month, category_id) DO UPDATE SET
+            total = expense_rollup.total + excluded.total,
+            count = expense_rollup.count + excluded.count,
+            max_amount = {greatest}(expense_rollup.max_amount, excluded.max_amount)
+        """,
+        [
+            (user_id, month, category_id, total, count, max_amount)
+            for (month, category_id), (total, count, max_amount) in groups.items()
+        ],
+    )
+
+
+def verify_rollup(conn):
+    # Returns the (user_id, month, category_id) keys whose rollup row is
+    # missing, stale or orphaned compared to the raw expenses.
+    expected = {}
+    month = month_sql()
+    for row in conn.execute(f"""
+        SELECT
+            expenses.user_id AS user_id,
+            {month} AS month,
+            COALESCE(expenses.category_id, 0) AS category_id,
+            SUM(expenses.amount) AS total,
+            COUNT(*) AS count,
+            MAX(expenses.amount) AS max_amount
+        FROM expenses
+        WHERE expenses.user_id IS NOT NULL
+        GROUP BY expenses.user_id, {month}, COALESCE(expenses.category_id, 0)
+    """).fetchall():
+        expected[(row["user_id"], row["month"], row["category_id"])] = (
+            row["total"],
+            row["count"],
+            row["max_amount"],
+        )
+    actual = {}
+    for row in conn.execute(
+        "SELECT user_id, month, category_id, total, count, max_amount FROM expense_rollup"
+    ).fetchall():
+        actual[(row["user_id"], row["month"], row["category_id"])] = (
+            row["total"],
+            row["count"],
+            row["max_amount"],
+        )
+
+    drift = []
+    for key in set(expected) | set(actual):
+        want = expected.get(key)
+        have = actual.get(key)
+        if want is None or have is None:
+            drift.append(key)
+        elif (
+            want[1] != have[1]
+            or abs(want[0] - have[0]) > 0.005
+            or abs(want[2] - have[2]) > 0.005
+        ):
+            drift.append(key)
+    return sorted(drift, key=str)
+
+
+@bp.cli.command("rollup-verify")
+@click.option("--repair", is_flag=True, help="Rebuild the drifted groups.")
+def rollup_verify_command(repair):
+    """Compare expense_rollup against the raw expenses."""
+    conn = get_db_connection()
+    drift = verify_rollup(conn)
+    for user_id, month, category_id in drift:
+        click.echo(f"drift: user={user_id} month={month} category={category_id}")
+    if drift and repair:
+        for user_id, month, category_id in drift:
+            refresh_rollup(conn, user_id, month=month, category_ids=[category_id])
+        conn.commit()
+        click.echo(f"Repaired {len(drift)} rollup group(s).")
+    elif not drift:
+        click.echo("Rollup is consistent.")
+    conn.close()
+    if drift and not repair:
+        raise SystemExit(1)
+
+
+@bp.cli.command("rollup-rebuild")
+def rollup_rebuild_command():
+    """Rebuild expense_rollup from scratch."""
+    conn = get_db_connection()
+    refresh_rollup(conn)
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) AS c FROM expense_rollup").fetchone()["c"]
+    conn.close()
+    click.echo(f"Rebuilt {count} rollup group(s).")
+
+
+# -----------------------------
+# Dashboard aggregation
+# -----------------------------
+def _month_bounds(month):
+    # "YYYY-MM" -> (inclusive, exclusive) date bounds, usable by the
+    # (user_id, date) index instead of grouping every row by month.
+    year, mon = int(month[:4]), int(month[5:7])
+    if mon == 12:
+        return f"{month}-01", f"{year + 1}-01-01"
+    return f"{month}-01", f"{year}-{mon + 1:02d}-01"
+
+
+def _is_unfiltered(filter_type, from_date, to_date):
+    # Mirrors build_expense_filters: no date condition beyond the user.
+    return filter_type not in ("week", "month", "year") and not (
+        from_date and to_date
+    )
+
+
+def dashboard_queries(user_id, filter_type, from_date, to_date):
+    # [(kind, query, params)], all independent of each other: the pass 1
+    # groups followed by the row-level parts of pass 2.
+    where_clause, params, _ = build_expense_filters(
+        user_id, filter_type, from_date, to_date
+    )
+
+    # Pass 1: one GROUP BY (month, category) over the filtered set. Every
+    # total, top/highest card and chart series is reduced from these rows.
+    # Without a date filter the monthly rollup already has exactly these
+    # groups, so read it instead of the user's whole expense history.
+    if _is_unfiltered(filter_type, from_date, to_date):
+        groups = (
+            """
+            SELECT
+                month,
+                NULLIF(category_id, 0) AS category_id,
+                total,
+                count,
+                max_amount
+            FROM expense_rollup
+            WHERE user_id = ?
+            """,
+            [user_id],
+        )
+    else:
+        groups = (
+            f"""
+            SELECT
+                {month_sql()} AS month,
+                expenses.category_id AS category_id,
+                SUM(expenses.amount) AS total,
+                COUNT(*) AS count,
+                MAX(expenses.amount) AS max_amount
+            FROM expenses
+            {where_clause}
+            GROUP BY {month_sql()}, expenses.category_id
+            """,
+            params,
+        )
+
+    # Pass 2: the row-level cards plus the overall this/last month totals
+    # (straight from the rollup). The NULL columns are typed so the parts
+    # can be combined with UNION ALL on Postgres.
+    current_month = datetime.now().strftime("%Y-%m")
+    last_month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime(
+        "%Y-%m"
+    )
+    month_total = """
+        SELECT '{kind}' AS kind, CAST(NULL AS DATE) AS date,
+               CAST(NULL AS TEXT) AS item, CAST(NULL AS INTEGER) AS category_id,
+               SUM(total) AS amount
+        FROM expense_rollup
+        WHERE user_id = ? AND month = ?
+        """
+    return [
+        ("groups", *groups),
+        (
+            "recent",
+            f"""
+            SELECT 'recent' AS kind, expenses.date, expenses.item,
+                   expenses.category_id, expenses.amount
+            FROM expenses
+            {where_clause}
+            ORDER BY expenses.date DESC
+            LIMIT 5
+            """,
+            params,
+        ),
+        (
+            "highest",
+            f"""
+            SELECT 'highest' AS kind, expenses.date, expenses.item,
+                   CAST(NULL AS INTEGER) AS category_id, expenses.amount
+            FROM expenses
+            {where_clause}
+            ORDER BY expenses.amount DESC
+            LIMIT 1
+            """,
+            params,
+        ),
+        ("this_month", month_total.format(kind="this_month"), [user_id, current_month]),
+        ("last_month", month_total.format(kind="last_month"), [user_id, last_month]),
+    ]
+
+
+# The dashboard page renders the cards and summary itself and loads the
+# chart series from /api/v1/dashboard?part=charts, so neither request builds
+# the other's half: the charts need only the pass 1 groups.
+DASHBOARD_SECTIONS = ("cards", "charts")
+
+
+def build_dashboard_context(
+    conn,
+    user_id,
+    filter_type,
+    from_date,
+    to_date,
+    categories_version=None,
+    sections=DASHBOARD_SECTIONS,
+):
+    parts = dashboard_queries(user_id, filter_type, from_date, to_date)
+    if "cards" not in sections:
+        parts = parts[:1]
+    if asgi_loop() is not None:
+        # Served through asgi_app: every part runs concurrently on the event
+        # loop, each on its own connection.
+        results = run_on_asgi_loop(fetch_all_async(parts, current_request_stats()))
+        groups = results[0]
+        rows = [row for part in results[1:] for row in part]
+    else:
+        # One round trip for the groups, one UNION ALL for everything else.
+        groups = conn.execute(parts[0][1], parts[0][2]).fetchall()
+        rows = []
+        if len(parts) > 1:
+            rows = conn.execute(
+                " UNION ALL ".join(
+                    f"SELECT * FROM ({query}) {kind}" for kind, query, _ in parts[1:]
+                ),
+                [value for _, _, params in parts[1:] for value in params],
+            ).fetchall()
+
+    # Category names come from the process-wide catalog instead of a join.
+    category_names = category_catalog.names(
+        conn, [row["category_id"] for row in rows if row["kind"] == "recent"]
+    )
+
+    # -------- Reduce pass 1 in Python --------
+    filtered_total = 0
+    category_totals = {}
+    month_totals = {}
+    category_month_totals = {}
+    for row in groups:
+        total = row["total"] or 0
+        filtered_total += total
+        month_totals[row["month"]] = month_totals.get(row["month"], 0) + total
+        name = category_names.get(row["category_id"])
+        if name is None:
+            # Uncategorized rows only count towards the overall totals.
+            continue
+        category_totals[name] = category_totals.get(name, 0) + total
+        month_map = category_month_totals.setdefault(name, {})
+        month_map[row["month"]] = month_map.get(row["month"], 0) + total
+
+    recent_expenses = []
+    highest_expense = None
+    this_month_total = 0
+    last_month_total = 0
+    for row in rows:
+        if row["kind"] == "recent":
+            recent_expenses.append(
+                {
+                    "date": str(row["date"]),
+                    "item": row["item"],
+                    "category": category_names.get(row["category_id"]),
+                    "amount": row["amount"],
+                }
+            )
+        elif row["kind"] == "highest":
+            highest_expense = row
+        elif row["kind"] == "this_month":
+            this_month_total = row["amount"] or 0
+        elif row["kind"] == "last_month":
+            last_month_total = row["amount"] or 0
+
+    context = {}
+    if "cards" in sections:
+        context.update(
+            _dashboard_cards(
+                filter_type,
+                from_date,
+                to_date,
+                filtered_total,
+                category_totals,
+                month_totals,
+                recent_expenses,
+                highest_expense,
+                this_month_total,
+                last_month_total,
+            )
+        )
+    if "charts" in sections:
+        context.update(
+            _dashboard_charts(
+                get_categories(conn, categories_version),
+                category_totals,
+                month_totals,
+                category_month_totals,
+            )
+        )
+    return context
+
+
+def _dashboard_cards(
+    filter_type,
+    from_date,
+    to_date,
+    filtered_total,
+    category_totals,
+    month_totals,
+    recent_expenses,
+    highest_expense,
+    this_month_total,
+    last_month_total,
+):
+    # -------- CARDS SHOULD RESPECT FILTER (A) --------
+    # For filtered average daily spend, calculate days_spanned for date range
+    if filter_type not in FILTER_DAYS and from_date and to_date:
+        # custom from/to range
+        start = datetime.strptime(from_date, "%Y-%m-%d")
+        end = datetime.strptime(to_date, "%Y-%m-%d")
+        days_spanned = (end - start).days + 1
+    elif filter_type == "week":
+        days_spanned = 7
+    elif filter_type == "month":
+        days_spanned = 30
+    elif filter_type == "year":
+        days_spanned = 365
+    else:
+        # no filter -> current month stats
+        days_spanned = datetime.now().day
+
+    avg_daily = round(filtered_total / days_spanned, 2) if days_spanned else 0
+
+    # This month vs last month are still overall (if you want even this filtered,
+    # you can also adjust; yahan maine cards ke liye filtered_total + avg ko use kiya)
+    # Percentage change based on overall months
+    if last_month_total > 0:
+        change_percent = round(
+            ((this_month_total - last_month_total) / last_month_total) * 100, 1
+        )
+    else:
+        change_percent = 0
+
+    trend = "up" if change_percent > 0 else "down"
+    trend_color = "red" if change_percent > 0 else "green"
+
+    # Top spending category in filtered data (A)
+    if category_totals:
+        top_category_name = max(category_totals, key=category_totals.get)
+        top_category_amount = category_totals[top_category_name]
+    else:
+        top_category_name = "N/A"
+        top_category_amount = 0
+
+    # Auto dashboard summary (based on overall month trend)
+    if trend == "up":
+        summary_text = (
+            f"Your expenses increased compared to last month, mainly due to {top_category_name} category."
+        )
+    else:
+        summary_text = (
+            "Your expenses decreased compared to last month, showing better spending control."
+        )
+
+    # Highest single expense (filtered)
+    highest_item = highest_expense["item"] if highest_expense else "N/A"
+    highest_amount = highest_expense["amount"] if highest_expense else 0
+
+    # Spending trend message
+    trend_message = (
+        "Your spending increased this month"
+        if trend == "up"
+        else "Your spending decreased this month"
+    )
+
+    # Highest spending month (within filtered data)
+    if month_totals:
+        highest_month = max(month_totals, key=month_totals.get)
+        highest_month_amount = month_totals[highest_month]
+    else:
+        highest_month = "N/A"
+        highest_month_amount = 0
+
+    return {
+        # Cards (filtered)
+        "this_month": filtered_total,  # filtered total instead of raw current month
+        "last_month": last_month_total,  # still based on real last month
+        "avg_daily": avg_daily,
+        "change_percent": abs(change_percent),
+        "trend": trend,
+        "trend_color": trend_color,
+        "top_category_name": top_category_name,
+        "top_category_amount": top_category_amount,
+        # Highest expense (filtered)
+        "highest_item": highest_item,
+        "highest_amount": highest_amount,
+        # Trend & summary
+        "trend_message": trend_message,
+        "summary_text": summary_text,
+        "highest_month": highest_month,
+        "highest_month_amount": highest_month_amount,
+        # Filtered stats
+        "filtered_total": filtered_total,
+        # Recent expenses (filtered)
+        "recent_expenses": recent_expenses,
+    }
+
+
+def _dashboard_charts(
+    categories, category_totals, month_totals, category_month_totals
+):
+    # Category totals respecting filter (A), every category in name order
+    labels = [row["name"] for row in categories]
+    values = [category_totals.get(name, 0) for name in labels]
+
+    # Monthly expense trend respecting filter (B)
+    months = sorted(month_totals)
+    monthly_totals = [month_totals[m] for m in months]
+
+    # Category-wise monthly trend respecting filter (B), categories in the
+    # order they first appear month by month
+    category_order = sorted(
+        category_month_totals,
+        key=lambda name: (min(category_month_totals[name]), name),
+    )
+    category_datasets = []
+    for category in category_order:
+        month_data = category_month_totals[category]
+        category_datasets.append(
+            {
+                "label": category,
+                "data": [month_data.get(m, 0) for m in months],
+            }
+        )
+
+    return {
+        # Category data (filtered)
+        "labels": labels,
+        "values": values,
+        # Monthly trend (filtered)
+        "months": months,
+        "monthly_totals": monthly_totals,
+        # Category-wise monthly datasets (filtered)
+        "category_month_labels": months,
+        "category_datasets": category_datasets,
+    }
+
+
+# -----------------------------
+# Dashboard cache
+# -----------------------------
+DASHBOARD_CACHE_BACKEND = os.getenv("DASHBOARD_CACHE", "memory")
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "512"))
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+DASHBOARD_CACHE_PATH = os.getenv("DASHBOARD_CACHE_PATH", "dashboard_cache.db")
+
+
+class MemoryCache:
+    # Per-process LRU with a TTL.
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SQLiteCache:
+    # Shared by every gunicorn worker on the host through a local SQLite
+    # file. Values are stored as JSON; hit/miss counters are per process.
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_used ON cache (used_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            conn.execute(
+                """
+                DELETE FROM cache WHERE expires_at <= ? OR key IN (
+                    SELECT key FROM cache ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (now, self.max_entries),
+            )
+        except sqlite3.Error:
+            # The cache is an optimization; a locked/corrupt file must not
+            # break the page.
+            pass
+
+    def stats(self):
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class NullCache:
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def stats(self):
+        return {"backend": "off", "hits": 0, "misses": self.misses}
+
+
+_dashboard_cache = None
+
+
+def get_dashboard_cache():
+    global _dashboard_cache
+    if _dashboard_cache is None:
+        if DASHBOARD_CACHE_BACKEND == "sqlite":
+            _dashboard_cache = SQLiteCache(
+                DASHBOARD_CACHE_PATH, DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL
+            )
+        elif DASHBOARD_CACHE_BACKEND == "off":
+            _dashboard_cache = NullCache()
+        else:
+            _dashboard_cache = MemoryCache(DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL)
+    return _dashboard_cache
+
+
+def dashboard_cache_key(
+    user_id, versions, filter_type, from_date, to_date, sections=DASHBOARD_SECTIONS
+):
+    # The payload also depends on the current day (relative filter bounds,
+    # this/last month, days in the month so far), so the day is part of the
+    # key and entries for yesterday simply stop matching.
+    return json.dumps(
+        [
+            "dashboard",
+            user_id,
+            *versions,
+            list(sections),
+            filter_type,
+            from_date,
+            to_date,
+            datetime.now().date().isoformat(),
+            datetime.utcnow().date().isoformat(),
+        ]
+    )
+
+
+def get_dashboard_payload(
+    conn,
+    user_id,
+    versions,
+    filter_type,
+    from_date,
+    to_date,
+    sections=DASHBOARD_SECTIONS,
+):
+    cache = get_dashboard_cache()
+    key = dashboard_cache_key(
+        user_id, versions, filter_type, from_date, to_date, sections
+    )
+    context = cache.get(key)
+    if context is None:
+        context = build_dashboard_context(
+            conn, user_id, filter_type, from_date, to_date, versions[1], sections
+        )
+        cache.set(key, context)
+    return context
+
+
+def _filter_args(filter_type, from_date, to_date, category_id=None, query=None):
+    return {
+        key: value
+        for key, value in (
+            ("filter", filter_type),
+            ("from", from_date),
+            ("to", to_date),
+            ("category", category_id),
+            ("q", query),
+        )
+        if value
+    }
+
+
+# -----------------------------
+# Dashboard
+# -----------------------------
+@route("/dashboard")
+@login_required
+def dashboard():
+    # Filters
+    user_id = session.get("user_id")
+    filter_type = request.args.get("filter")
+    from_date = request.args.get("from")
+    to_date = request.args.get("to")
+
+    conn = get_db_connection()
+    state = get_data_state(conn, user_id)
+    etag, last_modified = view_validators(
+        "dashboard", state, filter_type, from_date, to_date
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        conn.close()
+        return cached
+    # Only the cards: the chart series come from the API after the page renders
+    context = get_dashboard_payload(
+        conn, user_id, state[0], filter_type, from_date, to_date, ("cards",)
+    )
+    conn.close()
+
+    return render_conditional(
+        "dashboard.html",
+        etag,
+        last_modified,
+        **context,
+        # keep filter values in template
+        filter_type=filter_type,
+        from_date=from_date,
+        to_date=to_date,
+        chart_args=_filter_args(filter_type, from_date, to_date),
+    )
+
+
+# -----------------------------
+# All Expenses
+# -----------------------------
+EXPENSE_PAGE_SIZES = (25, 50, 100)
+DEFAULT_EXPENSE_PAGE_SIZE = int(os.getenv("EXPENSE_PAGE_SIZE", "50"))
+
+
+def _encode_cursor(date_value, expense_id):
+    raw = json.dumps([str(date_value), expense_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        date_value, expense_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(date_value), int(expense_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_EXPENSE_PAGE_SIZE
+    return size if size in EXPENSE_PAGE_SIZES else DEFAULT_EXPENSE_PAGE_SIZE
+
+
+def _page_number(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _search_args():
+    # (category_id, query, terms) narrowing the expense list.
+    try:
+        category_id = int(request.args.get("category") or 0) or None
+    except ValueError:
+        category_id = None
+    query = (request.args.get("q") or "").strip()
+    return category_id, query, search_terms(query)
+
+
+def _expense_rows(conn, rows):
+    names = category_catalog.names(conn, [row["category_id"] for row in rows])
+    return [
+        {
+            "id": row["id"],
+            "date": row["date"],
+            "item": row["item"],
+            "category": names.get(row["category_id"]),
+            "amount": row["amount"],
+        }
+        for row in rows
+    ]
+
+
+def fetch_expense_page(conn, where_clause, params, page_size, after=None, before=None):
+    # Keyset pagination on (date, id): each page is an index range scan from
+    # the cursor, so deep pages cost the same as the first one.
+    cursor_condition = ""
+    cursor_params = []
+    order = "DESC"
+    if after:
+        cursor_condition = (
+            "AND expenses.date <= ? AND (expenses.date < ? OR expenses.id < ?)"
+        )
+        cursor_params = [after[0], after[0], after[1]]
+    elif before:
+        cursor_condition = (
+            "AND expenses.date >= ? AND (expenses.date > ? OR expenses.id > ?)"
+        )
+        cursor_params = [before[0], before[0], before[1]]
+        order = "ASC"
+
+    rows = conn.execute(
+        f"""
+        SELECT
+            expenses.id,
+            expenses.date,
+            expenses.item,
+            expenses.category_id,
+            expenses.amount
+        FROM expenses
+        {where_clause}
+        {cursor_condition}
+        ORDER BY expenses.date {order}, expenses.id {order}
+        LIMIT ?
+        """,
+        params + cursor_params + [page_size + 1],
+    ).fetchall()
+
+    has_more = len(rows) > page_size
+    rows = _expense_rows(conn, rows[:page_size])
+    if before:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(after), has_more
+
+    next_cursor = None
+    prev_cursor = None
+    if rows and has_next:
+        next_cursor = _encode_cursor(rows[-1]["date"], rows[-1]["id"])
+    if rows and has_prev:
+        prev_cursor = _encode_cursor(rows[0]["date"], rows[0]["id"])
+    return rows, next_cursor, prev_cursor
+
+
+def fetch_search_page(conn, user_id, where_clause, params, terms, page_size, page=1):
+    # Ranked (see "Expense search"), so paged by number: every page ranks all
+    # of the user's matches, which the index keeps small.
+    rank, rank_params = search_rank(user_id, terms)
+    rows = conn.execute(
+        f"""
+        SELECT
+            expenses.id,
+            expenses.date,
+            expenses.item,
+            expenses.category_id,
+            expenses.amount
+        FROM expenses
+        {where_clause}
+        ORDER BY {rank} DESC, LENGTH(expenses.item), expenses.date DESC, expenses.id DESC
+        LIMIT ? OFFSET ?
+        """,
+        params + rank_params + [page_size + 1, (page - 1) * page_size],
+    ).fetchall()
+    next_page = page + 1 if len(rows) > page_size else None
+    prev_page = page - 1 if page > 1 else None
+    return _expense_rows(conn, rows[:page_size]), next_page, prev_page
+
+
+def expense_totals(
+    conn, user_id, filter_type, from_date, to_date, where_clause, params, narrowed=False
+):
+    # Totals come from an aggregate (the rollup when unfiltered), never
+    # from the page rows. narrowed: where_clause also has a category or
+    # search condition.
+    if not narrowed and _is_unfiltered(filter_type, from_date, to_date):
+        totals = conn.execute(
+            "SELECT SUM(total) AS total, SUM(count) AS count FROM expense_rollup WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+    else:
+        totals = conn.execute(
+            f"SELECT SUM(expenses.amount) AS total, COUNT(*) AS count FROM expenses {where_clause}",
+            params,
+        ).fetchone()
+    return totals["total"] or 0, totals["count"] or 0
+
+
+@route("/expenses")
+@login_required
+def all_expenses():
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+
+    filter_type = request.args.get("filter")
+    from_date = request.args.get("from")
+    to_date = request.args.get("to")
+    category_id, query, terms = _search_args()
+    page_size = _page_size(request.args.get("size"))
+    page = _page_number(request.args.get("page"))
+    after = _decode_cursor(request.args.get("after"))
+    before = None if after else _decode_cursor(request.args.get("before"))
+
+    etag, last_modified = view_validators(
+        "expenses", get_data_state(conn, user_id), sorted(request.args.items())
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        conn.close()
+        return cached
+
+    where_clause, params, _ = build_expense_filters(
+        user_id, filter_type, from_date, to_date, category_id, terms
+    )
+
+    # Searches are ranked and paged by number; the plain list by cursor.
+    next_page = prev_page = next_cursor = prev_cursor = None
+    if terms:
+        expenses, next_page, prev_page = fetch_search_page(
+            conn, user_id, where_clause, params, terms, page_size, page
+        )
+    else:
+        expenses, next_cursor, prev_cursor = fetch_expense_page(
+            conn, where_clause, params, page_size, after=after, before=before
+        )
+
+    total, expense_count = expense_totals(
+        conn,
+        user_id,
+        filter_type,
+        from_date,
+        to_date,
+        where_clause,
+        params,
+        narrowed=bool(category_id or terms),
+    )
+    categories = get_categories(conn)
+    conn.close()
+
+    # Query args shared by the pager links (filters + page size).
+    page_args = _filter_args(filter_type, from_date, to_date, category_id, query)
+    if page_size != DEFAULT_EXPENSE_PAGE_SIZE:
+        page_args["size"] = page_size
+
+    return render_conditional(
+        "all_expenses.html",
+        etag,
+        last_modified,
+        expenses=expenses,
+        total=total,
+        expense_count=expense_count,
+        page_size=page_size,
+        page_sizes=EXPENSE_PAGE_SIZES,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        next_page=next_page,
+        prev_page=prev_page,
+        page_args=page_args,
+        search_args=_filter_args(None, None, None, category_id, query),
+        categories=categories,
+        category_id=category_id,
+        query=query,
+        filter_type=filter_type,
+        from_date=from_date,
+        to_date=to_date,
+    )
+
+
+# -----------------------------
+# Export Expenses
+# -----------------------------
+EXPORT_COLUMNS = ("date", "item", "category", "amount")
+EXPORT_BATCH_SIZE = 1000
+
+
+def _export_rows(user_id, filter_type, from_date, to_date, category_id=None, terms=None):
+    where_clause, params, _ = build_expense_filters(
+        user_id, filter_type, from_date, to_date, category_id, terms
+    )
+    conn = get_db_connection()
+    try:
+        yield from conn.stream(
+            f"""
+            SELECT
+                expenses.date,
+                expenses.item,
+                categories.name AS category,
+                expenses.amount
+            FROM expenses
+            LEFT JOIN categories ON expenses.category_id = categories.id
+            {where_clause}
+            ORDER BY expenses.date DESC, expenses.id DESC
+            """,
+            params,
+            batch_size=EXPORT_BATCH_SIZE,
+        )
+    finally:
+        conn.close()
+
+
+def _export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_ndjson(rows):
+    chunk = []
+    for row in rows:
+        record = {column: row[column] for column in EXPORT_COLUMNS}
+        record["date"] = str(record["date"])
+        chunk.append(json.dumps(record))
+        if len(chunk) == EXPORT_BATCH_SIZE:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+EXPORT_FORMATS = {
+    "csv": (_export_csv, "text/csv"),
+    "ndjson": (_export_ndjson, "application/x-ndjson"),
+}
+
+
+@route("/expenses/export.<fmt>")
+@login_required
+def export_expenses(fmt):
+    if fmt not in EXPORT_FORMATS:
+        flash("Unsupported export format.", "warning")
+        return redirect(url_for("all_expenses"))
+
+    user_id = session.get("user_id")
+    filter_type = request.args.get("filter")
+    from_date = request.args.get("from")
+    to_date = request.args.get("to")
+    category_id, _, terms = _search_args()
+
+    encode, mimetype = EXPORT_FORMATS[fmt]
+    rows = _export_rows(user_id, filter_type, from_date, to_date, category_id, terms)
+    filename = f"expenses-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(
+        stream_with_context(encode(rows)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+# -----------------------------
+# Import Expenses
+# -----------------------------
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_REPORTED_ERRORS = 200
+IMPORT_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def _parse_import_date(value):
+    value = (value or "").strip()
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        # Fast path for ISO dates; strptime dominates import time otherwise.
+        try:
+            return date_type.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date '{value}'")
+
+
+def _parse_import_amount(value):
+    cleaned = (value or "").replace(",", "").replace("\u20b9", "").strip()
+    try:
+        amount = float(cleaned)
+    except ValueError:
+        raise ValueError(f"invalid amount '{value}'")
+    if not amount > 0 or amount == float("inf"):
+        raise ValueError(f"amount must be positive, got '{value}'")
+    return round(amount, 2)
+
+
+def _resolve_import_categories(conn, names):
+    # One lookup per batch; unknown names are created together.
+    names = sorted(names)
+    if not names:
+        return {}, False
+    placeholders = ", ".join("?" for _ in names)
+    query = f"SELECT id, name FROM categories WHERE name IN ({placeholders})"
+    found = {row["name"]: row["id"] for row in conn.execute(query, names).fetchall()}
+    missing = [name for name in names if name not in found]
+    if missing:
+        conn.executemany(
+            "INSERT INTO categories (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+            [(name,) for name in missing],
+        )
+        bump_catalog_version(conn, "categories")
+        found = {
+            row["name"]: row["id"] for row in conn.execute(query, names).fetchall()
+        }
+    return found, bool(missing)
+
+
+def _write_import_batch(conn, user_id, batch):
+    categories, created = _resolve_import_categories(conn, {row[2] for row in batch})
+    rows = [
+        (date, item, categories[category], amount, user_id)
+        for date, item, category, amount in batch
+    ]
+    conn.copy_rows(
+        "expenses", ("date", "item", "category_id", "amount", "user_id"), rows
+    )
+    add_to_rollup(conn, user_id, [(row[0], row[2], row[3]) for row in rows])
+    bump_data_version(conn, user_id)
+    conn.commit()
+    if created:
+        category_catalog.invalidate()
+    return len(rows)
+
+
+class ImportInterrupted(Exception):
+    # The CSV became unreadable part-way through. Everything up to `line`
+    # was imported (or reported in result["errors"]) and stays committed.
+    def __init__(self, line, result, cause):
+        super().__init__(f"stopped after line {line}: {cause}")
+        self.line = line
+        self.result = result
+        self.cause = cause
+
+
+def import_expenses_csv(conn, user_id, text_stream, batch_size=IMPORT_BATCH_SIZE):
+    # Streams the CSV in batches; each valid batch is its own transaction and
+    # invalid rows are reported by line number instead of failing the file.
+    started = time.perf_counter()
+    reader = csv.DictReader(text_stream)
+    fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    missing = [column for column in EXPORT_COLUMNS if column not in fields]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+    failure = None
+    try:
+        for row in reader:
+            line = reader.line_num
+            try:
+                item = (row[fields["item"]] or "").strip()
+                category = (row[fields["category"]] or "").strip()
+                if not item:
+                    raise ValueError("item is required")
+                if not category:
+                    raise ValueError("category is required")
+                batch.append(
+                    (
+                        _parse_import_date(row[fields["date"]]),
+                        item,
+                        category,
+                        _parse_import_amount(row[fields["amount"]]),
+                    )
+                )
+            except ValueError as exc:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append({"line": line, "error": str(exc)})
+                continue
+            if len(batch) >= batch_size:
+                imported += _write_import_batch(conn, user_id, batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as exc:
+        # Earlier batches are already committed: keep the rows read before
+        # the bad spot too, so the file can be resumed right after it.
+        failure = exc
+    if batch:
+        imported += _write_import_batch(conn, user_id, batch)
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "imported": imported,
+        "error_count": error_count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": int((imported + error_count) / elapsed) if elapsed else 0,
+    }
+    if failure is not None:
+        raise ImportInterrupted(reader.line_num, result, failure)
+    return result
+
+
+@route("/expenses/import", methods=["GET", "POST"])
+@login_required
+def import_expenses():
+    if request.method == "GET":
+        return render_template("import_expenses.html")
+
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV file to import.", "warning")
+        return render_template("import_expenses.html")
+
+    user_id = session.get("user_id")
+    conn = get_db_connection()
+    try:
+        text_stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        result = import_expenses_csv(conn, user_id, text_stream)
+    except ImportInterrupted as exc:
+        conn.rollback()
+        flash(
+            f"Import stopped after line {exc.line}: {exc.cause}. "
+            f"{exc.result['imported']} expense(s) up to that line were imported; "
+            f"remove lines 2-{exc.line} before uploading the rest of the file.",
+            "danger",
+        )
+        return render_template("import_expenses.html", result=exc.result)
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        conn.rollback()
+        flash(f"Could not import file: {exc}", "danger")
+        return render_template("import_expenses.html")
+    finally:
+        conn.close()
+
+    flash(
+        f"Imported {result['imported']} expense(s), {result['error_count']} row(s) skipped.",
+        "success" if result["imported"] else "warning",
+    )
+    return render_template("import_expenses.html", result=result)
+
+
+@bp.cli.command("import-expenses")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--user-id", type=int, required=True)
+@click.option("--batch-size", type=int, default=IMPORT_BATCH_SIZE, show_default=True)
+def import_expenses_command(path, user_id, batch_size):
+    """Import expenses for a user from a CSV file."""
+    conn = get_db_connection()
+    interrupted = None
+    with open(path, encoding="utf-8-sig", newline="") as handle:
+        try:
+            result = import_expenses_csv(conn, user_id, handle, batch_size=batch_size)
+        except ImportInterrupted as exc:
+            interrupted = exc
+            result = exc.result
+    conn.close()
+    for error in result["errors"]:
+        click.echo(f"line {error['line']}: {error['error']}")
+    if interrupted:
+        raise click.ClickException(
+            f"{interrupted} ({result['imported']} row(s) up to that line were imported)"
+        )
+    click.echo(
+        f"Imported {result['imported']} row(s), skipped {result['error_count']} "
+        f"in {result['seconds']}s ({result['rows_per_second']} rows/s)."
+    )
+
+
+# -----------------------------
+# Delete Expense
+# -----------------------------
+@route("/delete/<int:id>")
+@login_required
+def delete_expense(id):
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+    expense = conn.execute(
+        "SELECT date, category_id FROM expenses WHERE id = ? AND user_id = ?",
+        (id, user_id),
+    ).fetchone()
+    if expense:
+        conn.execute("DELETE FROM expenses WHERE id = ? AND user_id = ?", (id, user_id))
+        refresh_rollup_groups(
+            conn, user_id, [(expense["date"], expense["category_id"])]
+        )
+        bump_data_version(conn, user_id)
+        conn.commit()
+    conn.close()
+    return redirect(url_for("all_expenses"))
+
+
+# -----------------------------
+# Edit Expense
+# -----------------------------
+@route("/edit/<int:id>", methods=["GET", "POST"])
+@login_required
+def edit_expense(id):
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+
+    if request.method == "POST":
+        date = request.form.get("date")
+        item = request.form.get("item")
+        category_id = request.form.get("category_id")
+        amount = request.form.get("amount")
+
+        previous = conn.execute(
+            "SELECT date, category_id FROM expenses WHERE id = ? AND user_id = ?",
+            (id, user_id),
+        ).fetchone()
+        if not previous:
+            conn.close()
+            flash("Expense not found.", "danger")
+            return redirect(url_for("all_expenses"))
+
+        conn.execute(
+            """
+            UPDATE expenses
+            SET date = ?, item = ?, category_id = ?, amount = ?
+            WHERE id = ? AND user_id = ?
+            """,
+            (date, item, category_id, amount, id, user_id),
+        )
+        refresh_rollup_groups(
+            conn,
+            user_id,
+            [(previous["date"], previous["category_id"]), (date, category_id)],
+        )
+        bump_data_version(conn, user_id)
+        conn.commit()
+        conn.close()
+        return redirect(url_for("all_expenses"))
+
+    expense = conn.execute(
+        """
+        SELECT expenses.id, date, item, amount, category_id
+        FROM expenses
+        WHERE expenses.id = ? AND expenses.user_id = ?
+        """,
+        (id, user_id),
+    ).fetchone()
+    conn.close()
+    if not expense:
+        flash("Expense not found.", "danger")
+        return redirect(url_for("all_expenses"))
+
+    categories = get_categories()
+
+    return render_template(
+        "edit_expense.html",
+        expense=expense,
+        categories=categories,
+    )
+
+
+# -----------------------------
+# Categories + Reassignment (D)
+# -----------------------------
+@route("/categories")
+@login_required
+def categories_view():
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+    etag, last_modified = view_validators("categories", get_data_state(conn, user_id))
+    cached = not_modified(etag, last_modified)
+    if cached:
+        conn.close()
+        return cached
+    rows = conn.execute(
+        """
+        SELECT categories.id,
+               categories.name,
+               COUNT(expenses.id) AS usage_count
+        FROM categories
+        LEFT JOIN expenses
+            ON categories.id = expenses.category_id
+            AND expenses.user_id = ?
+        GROUP BY categories.id
+        ORDER BY categories.name
+        """,
+        (user_id,),
+    ).fetchall()
+    conn.close()
+    return render_conditional("categories.html", etag, last_modified, categories=rows)
+
+
+@route("/add-category", methods=["POST"])
+@login_required
+def add_category():
+    name = request.form.get("name", "").strip()
+
+    if not name:
+        flash("Category name cannot be empty.", "warning")
+        return redirect(url_for("categories_view"))
+
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "INSERT INTO categories (name) VALUES (?)",
+            (name,),
+        )
+        bump_catalog_version(conn, "categories")
+        conn.commit()
+        category_catalog.invalidate()
+        flash("Category added successfully.", "success")
+    except INTEGRITY_ERRORS:
+        # Postgres aborts the whole transaction on the failed insert.
+        conn.rollback()
+        flash("Category already exists.", "danger")
+    finally:
+        conn.close()
+
+    return redirect(url_for("categories_view"))
+
+
+@route("/delete-category/<int:id>", methods=["GET", "POST"])
+@login_required
+def delete_category(id):
+    conn = get_db_connection()
+    user_id = session.get("user_id")
+
+    # Check usage
+    usage_total = conn.execute(
+        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ?",
+        (id,),
+    ).fetchone()["c"]
+    usage_for_user = conn.execute(
+        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ? AND user_id = ?",
+        (id, user_id),
+    ).fetchone()["c"]
+
+    # If no usage, just delete
+    if usage_total == 0 and request.method == "GET":
+        conn.execute("DELETE FROM categories WHERE id = ?", (id,))
+        bump_catalog_version(conn, "categories")
+        conn.commit()
+        category_catalog.invalidate()
+        conn.close()
+        flash("Category deleted.", "success")
+        return redirect(url_for("categories_view"))
+
+    # If in use: show reassignment form (GET)
+    if request.method == "GET":
+        if usage_for_user == 0:
+            conn.close()
+            flash("Category is in use and cannot be deleted.", "warning")
+            return redirect(url_for("categories_view"))
+        all_categories = get_categories(conn)
+        categories = [c for c in all_categories if c["id"] != id]
+        cat = next((c for c in all_categories if c["id"] == id), None)
+        conn.close()
+        if not cat:
+            flash("Category not found.", "danger")
+            return redirect(url_for("categories_view"))
+        flash("Category is in use. Please reassign its expenses before delete.", "warning")
+        return render_template(
+            "reassign_category.html",
+            category=cat,
+            categories=categories,
+            usage=usage_for_user,
+        )
+
+    # POST: reassign and delete
+    new_category_id = request.form.get("new_category_id")
+
+    if not new_category_id:
+        conn.close()
+        flash("Select a category to reassign.", "warning")
+        return redirect(url_for("delete_category", id=id))
+
+    # Reassign all expenses from old category to new_category_id
+    conn.execute(
+        """
+        UPDATE expenses
+        SET category_id = ?
+        WHERE category_id = ? AND user_id = ?
+        """,
+        (new_category_id, id, user_id),
+    )
+    refresh_rollup(conn, user_id, category_ids=[id, new_category_id])
+    bump_data_version(conn, user_id)
+    conn.commit()
+
+    usage_total = conn.execute(
+        "SELECT COUNT(*) AS c FROM expenses WHERE category_id = ?",
+        (id,),
+    ).fetchone()["c"]
+    if usage_total == 0:
+        conn.execute("DELETE FROM categories WHERE id = ?", (id,))
+        bump_catalog_version(conn, "categories")
+        conn.commit()
+        category_catalog.invalidate()
+        flash("Expenses reassigned and category deleted.", "success")
+    else:
+        flash(
+            "Expenses reassigned. Category is still in use and cannot be deleted.",
+            "warning",
+        )
+    conn.close()
+    return redirect(url_for("categories_view"))
+
+
+# -----------------------------
+# JSON API (v1)
+# -----------------------------
+# Read-only JSON for the current session user, validated like the HTML views
+# (see Conditional responses) but without Last-Modified.
+def api_login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get("user_id"):
+            return jsonify({"error": "authentication required"}), 401
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+def _api_filters():
+    return (
+        request.args.get("filter"),
+        request.args.get("from"),
+        request.args.get("to"),
+    )
+
+
+@route("/api/v1/dashboard")
+@api_login_required
+def api_dashboard():
+    user_id = session.get("user_id")
+    filter_type, from_date, to_date = _api_filters()
+    # ?part=cards|charts returns one half; anything else returns both.
+    part = request.args.get("part")
+    sections = (part,) if part in DASHBOARD_SECTIONS else DASHBOARD_SECTIONS
+    conn = get_db_connection()
+    versions = get_data_versions(conn, user_id)
+    etag = make_etag(
+        "v1",
+        "dashboard",
+        user_id,
+        versions,
+        sections,
+        filter_type,
+        from_date,
+        to_date,
+        datetime.now().date(),
+        datetime.utcnow().date(),
+    )
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    payload = get_dashboard_payload(
+        conn, user_id, versions, filter_type, from_date, to_date, sections
+    )
+    conn.close()
+    return with_validators(jsonify(payload), etag)
+
+
+@route("/api/v1/expenses")
+@api_login_required
+def api_expenses():
+    user_id = session.get("user_id")
+    filter_type, from_date, to_date = _api_filters()
+    category_id, _, terms = _search_args()
+    page_size = _page_size(request.args.get("size"))
+    page = _page_number(request.args.get("page"))
+    after = _decode_cursor(request.args.get("after"))
+    before = None if after else _decode_cursor(request.args.get("before"))
+
+    conn = get_db_connection()
+    versions = get_data_versions(conn, user_id)
+    etag = make_etag(
+        "v1",
+        "expenses",
+        user_id,
+        versions,
+        sorted(request.args.items()),
+        datetime.utcnow().date(),
+    )
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+
+    where_clause, params, _ = build_expense_filters(
+        user_id, filter_type, from_date, to_date, category_id, terms
+    )
+    if terms:
+        rows, next_page, prev_page = fetch_search_page(
+            conn, user_id, where_clause, params, terms, page_size, page
+        )
+        pager = {"next_page": next_page, "prev_page": prev_page}
+    else:
+        rows, next_cursor, prev_cursor = fetch_expense_page(
+            conn, where_clause, params, page_size, after=after, before=before
+        )
+        pager = {"next_cursor": next_cursor, "prev_cursor": prev_cursor}
+    total, count = expense_totals(
+        conn,
+        user_id,
+        filter_type,
+        from_date,
+        to_date,
+        where_clause,
+        params,
+        narrowed=bool(category_id or terms),
+    )
+    conn.close()
+    for row in rows:
+        row["date"] = str(row["date"])
+    payload = {
+        "expenses": rows,
+        "total": total,
+        "count": count,
+        "page_size": page_size,
+        **pager,
+    }
+    return with_validators(jsonify(payload), etag)
+
+
+@route("/api/v1/categories")
+@api_login_required
+def api_categories():
+    conn = get_db_connection()
+    version = get_data_versions(conn, session.get("user_id"))[1]
+    etag = make_etag("v1", "categories", version)
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    categories = get_categories(conn, version)
+    conn.close()
+    return with_validators(jsonify({"categories": categories}), etag)
+
+
+# -----------------------------
+# Health
+# -----------------------------
+@route("/health/db")
+def db_health():
+    # Pool size/wait times for sizing gunicorn workers against max_connections.
+    stats = get_pool().stats()
+    if _async_pool is not None:
+        stats["async"] = _async_pool.stats()
+    return jsonify(stats)
+
+
+@route("/health/hashing")
+def hashing_health():
+    return jsonify(hashing_pool.stats())
+
+
+@route("/health/ratelimit")
+def ratelimit_health():
+    return jsonify(rate_limiter.stats())
+
+
+@route("/health/cache")
+def cache_health():
+    return jsonify(get_dashboard_cache().stats())
+
+
+@route("/metrics")
+def metrics_view():
+    return Response(
+        render_metrics(collect_metrics()),
+        mimetype="text/plain",
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+# -----------------------------
+# App factory
+# -----------------------------
+# `app` below serves gunicorn (app:app), `flask --app app` and asgi_app;
+# create_app() builds a fresh one (gunicorn "app:create_app()"). The schema is
+# not touched here: run `flask --app app migrate` once per deploy, before the
+# workers start.
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = os.getenv("SECRET_KEY", "change_this_in_production")
+    app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=30)
+    app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    app.config["SESSION_COOKIE_SECURE"] = bool(os.getenv("SESSION_COOKIE_SECURE", "1") == "1")
+    if DB_TYPE == "postgres":
+        # Here rather than per connection so a preloaded gunicorn master
+        # imports it once for all workers.
+        load_postgres_driver()
+    app.register_blueprint(bp)
+    app.teardown_appcontext(release_db_connections)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    return app
+
+
+app = create_app()
+
+
+# -----------------------------
+# ASGI entry point
+# -----------------------------
+# Optional alternative to the WSGI app (needs a2wsgi, an ASGI server and, on
+# Postgres, psycopg 3):
+#
+#     uvicorn app:asgi_app --workers 4
+#
+# Flask views run unchanged on a pool of ASGI_THREADS threads per process, so
+# a slow query or password hash holds one thread while the event loop keeps
+# accepting requests. The dashboard's aggregates run concurrently on the loop
+# through the async data layer. Each thread can hold a pooled connection, so
+# more threads than DB_POOL_SIZE only queue on the pool (and time out).
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", str(DB_POOL_SIZE)))
+
+_asgi_loop = None
+
+
+def asgi_loop():
+    return _asgi_loop
+
+
+def run_on_asgi_loop(coro):
+    # Called from a view thread; blocks it until the coroutine finishes.
+    return asyncio.run_coroutine_threadsafe(coro, _asgi_loop).result()
+
+
+class AsgiApp:
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self._wsgi = None
+
+    def _wrap(self):
+        # Imported once an ASGI server calls in; WSGI deployments skip it.
+        try:
+            from a2wsgi import WSGIMiddleware
+        except ImportError:
+            raise RuntimeError("asgi_app needs the a2wsgi package")
+        return WSGIMiddleware(self.wsgi_app, workers=self.threads)
+
+    async def __call__(self, scope, receive, send):
+        global _asgi_loop
+        if self._wsgi is None:
+            self._wsgi = self._wrap()
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if _asgi_loop is None:
+            # Server without lifespan events.
+            _asgi_loop = asyncio.get_running_loop()
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        global _asgi_loop
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                _asgi_loop = asyncio.get_running_loop()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_pool()
+                _asgi_loop = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+asgi_app = AsgiApp(app, ASGI_THREADS)
+
+
+# -----------------------------
+# Main
+# -----------------------------
+
+# if __name__ == "__main__":
+#     init_db()
+#     app.run(debug=True)
+
+if __name__ == "__main__":
+    init_db()
+    port = int(os.getenv("PORT", 5000))
+    app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,225 @@
+"""WSGI (gunicorn sync workers) vs ASGI (uvicorn app:asgi_app) under load.
+
+Starts each server on the same synthetic data, drives it with concurrent
+keep-alive clients for a fixed time and reports requests per second and
+p50/p99 latency:
+
+    python benchmarks/asgi.py [--workers 2] [--clients 16] [--seconds 10] [--json out.json]
+    python benchmarks/asgi.py --postgres-url postgresql://localhost/bench [--db-latency-ms 2]
+
+--db-latency-ms puts a delaying TCP proxy in front of Postgres, standing in
+for a database on another host; that waiting is what the ASGI mode overlaps.
+
+Needs gunicorn, uvicorn and a2wsgi (plus psycopg 3 for Postgres).
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from datagen import ROOT, load_app, populate
+
+PORT = 8765
+DEFAULT_PATHS = "/dashboard?filter=year,/dashboard,/api/v1/dashboard?filter=month,/expenses"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def start_latency_proxy(postgres_url, latency_ms):
+    # Forwards to the real server, delaying every chunk it sends back;
+    # returns the URL to connect through.
+    import psycopg2.extensions
+
+    dsn = psycopg2.extensions.parse_dsn(postgres_url)
+    host, port = dsn.get("host", "localhost"), dsn.get("port", "5432")
+    delay = latency_ms / 1000
+    loop = asyncio.new_event_loop()
+
+    async def pipe(reader, writer, wait):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if wait:
+                    await asyncio.sleep(wait)
+                writer.write(data)
+                await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        if host.startswith("/"):
+            server_reader, server_writer = await asyncio.open_unix_connection(
+                f"{host}/.s.PGSQL.{port}"
+            )
+        else:
+            server_reader, server_writer = await asyncio.open_connection(host, int(port))
+        await asyncio.gather(
+            pipe(client_reader, server_writer, 0),
+            pipe(server_reader, client_writer, delay),
+        )
+
+    server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    proxy_port = server.sockets[0].getsockname()[1]
+    credentials = dsn.get("user", "")
+    if dsn.get("password"):
+        credentials += f":{dsn['password']}"
+    return f"postgresql://{credentials}@127.0.0.1:{proxy_port}/{dsn.get('dbname', '')}"
+
+
+def server_command(mode, workers):
+    if mode == "wsgi":
+        return [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--pythonpath", ROOT,
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{PORT}",
+            "--log-level", "warning",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", "app:asgi_app",
+        "--app-dir", ROOT,
+        "--workers", str(workers),
+        "--port", str(PORT),
+        "--log-level", "warning",
+    ]
+
+
+def wait_for_server(deadline=30):
+    started = time.time()
+    while time.time() - started < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", PORT), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server did not start")
+
+
+def client(paths, cookie, start_at, deadline, results):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    latencies, errors, index = [], 0, 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while time.time() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Cookie": f"session={cookie}"})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            ok = False
+        if ok:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+    conn.close()
+    results.append((latencies, errors))
+
+
+def run_mode(mode, args, cookie, workdir):
+    server = subprocess.Popen(server_command(mode, args.workers), cwd=workdir)
+    try:
+        wait_for_server()
+        paths = args.paths.split(",")
+        # Warm-up: imports, pools, template compilation in every worker.
+        warm = []
+        client(paths, cookie, 0, time.time() + 2, warm)
+
+        results = []
+        start_at = time.time() + 0.5
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(paths, cookie, start_at, start_at + args.seconds, results),
+            )
+            for _ in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [value for run, _ in results for value in run]
+    return {
+        "requests_per_second": round(len(latencies) / args.seconds, 1),
+        "errors": sum(errors for _, errors in results),
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI load benchmark.")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="Postgres only.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--paths", default=DEFAULT_PATHS)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    # Servers inherit the environment: same secret (for the session cookie),
+    # same database, dashboard cache off.
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    workdir = tempfile.mkdtemp()
+    backend = "postgres" if args.postgres_url else "sqlite"
+    postgres_url = args.postgres_url
+    if postgres_url and args.db_latency_ms:
+        postgres_url = start_latency_proxy(postgres_url, args.db_latency_ms)
+    # SQLite: the app opens database.db in its working directory.
+    expense_app = load_app(
+        backend,
+        sqlite_path=os.path.join(workdir, "database.db"),
+        postgres_url=postgres_url,
+    )
+    expense_app.init_db()
+    populate(expense_app, users=5, expenses_per_user=args.expenses // 5)
+    expense_app.get_pool().close_all()
+    cookie = expense_app.app.session_interface.get_signing_serializer(expense_app.app).dumps(
+        {"user_id": 1, "user_name": "Bench User 1"}
+    )
+
+    report = {"benchmark": "asgi", "backend": backend, "params": vars(args), "modes": {}}
+    for mode in args.modes.split(","):
+        stats = run_mode(mode, args, cookie, workdir)
+        report["modes"][mode] = stats
+        print(
+            f"{backend:8} {args.db_latency_ms:4g} ms {mode:5} {stats['requests_per_second']:8.1f} req/s  "
+            f"p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  "
+            f"errors {stats['errors']}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
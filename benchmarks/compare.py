@@ -0,0 +1,52 @@
+"""Compare two benchmarks/queries.py result files.
+
+    python benchmarks/compare.py before.json after.json [--threshold 0.10]
+
+Prints the p50 change per case and exits non-zero when any case got slower
+than the threshold.
+"""
+import argparse
+import json
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    cases = {}
+    for run in report["runs"]:
+        for result in run["results"]:
+            key = (run["backend"], result["size"], result["route"], result["case"])
+            cases[key] = result
+    return report, cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query benchmark results.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed p50 slowdown.")
+    args = parser.parse_args()
+
+    before_report, before = load(args.before)
+    after_report, after = load(args.after)
+    print(f"{before_report.get('commit')} -> {after_report.get('commit')}")
+    print(f"{'backend':8} {'size':>8} {'route':16} {'case':14} {'before':>9} {'after':>9} {'change':>8}")
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key]["p50_ms"], after[key]["p50_ms"]
+        change = (new - old) / old if old else 0
+        flag = ""
+        if change > args.threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        backend, size, route, case = key
+        print(
+            f"{backend:8} {size:>8} {route:16} {case:14} {old:9.2f} {new:9.2f} {change:+8.1%}{flag}"
+        )
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"only in {'before' if key in before else 'after'}: {key}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""CPU cost vs bytes saved for response compression.
+
+Renders typical expense-list responses from a throwaway SQLite database and
+times compress_body() for each encoding/level.
+
+    python benchmarks/compression.py [--rows 10000] [--repeat 20] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from datagen import load_app, populate
+
+SETTINGS = [
+    ("gzip", 1),
+    ("gzip", 6),
+    ("gzip", 9),
+    ("br", 1),
+    ("br", 4),
+    ("br", 11),
+]
+
+
+def payloads(expense_app, export_rows):
+    client = expense_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+        sess["user_name"] = "Bench"
+    urls = [
+        ("expenses.html size=25", "/expenses?size=25"),
+        ("expenses.html size=50", "/expenses?size=50"),
+        ("expenses.html size=100", "/expenses?size=100"),
+        ("api/v1/expenses size=100", "/api/v1/expenses?size=100"),
+        ("dashboard.html", "/dashboard"),
+        ("api/v1/dashboard", "/api/v1/dashboard"),
+        (f"export.csv {export_rows} rows", "/expenses/export.csv"),
+    ]
+    for label, url in urls:
+        response = client.get(url, headers={"Accept-Encoding": "identity"})
+        yield label, response.get_data()
+
+
+def measure(expense_app, data, encoding, level, repeat):
+    expense_app.COMPRESS_LEVEL = level
+    expense_app.COMPRESS_BROTLI_QUALITY = level
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        out = expense_app.compress_body(data, encoding)
+        samples.append(time.process_time() - started)
+    return len(out), statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    expense_app = load_app("sqlite", sqlite_path=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    if expense_app.brotli is None:
+        print("brotli is not installed; only gzip is measured.")
+    expense_app.init_db()
+    populate(expense_app, users=1, expenses_per_user=args.rows)
+
+    results = []
+    print(f"{'payload':28} {'raw':>9} {'encoding':>9} {'out':>8} {'saved':>7} {'cpu ms':>7}")
+    for label, data in payloads(expense_app, args.rows):
+        for encoding, level in SETTINGS:
+            if encoding == "br" and expense_app.brotli is None:
+                continue
+            size, cpu_ms = measure(expense_app, data, encoding, level, args.repeat)
+            saved = 1 - size / len(data)
+            results.append(
+                {
+                    "payload": label,
+                    "raw_bytes": len(data),
+                    "encoding": encoding,
+                    "level": level,
+                    "bytes": size,
+                    "saved_ratio": round(saved, 4),
+                    "cpu_ms": round(cpu_ms, 3),
+                }
+            )
+            print(
+                f"{label:28} {len(data):9} {encoding + ':' + str(level):>9} "
+                f"{size:8} {saved:6.1%} {cpu_ms:7.2f}"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "compression", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
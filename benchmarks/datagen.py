@@ -0,0 +1,196 @@
+"""Synthetic data for benchmarks.
+
+Populates either backend through the app's own connection layer:
+
+    python benchmarks/datagen.py --sqlite bench.db --users 10 --expenses-per-user 10000
+    python benchmarks/datagen.py --postgres-url postgresql://localhost/bench --skew 1.2
+
+Postgres data goes into its own schema (expense_bench by default), which is
+dropped and recreated on every run; the rest of the database is untouched.
+"""
+import argparse
+import importlib
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BENCH_SCHEMA = "expense_bench"
+ITEMS = [
+    "coffee",
+    "groceries",
+    "taxi",
+    "rent",
+    "cinema",
+    "electricity",
+    "lunch",
+    "train ticket",
+    "books",
+    "gym",
+]
+
+
+def random_item(rng):
+    return f"{rng.choice(ITEMS)} {rng.randrange(1000)}"
+
+
+def load_app(backend, sqlite_path=None, postgres_url=None, schema=BENCH_SCHEMA):
+    # app reads DATABASE_URL at import time, so one backend per process.
+    os.environ.setdefault("DASHBOARD_CACHE", "off")
+    os.environ.setdefault("OUTBOX_WORKER", "off")
+    if backend == "postgres":
+        if not postgres_url:
+            raise SystemExit("--postgres-url (or BENCH_DATABASE_URL) is required for postgres")
+        reset_postgres_schema(postgres_url, schema)
+        separator = "&" if "?" in postgres_url else "?"
+        os.environ["DATABASE_URL"] = f"{postgres_url}{separator}options=-csearch_path%3D{schema}"
+        os.environ.setdefault("DB_SSLMODE", "prefer")
+    else:
+        os.environ.pop("DATABASE_URL", None)
+    sys.path.insert(0, ROOT)
+    module = importlib.import_module("app")
+    if backend == "sqlite":
+        module.DB_NAME = sqlite_path
+    module.app.config["SESSION_COOKIE_SECURE"] = False
+    return module
+
+
+def reset_postgres_schema(postgres_url, schema):
+    import psycopg2
+
+    conn = psycopg2.connect(postgres_url)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+    conn.close()
+
+
+def reset_sqlite(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def zipf_weights(count, skew):
+    # skew 0 is uniform; larger values concentrate on the first entries.
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+def populate(
+    expense_app,
+    users=5,
+    expenses_per_user=2000,
+    categories=8,
+    days=730,
+    skew=1.0,
+    seed=1,
+    batch_size=5000,
+    make_item=random_item,
+):
+    """Insert users, categories and expenses; returns a summary dict."""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    conn = expense_app.get_db_connection()
+
+    conn.copy_rows(
+        "users",
+        ("name", "email", "password"),
+        [(f"Bench User {i}", f"bench{i}@example.com", "x") for i in range(1, users + 1)],
+    )
+    conn.copy_rows(
+        "categories",
+        ("name",),
+        [(f"Category {i}",) for i in range(1, categories + 1)],
+    )
+    user_ids = [
+        row["id"] for row in conn.execute("SELECT id FROM users ORDER BY id").fetchall()
+    ]
+    category_ids = [
+        row["id"] for row in conn.execute("SELECT id FROM categories ORDER BY id").fetchall()
+    ]
+    conn.commit()
+
+    # Per-user volume follows the same skew as categories, scaled so the
+    # total stays users * expenses_per_user.
+    user_weights = zipf_weights(len(user_ids), skew)
+    scale = users * expenses_per_user / sum(user_weights)
+    category_weights = zipf_weights(len(category_ids), skew)
+    today = date.today()
+
+    total = 0
+    for user_id, weight in zip(user_ids, user_weights):
+        remaining = max(1, round(weight * scale))
+        while remaining:
+            count = min(batch_size, remaining)
+            rows = [
+                (
+                    (today - timedelta(days=rng.randrange(days))).isoformat(),
+                    make_item(rng),
+                    category_id,
+                    round(rng.lognormvariate(3, 1), 2),
+                    user_id,
+                )
+                for category_id in rng.choices(category_ids, category_weights, k=count)
+            ]
+            conn.copy_rows(
+                "expenses", ("date", "item", "category_id", "amount", "user_id"), rows
+            )
+            conn.commit()
+            remaining -= count
+            total += count
+
+    expense_app.refresh_rollup(conn)
+    if conn.db_type == "postgres":
+        # Fresh planner statistics, as autovacuum would have in production;
+        # otherwise plans flip whenever autoanalyze happens to kick in.
+        conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    expense_app.category_catalog.invalidate()
+    return {
+        "users": len(user_ids),
+        "categories": len(category_ids),
+        "expenses": total,
+        "days": days,
+        "skew": skew,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populate a database with synthetic expenses.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sqlite", help="SQLite file to (re)create.")
+    target.add_argument("--postgres-url", help="Postgres URL; data goes into --schema.")
+    parser.add_argument("--schema", default=BENCH_SCHEMA)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--expenses-per-user", type=int, default=2000)
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--days", type=int, default=730, help="Date span ending today.")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent (0 = uniform).")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        reset_sqlite(args.sqlite)
+        expense_app = load_app("sqlite", sqlite_path=args.sqlite)
+    else:
+        expense_app = load_app("postgres", postgres_url=args.postgres_url, schema=args.schema)
+    expense_app.init_db()
+    summary = populate(
+        expense_app,
+        users=args.users,
+        expenses_per_user=args.expenses_per_user,
+        categories=args.categories,
+        days=args.days,
+        skew=args.skew,
+        seed=args.seed,
+    )
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""CSV import throughput.
+
+Writes a synthetic CSV (items from the data generator, a share of invalid
+rows) and times import_expenses_csv() into a fresh user for each batch size.
+Goes through the connection layer directly (no HTTP upload):
+
+    python benchmarks/import_csv.py [--rows 100000] [--batch-sizes 100,1000,5000] [--json out.json]
+    python benchmarks/import_csv.py --postgres-url postgresql://localhost/bench
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from datagen import load_app, random_item
+
+CATEGORIES = ["Food", "Transport", "Rent", "Utilities", "Fun", "Health", "Travel", "Books"]
+
+
+def write_csv(path, rows, invalid, seed=1):
+    rng = random.Random(seed)
+    today = date.today()
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["date", "item", "category", "amount"])
+        for _ in range(rows):
+            day = today - timedelta(days=rng.randrange(730))
+            # Mix of the accepted date formats, like exports from other tools.
+            fmt = rng.choice(("%Y-%m-%d", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"))
+            amount = f"{rng.lognormvariate(3, 1):,.2f}"
+            if rng.random() < invalid:
+                amount = "n/a"
+            writer.writerow([day.strftime(fmt), random_item(rng), rng.choice(CATEGORIES), amount])
+
+
+def create_user(conn, number):
+    conn.execute(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        (f"Import User {number}", f"import{number}@example.com", "x"),
+    )
+    user_id = conn.execute(
+        "SELECT id FROM users WHERE email = ?", (f"import{number}@example.com",)
+    ).fetchone()["id"]
+    conn.commit()
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-sizes", default="100,1000,5000")
+    parser.add_argument("--invalid", type=float, default=0.01, help="Share of rows with a bad amount.")
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    backend = "postgres" if args.postgres_url else "sqlite"
+    workdir = tempfile.mkdtemp()
+    expense_app = load_app(
+        backend,
+        sqlite_path=os.path.join(workdir, "import.db"),
+        postgres_url=args.postgres_url,
+    )
+    expense_app.init_db()
+    path = os.path.join(workdir, "expenses.csv")
+    write_csv(path, args.rows, args.invalid)
+    print(f"{backend}: {args.rows} rows, {os.path.getsize(path) // 1024} KiB of CSV")
+
+    report = {"benchmark": "import_csv", "backend": backend, "params": vars(args), "results": []}
+    conn = expense_app.get_db_connection()
+    for number, batch_size in enumerate(int(value) for value in args.batch_sizes.split(",")):
+        user_id = create_user(conn, number)
+        with open(path, encoding="utf-8-sig", newline="") as handle:
+            result = expense_app.import_expenses_csv(conn, user_id, handle, batch_size=batch_size)
+        report["results"].append(
+            {
+                "batch_size": batch_size,
+                "imported": result["imported"],
+                "skipped": result["error_count"],
+                "seconds": result["seconds"],
+                "rows_per_second": result["rows_per_second"],
+            }
+        )
+        print(
+            f"batch {batch_size:>6}  imported {result['imported']:>8}  skipped {result['error_count']:>6}  "
+            f"{result['seconds']:8.3f} s  {result['rows_per_second']:>8} rows/s"
+        )
+    conn.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Postgres prepared statements on vs off, per dashboard/expenses query set.
+
+Runs the dashboard's aggregate queries and the first expense page straight
+through the connection layer (no HTTP, no templates), alternating between a
+pool with the statement cache and one without so both see the same server
+state; the difference is the parse/plan time the cache saves:
+
+    python benchmarks/prepared.py --postgres-url postgresql://localhost/bench [--expenses 20000] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from datagen import load_app, populate
+
+CASES = [
+    ("dashboard", "all time", (None, None, None)),
+    ("dashboard", "this month", ("month", None, None)),
+    ("dashboard", "this year", ("year", None, None)),
+    ("dashboard", "custom range", (None, "2000-01-01", "2100-01-01")),
+    ("all_expenses", "first page", (None, None, None)),
+]
+
+
+def run_case(expense_app, conn, route, filters, user_id):
+    if route == "dashboard":
+        expense_app.build_dashboard_context(conn, user_id, *filters)
+    else:
+        where_clause, params, _ = expense_app.build_expense_filters(user_id, *filters)
+        expense_app.fetch_expense_page(conn, where_clause, params, 50)
+
+
+def make_pool(expense_app, prepared):
+    return expense_app.PostgresPool(
+        expense_app._connect_postgres,
+        max_size=1,
+        timeout=expense_app.DB_POOL_TIMEOUT,
+        max_lifetime=expense_app.DB_POOL_MAX_LIFETIME,
+        check_interval=expense_app.DB_POOL_CHECK_INTERVAL,
+        statement_cache_size=expense_app.PG_STATEMENT_CACHE_SIZE if prepared else 0,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepared statement benchmark (Postgres).")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument(
+        "--user-id", type=int, default=1, help="1 owns the most rows; higher ids fewer."
+    )
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--per-round", type=int, default=10)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    expense_app = load_app("postgres", postgres_url=args.postgres_url)
+    expense_app.init_db()
+    populate(expense_app, users=args.users, expenses_per_user=args.expenses // args.users)
+    pools = {"off": make_pool(expense_app, False), "on": make_pool(expense_app, True)}
+    samples = {(mode, route, case): [] for mode in pools for route, case, _ in CASES}
+
+    with expense_app.app.app_context():
+        for round_number in range(args.rounds + 1):
+            # Swap the order every round; round 0 only warms both pools up.
+            modes = ["off", "on"] if round_number % 2 else ["on", "off"]
+            for mode in modes:
+                conn = expense_app.DBConnection(pools[mode].acquire(), "postgres", pools[mode])
+                for route, case, filters in CASES:
+                    for _ in range(args.per_round):
+                        started = time.perf_counter()
+                        run_case(expense_app, conn, route, filters, args.user_id)
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if round_number:
+                            samples[(mode, route, case)].append(elapsed)
+                conn.close()
+
+    results = []
+    for route, case, _ in CASES:
+        off = statistics.median(samples[("off", route, case)])
+        on = statistics.median(samples[("on", route, case)])
+        results.append(
+            {"route": route, "case": case, "off_p50_ms": round(off, 3), "on_p50_ms": round(on, 3)}
+        )
+        print(f"{route:14} {case:14} off {off:8.3f} ms  on {on:8.3f} ms  {(on - off) / off:+7.1%}")
+    statements = pools["on"].stats()["statements"]
+    print(f"statements: {statements}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"benchmark": "prepared", "params": vars(args), "results": results, "statements": statements},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
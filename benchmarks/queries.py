@@ -0,0 +1,234 @@
+"""Route query benchmarks across data sizes and backends.
+
+For each size the database is rebuilt with datagen.populate() and every case
+is timed through the Flask test client (dashboard cache off, no conditional
+headers, so each request runs its queries):
+
+    python benchmarks/queries.py --sizes 1000,10000,100000 --json results.json
+    python benchmarks/queries.py --backends sqlite,postgres --postgres-url postgresql://localhost/bench
+
+Compare two result files with benchmarks/compare.py.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datagen import ROOT, load_app, populate, reset_postgres_schema, reset_sqlite
+
+USERS = 5
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "min_ms": round(min(samples), 3),
+    }
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["user_name"] = f"Bench User {user_id}"
+
+
+def timed_get(client, url, repeat, warmup=2):
+    for _ in range(warmup):
+        client.get(url)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+    return samples
+
+
+def middle_cursor(expense_app, user_id):
+    conn = expense_app.get_db_connection()
+    count = conn.execute(
+        "SELECT COUNT(*) AS c FROM expenses WHERE user_id = ?", (user_id,)
+    ).fetchone()["c"]
+    row = conn.execute(
+        "SELECT date, id FROM expenses WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?",
+        (user_id, count // 2),
+    ).fetchone()
+    conn.close()
+    return expense_app._encode_cursor(row["date"], row["id"])
+
+
+def time_delete_category(expense_app, client, user_id, repeat):
+    # Each run moves ~1% of the user's expenses into a fresh category (not
+    # timed) and then times the reassign-and-delete POST.
+    samples = []
+    for run in range(repeat):
+        conn = expense_app.get_db_connection()
+        conn.execute("INSERT INTO categories (name) VALUES (?)", (f"Bench temp {run}",))
+        temp_id = conn.execute(
+            "SELECT id FROM categories WHERE name = ?", (f"Bench temp {run}",)
+        ).fetchone()["id"]
+        target_id = conn.execute(
+            "SELECT MIN(id) AS id FROM categories"
+        ).fetchone()["id"]
+        ids = conn.execute(
+            "SELECT id FROM expenses WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE expenses SET category_id = ? WHERE id = ?",
+            [(temp_id, row["id"]) for row in ids[run % 100::100]],
+        )
+        expense_app.refresh_rollup(conn, user_id)
+        conn.commit()
+        conn.close()
+        expense_app.category_catalog.invalidate()
+
+        started = time.perf_counter()
+        response = client.post(
+            f"/delete-category/{temp_id}", data={"new_category_id": target_id}
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 302, response.status_code
+    return samples
+
+
+def report(backend, result):
+    print(
+        f"[{backend}] {result['size']:>8} {result['route']:16} {result['case']:14} "
+        f"p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms",
+        file=sys.stderr,
+    )
+
+
+def run_backend(args):
+    backend = args.backends
+    workdir = tempfile.mkdtemp()
+    sqlite_path = os.path.join(workdir, "bench.db")
+    expense_app = load_app(backend, sqlite_path=sqlite_path, postgres_url=args.postgres_url)
+    client = expense_app.app.test_client()
+    results = []
+
+    for size in args.sizes:
+        expense_app.get_pool().close_all()
+        if backend == "sqlite":
+            reset_sqlite(sqlite_path)
+        else:
+            reset_postgres_schema(args.postgres_url, "expense_bench")
+        expense_app.init_db()
+        dataset = populate(
+            expense_app,
+            users=USERS,
+            expenses_per_user=size // USERS,
+            days=args.days,
+            skew=args.skew,
+        )
+        print(f"[{backend}] size={size}: {dataset}", file=sys.stderr)
+        # The heaviest user under the skew; it owns the most rows.
+        user_id = 1
+        login(client, user_id)
+        cursor = middle_cursor(expense_app, user_id)
+        cases = [
+            ("dashboard", "all time", "/dashboard"),
+            ("dashboard", "this month", "/dashboard?filter=month"),
+            ("dashboard", "this year", "/dashboard?filter=year"),
+            ("dashboard", "custom range", "/dashboard?from=2000-01-01&to=2100-01-01"),
+            ("all_expenses", "first page", "/expenses"),
+            ("all_expenses", "this year", "/expenses?filter=year"),
+            ("all_expenses", "deep page", f"/expenses?after={cursor}"),
+            ("categories_view", "list", "/categories"),
+        ]
+        for route, case, url in cases:
+            samples = timed_get(client, url, args.repeat)
+            results.append({"size": size, "route": route, "case": case, **summarize(samples)})
+            report(backend, results[-1])
+        samples = time_delete_category(expense_app, client, user_id, args.repeat)
+        results.append(
+            {"size": size, "route": "delete_category", "case": "reassign 1%", **summarize(samples)}
+        )
+        report(backend, results[-1])
+
+    return {"backend": backend, "results": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark route queries.")
+    parser.add_argument("--backends", default="sqlite", help="Comma-separated: sqlite,postgres.")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Total expenses per run.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in str(args.sizes).split(",")]
+
+    backends = args.backends.split(",")
+    if len(backends) == 1:
+        runs = [run_backend(args)]
+    else:
+        # app binds its backend at import time: one child process per backend.
+        runs = []
+        for backend in backends:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as handle:
+                out = handle.name
+            command = [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--backends", backend,
+                "--sizes", ",".join(str(size) for size in args.sizes),
+                "--repeat", str(args.repeat),
+                "--days", str(args.days),
+                "--skew", str(args.skew),
+                "--json", out,
+            ]
+            if args.postgres_url:
+                command += ["--postgres-url", args.postgres_url]
+            subprocess.run(command, check=True)
+            with open(out, encoding="utf-8") as f:
+                runs.extend(json.load(f)["runs"])
+            os.remove(out)
+
+    report = {
+        "benchmark": "queries",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"sizes": args.sizes, "repeat": args.repeat, "days": args.days, "skew": args.skew},
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Legitimate logins while attackers flood /login and /forgot-password.
+
+Runs legitimate clients (each login a different user from a different IP,
+correct password) for a baseline, then again while attacker threads post
+wrong passwords and reset requests for one victim account at a fixed total
+rate, first with the rate limiter effectively off and then with the
+configured limits. Requests
+go through the Flask test client from threads in one process, so bcrypt
+runs on the real hashing pool:
+
+    python benchmarks/ratelimit.py [--clients 4] [--attackers 8] [--attack-rate 200] [--seconds 5] [--json out.json]
+
+--attacker-ips spreads the flood over that many source addresses, which
+leaves only the per-email limit to stop it.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from datagen import load_app, populate
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def legit_client(expense_app, emails, start_at, deadline, results):
+    latencies, failures = [], 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while time.time() < deadline:
+        email, ip = emails.pop()
+        client = expense_app.app.test_client()
+        started = time.perf_counter()
+        response = client.post(
+            "/login",
+            data={"email": email, "password": "password"},
+            environ_base={"REMOTE_ADDR": ip},
+        )
+        if response.status_code == 302:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            failures += 1
+    results.append({"role": "legit", "latencies": latencies, "failures": failures})
+
+
+def attacker(expense_app, victim, ips, interval, start_at, deadline, results):
+    client = expense_app.app.test_client()
+    statuses = {}
+    count = 0
+    next_at = start_at
+    while time.time() < deadline:
+        # Paced, as a remote client is limited by its own bandwidth; each
+        # request still waits for the previous response.
+        time.sleep(max(0, next_at - time.time()))
+        next_at += interval
+        ip = ips[count % len(ips)]
+        if count % 4 == 3:
+            response = client.post(
+                "/forgot-password", data={"email": victim}, environ_base={"REMOTE_ADDR": ip}
+            )
+        else:
+            response = client.post(
+                "/login",
+                data={"email": victim, "password": f"guess{count}"},
+                environ_base={"REMOTE_ADDR": ip},
+            )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        count += 1
+    results.append({"role": "attacker", "statuses": statuses})
+
+
+def run_phase(expense_app, emails, clients, attackers, attack_rate, attacker_ips, seconds):
+    results = []
+    start_at = time.time() + 0.2
+    deadline = start_at + seconds
+    ips = [f"10.66.{i // 256}.{i % 256}" for i in range(attacker_ips)]
+    threads = [
+        threading.Thread(target=legit_client, args=(expense_app, emails, start_at, deadline, results))
+        for _ in range(clients)
+    ] + [
+        threading.Thread(
+            target=attacker,
+            args=(
+                expense_app,
+                "bench1@example.com",
+                ips,
+                attackers / attack_rate,
+                start_at,
+                deadline,
+                results,
+            ),
+        )
+        for _ in range(attackers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = [value for run in results if run["role"] == "legit" for value in run["latencies"]]
+    statuses = {}
+    for run in results:
+        for status, count in run.get("statuses", {}).items():
+            statuses[status] = statuses.get(status, 0) + count
+    attack_total = sum(statuses.values())
+    return {
+        "legit_per_second": round(len(latencies) / seconds, 1),
+        "legit_failures": sum(run.get("failures", 0) for run in results),
+        "legit_p50_ms": round(percentile(latencies, 50) or 0, 2),
+        "legit_p99_ms": round(percentile(latencies, 99) or 0, 2),
+        "legit_mean_ms": round(statistics.mean(latencies), 2) if latencies else None,
+        "attack_per_second": round(attack_total / seconds, 1),
+        "attack_rejected": statuses.get(429, 0),
+        "attack_statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "limiter_keys": expense_app.rate_limiter.store.size(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--attackers", type=int, default=8)
+    parser.add_argument("--attack-rate", type=float, default=200, help="Attack requests/s in total.")
+    parser.add_argument("--attacker-ips", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    expense_app = load_app("sqlite", sqlite_path=os.path.join(tempfile.mkdtemp(), "ratelimit.db"))
+    expense_app.app.logger.disabled = True
+    expense_app.init_db()
+    populate(expense_app, users=args.users, expenses_per_user=1)
+    # One real hash for everyone: populating thousands of bcrypt hashes
+    # would take longer than the benchmark.
+    conn = expense_app.get_db_connection()
+    conn.execute("UPDATE users SET password = ?", (expense_app._hash_password("password"),))
+    conn.commit()
+    conn.close()
+
+    phases = [
+        ("baseline", 0, {name: "1000000000/1" for name in expense_app.RATE_LIMITS}),
+        ("flood, no limiter", args.attackers, {name: "1000000000/1" for name in expense_app.RATE_LIMITS}),
+        ("flood, limiter", args.attackers, expense_app.RATE_LIMITS),
+    ]
+    report = {"benchmark": "ratelimit", "params": vars(args), "phases": {}}
+    next_user = args.users
+    for name, attackers, limits in phases:
+        expense_app.rate_limiter = expense_app.RateLimiter(expense_app.MemoryBucketStore(), limits)
+        # Fresh users and addresses every phase, handed out from the end so
+        # the victim (bench1) never logs in legitimately.
+        emails = [
+            (f"bench{i}@example.com", f"192.0.{i // 256 % 256}.{i % 256}")
+            for i in range(2, next_user + 1)
+        ]
+        stats = run_phase(
+            expense_app,
+            emails,
+            args.clients,
+            attackers,
+            args.attack_rate,
+            args.attacker_ips,
+            args.seconds,
+        )
+        next_user = int(emails[-1][0][5:].split("@")[0]) if emails else 1
+        report["phases"][name] = stats
+        print(
+            f"{name:18} legit {stats['legit_per_second']:7.1f}/s p50 {stats['legit_p50_ms']:8.2f} ms "
+            f"p99 {stats['legit_p99_ms']:8.2f} ms failures {stats['legit_failures']:4}  "
+            f"attack {stats['attack_per_second']:8.1f}/s rejected {stats['attack_rejected']:7}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
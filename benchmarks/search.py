@@ -0,0 +1,163 @@
+"""Expense search latency on a large table.
+
+Fills the database with items drawn from a realistic vocabulary (a few dozen
+common words with Zipf popularity plus a few thousand merchant-like names),
+then times what /expenses?q= runs for one user: the ranked first page and
+the match totals, alone and combined with date ranges and a category. Goes
+through the connection layer directly (no HTTP, no templates):
+
+    python benchmarks/search.py [--expenses 1000000] [--users 1000] [--json out.json]
+    python benchmarks/search.py --postgres-url postgresql://localhost/bench
+
+Users' volumes are Zipf-skewed: user 1 owns the most rows (about 13% of
+them with the defaults); --user-ids picks who searches.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from datagen import load_app, populate
+
+WORDS = [
+    "coffee", "groceries", "taxi", "rent", "cinema", "electricity", "lunch",
+    "train", "ticket", "books", "gym", "dinner", "uber", "petrol", "pharmacy",
+    "internet", "mobile", "recharge", "snacks", "tea", "breakfast", "flight",
+    "hotel", "parking", "insurance", "water", "gas", "bus", "metro", "movie",
+    "netflix", "spotify", "amazon", "shoes", "shirt", "gift", "doctor",
+    "dentist", "salon", "laundry",
+]
+SYLLABLES = [
+    "ka", "ri", "to", "sun", "mar", "bel", "zo", "pen", "lux", "dor",
+    "vi", "ta", "mo", "ne", "qui", "ra", "sa", "fi", "lo", "gre",
+]
+
+
+def item_maker(merchants):
+    word_weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    merchant_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(merchants))]
+
+    def make_item(rng):
+        item = f"{rng.choices(WORDS, word_weights)[0]} {rng.choices(merchants, merchant_weights)[0]}"
+        if rng.random() < 0.3:
+            item += f" {rng.randrange(1000)}"
+        return item
+
+    return make_item
+
+
+def cases(merchants, category_id):
+    year = (time.strftime("%Y-01-01"), time.strftime("%Y-12-31"))
+    return [
+        ("common word", "coffee", (None, None, None, None)),
+        ("short prefix", "co", (None, None, None, None)),
+        ("word prefix", "cof", (None, None, None, None)),
+        ("rare word", "laundry", (None, None, None, None)),
+        ("two words", f"coffee {merchants[0][:3]}", (None, None, None, None)),
+        ("no match", "zzzz", (None, None, None, None)),
+        ("last 30 days", "coffee", ("month", None, None, None)),
+        ("date range", "coffee", (None, *year, None)),
+        ("category", "coffee", (None, None, None, category_id)),
+        ("range+category", "coffee", (None, *year, category_id)),
+    ]
+
+
+def timed(function, rounds):
+    samples = []
+    for _ in range(rounds + 1):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    # The first run only warms the caches up.
+    return statistics.median(samples[1:]), result
+
+
+def run_case(expense_app, conn, user_id, query, filters, page_size, rounds):
+    filter_type, from_date, to_date, category_id = filters
+    terms = expense_app.search_terms(query)
+    where_clause, params, _ = expense_app.build_expense_filters(
+        user_id, filter_type, from_date, to_date, category_id, terms
+    )
+    page_ms, (rows, _, _) = timed(
+        lambda: expense_app.fetch_search_page(
+            conn, user_id, where_clause, params, terms, page_size
+        ),
+        rounds,
+    )
+    totals_ms, (_, count) = timed(
+        lambda: expense_app.expense_totals(
+            conn, user_id, filter_type, from_date, to_date, where_clause, params, narrowed=True
+        ),
+        rounds,
+    )
+    return {
+        "page_p50_ms": round(page_ms, 3),
+        "totals_p50_ms": round(totals_ms, 3),
+        "matches": count,
+        "first": rows[0]["item"] if rows else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expense search benchmark.")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--expenses", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--merchants", type=int, default=3000)
+    parser.add_argument("--user-ids", default="1,100", help="Who searches; 1 owns the most rows.")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    backend = "postgres" if args.postgres_url else "sqlite"
+    expense_app = load_app(
+        backend,
+        sqlite_path=os.path.join(tempfile.mkdtemp(), "search.db"),
+        postgres_url=args.postgres_url,
+    )
+    expense_app.init_db()
+    rng = random.Random(1)
+    merchants = [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(args.merchants)
+    ]
+    summary = populate(
+        expense_app,
+        users=args.users,
+        expenses_per_user=args.expenses // args.users,
+        make_item=item_maker(merchants),
+    )
+    print(f"{backend}: {summary['expenses']} expenses in {summary['seconds']} s")
+
+    report = {"benchmark": "search", "backend": backend, "params": vars(args), "results": []}
+    with expense_app.app.app_context():
+        conn = expense_app.get_db_connection()
+        category_id = expense_app.get_categories(conn)[0]["id"]
+        for user_id in [int(value) for value in args.user_ids.split(",")]:
+            rows = conn.execute(
+                "SELECT COUNT(*) AS count FROM expenses WHERE user_id = ?", (user_id,)
+            ).fetchone()["count"]
+            for case, query, filters in cases(merchants, category_id):
+                stats = run_case(
+                    expense_app, conn, user_id, query, filters, args.page_size, args.rounds
+                )
+                stats.update(user_id=user_id, user_rows=rows, case=case, query=query)
+                report["results"].append(stats)
+                print(
+                    f"user {user_id:<4} ({rows:>6} rows) {case:15} {query!r:16} "
+                    f"page {stats['page_p50_ms']:8.3f} ms  totals {stats['totals_p50_ms']:8.3f} ms  "
+                    f"matches {stats['matches']:>6}  first {stats['first']!r}"
+                )
+        conn.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
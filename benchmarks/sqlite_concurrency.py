@@ -0,0 +1,141 @@
+"""Concurrent reads and writes on SQLite, per SQLITE_PROFILE.
+
+Forks reader processes (GET /dashboard?filter=year) and writer processes
+(POST / to add an expense), the way gunicorn workers share one database file,
+and reports throughput, read latency and failed requests ("database is
+locked") with readers alone and with writers running:
+
+    python benchmarks/sqlite_concurrency.py [--readers 4] [--writers 2] [--seconds 5] [--json out.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from datagen import load_app, populate, reset_sqlite
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def worker(expense_app, role, user_id, start_at, seconds, results):
+    expense_app.app.logger.disabled = True
+    client = expense_app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["user_name"] = f"Bench User {user_id}"
+    latencies, errors, count = [], 0, 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        started = time.perf_counter()
+        if role == "writer":
+            response = client.post(
+                "/",
+                data={
+                    "date": time.strftime("%Y-%m-%d"),
+                    "item": f"bench {count}",
+                    "category_id": 1,
+                    "amount": "9.99",
+                },
+            )
+            ok = response.status_code == 302
+        else:
+            response = client.get("/dashboard?filter=year")
+            ok = response.status_code == 200
+        count += 1
+        if ok:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+    results.put({"role": role, "latencies": latencies, "errors": errors})
+
+
+def run_phase(expense_app, readers, writers, seconds):
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    start_at = time.time() + 0.5
+    processes = [
+        context.Process(target=worker, args=(expense_app, "reader", 1, start_at, seconds, results))
+        for _ in range(readers)
+    ] + [
+        context.Process(
+            target=worker, args=(expense_app, "writer", 2 + i, start_at, seconds, results)
+        )
+        for i in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ("reader", "writer"):
+        runs = [run for run in collected if run["role"] == role]
+        if not runs:
+            continue
+        latencies = [value for run in runs for value in run["latencies"]]
+        summary[role] = {
+            "ok_per_second": round(len(latencies) / seconds, 1),
+            "errors": sum(run["errors"] for run in runs),
+            "p50_ms": round(percentile(latencies, 50) or 0, 2),
+            "p95_ms": round(percentile(latencies, 95) or 0, 2),
+            "max_ms": round(max(latencies), 2) if latencies else None,
+            "mean_ms": round(statistics.mean(latencies), 2) if latencies else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite read/write concurrency benchmark.")
+    parser.add_argument("--profiles", default="default,tuned")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    expense_app = load_app("sqlite", sqlite_path=os.path.join(workdir, "unused.db"))
+    report = {"benchmark": "sqlite_concurrency", "params": vars(args), "profiles": {}}
+    for profile in args.profiles.split(","):
+        path = os.path.join(workdir, f"{profile}.db")
+        reset_sqlite(path)
+        expense_app.DB_NAME = path
+        expense_app.SQLITE_PROFILE = profile
+        # Drop the parent's pool so the profile applies to fresh connections.
+        expense_app._pool = None
+        expense_app.init_db()
+        populate(expense_app, users=1 + args.writers, expenses_per_user=args.expenses // (1 + args.writers))
+        expense_app.get_pool().close_all()
+
+        phases = {
+            "reads_only": run_phase(expense_app, args.readers, 0, args.seconds),
+            "reads_with_writes": run_phase(expense_app, args.readers, args.writers, args.seconds),
+        }
+        report["profiles"][profile] = phases
+        for phase, roles in phases.items():
+            for role, stats in roles.items():
+                print(
+                    f"{profile:8} {phase:18} {role:7} {stats['ok_per_second']:8.1f} ok/s "
+                    f"p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  "
+                    f"errors {stats['errors']}"
+                )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
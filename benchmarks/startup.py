@@ -0,0 +1,193 @@
+"""Cold start and per-worker memory, with and without gunicorn --preload.
+
+Imports the app in fresh interpreters (import time, RSS and which optional
+drivers got loaded), then starts gunicorn sync workers both ways, warms every
+worker up and reads its memory from /proc/<pid>/smaps_rollup. PSS and USS
+(private pages) show what a worker really costs once pages are shared with
+the parent it was forked from:
+
+    python benchmarks/startup.py [--workers 4] [--imports 5] [--json out.json]
+    python benchmarks/startup.py --postgres-url postgresql://localhost/bench
+
+Linux only; needs gunicorn.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datagen import ROOT, load_app, populate
+
+PORT = 8766
+DRIVERS = ["psycopg2", "psycopg", "bcrypt", "a2wsgi"]
+PATHS = ["/dashboard", "/expenses", "/health/db"]
+IMPORT_PROBE = f"""
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+status = open("/proc/self/status").read()
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "rss_kb": int(status.split("VmRSS:")[1].split()[0]),
+    "drivers": [name for name in {DRIVERS!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_imports(count, workdir):
+    runs = []
+    for _ in range(count):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=workdir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        run = json.loads(output.splitlines()[-1])
+        run["process_ms"] = (time.perf_counter() - started) * 1000
+        runs.append(run)
+    return {
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "process_ms": round(statistics.median(run["process_ms"] for run in runs), 1),
+        "rss_mb": round(statistics.median(run["rss_kb"] for run in runs) / 1024, 1),
+        "drivers": runs[-1]["drivers"],
+    }
+
+
+def smaps(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "uss": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def worker_pids(master):
+    with open(f"/proc/{master}/task/{master}/children", encoding="utf-8") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def get(path, cookie):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=10)
+    try:
+        conn.request("GET", path, headers={"Cookie": f"session={cookie}"} if cookie else {})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def measure_gunicorn(preload, args, cookie, workdir):
+    command = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--pythonpath", ROOT,
+        "--workers", str(args.workers),
+        "--bind", f"127.0.0.1:{PORT}",
+        "--log-level", "warning",
+    ]
+    if preload:
+        command.append("--preload")
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=workdir)
+    try:
+        while True:
+            try:
+                if get("/login", None) == 200:
+                    break
+            except OSError:
+                pass
+            if time.perf_counter() - started > 60:
+                raise SystemExit("gunicorn did not start")
+            time.sleep(0.01)
+        ready_ms = (time.perf_counter() - started) * 1000
+        # New connection per request, so the kernel spreads them over workers.
+        for index in range(args.workers * 40):
+            status = get(PATHS[index % len(PATHS)], cookie)
+            if status != 200:
+                raise SystemExit(f"{PATHS[index % len(PATHS)]} returned {status}")
+        workers = [smaps(pid) for pid in worker_pids(server.pid)]
+        master = smaps(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    def mean_mb(key):
+        return round(statistics.mean(worker[key] for worker in workers) / 1024, 1)
+
+    return {
+        "ready_ms": round(ready_ms, 1),
+        "worker_rss_mb": mean_mb("rss"),
+        "worker_pss_mb": mean_mb("pss"),
+        "worker_uss_mb": mean_mb("uss"),
+        "master_rss_mb": round(master["rss"] / 1024, 1),
+        "total_pss_mb": round(
+            (sum(worker["pss"] for worker in workers) + master["pss"]) / 1024, 1
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and worker memory benchmark.")
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--imports", type=int, default=5, help="Fresh interpreters to time.")
+    parser.add_argument("--expenses", type=int, default=2000)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    # Servers inherit the environment: same secret (for the session cookie),
+    # same database.
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    workdir = tempfile.mkdtemp()
+    backend = "postgres" if args.postgres_url else "sqlite"
+    expense_app = load_app(
+        backend,
+        sqlite_path=os.path.join(workdir, "database.db"),
+        postgres_url=args.postgres_url,
+    )
+    expense_app.init_db()
+    populate(expense_app, users=1, expenses_per_user=args.expenses)
+    expense_app.get_pool().close_all()
+    cookie = expense_app.app.session_interface.get_signing_serializer(expense_app.app).dumps(
+        {"user_id": 1, "user_name": "Bench User 1"}
+    )
+
+    report = {"benchmark": "startup", "backend": backend, "params": vars(args)}
+    report["import"] = measure_imports(args.imports, workdir)
+    stats = report["import"]
+    print(
+        f"{backend:8} import {stats['import_ms']:7.1f} ms  process {stats['process_ms']:7.1f} ms  "
+        f"rss {stats['rss_mb']:6.1f} MB  drivers {','.join(stats['drivers']) or '-'}"
+    )
+    for preload in (False, True):
+        mode = "preload" if preload else "no-preload"
+        stats = report[mode] = measure_gunicorn(preload, args, cookie, workdir)
+        print(
+            f"{backend:8} {mode:10} ready {stats['ready_ms']:7.1f} ms  worker rss "
+            f"{stats['worker_rss_mb']:6.1f} MB  pss {stats['worker_pss_mb']:6.1f} MB  "
+            f"uss {stats['worker_uss_mb']:6.1f} MB  total pss {stats['total_pss_mb']:6.1f} MB"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
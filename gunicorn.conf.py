@@ -0,0 +1,14 @@
+# Read by gunicorn when started from this directory (Procfile `web`).
+
+# Import the app, and on Postgres its driver, once in the master; workers
+# fork from it and share those pages instead of each importing everything.
+# Code changes then need a restart rather than a HUP.
+preload_app = True
+
+
+def post_worker_init(worker):
+    # Background email delivery starts in each worker (OUTBOX_WORKER=thread),
+    # so messages left pending by a restart are sent without new traffic.
+    from app import outbox_worker
+
+    outbox_worker.start()
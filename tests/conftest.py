@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# app reads its configuration at import time: SQLite, no background workers.
+os.environ.pop("DATABASE_URL", None)
+os.environ.setdefault("DASHBOARD_CACHE", "off")
+os.environ.setdefault("OUTBOX_WORKER", "off")
+
+import app as expense_app  # noqa: E402
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """The app module on a fresh, fully migrated SQLite database."""
+    monkeypatch.setattr(expense_app, "DB_NAME", str(tmp_path / "expenses.db"))
+    monkeypatch.setattr(expense_app, "_pool", None)
+    expense_app.category_catalog.invalidate()
+    expense_app.init_db()
+    yield expense_app
+    expense_app.get_pool().close_all()
+    expense_app.category_catalog.invalidate()
+
+
+@pytest.fixture
+def conn(app_module):
+    with app_module.app.app_context():
+        conn = app_module.get_db_connection()
+        yield conn
+        conn.close()
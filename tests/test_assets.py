@@ -0,0 +1,71 @@
+import urllib.error
+
+import pytest
+
+
+@pytest.fixture
+def static_dir(app_module, tmp_path, monkeypatch):
+    # A copy of static/ without the vendored files, and no build.
+    folder = tmp_path / "static"
+    (folder / "vendor").mkdir(parents=True)
+    (folder / "style.css").write_text("body { color: black; }\n")
+    (folder / "vendor" / "fonts.css").write_text(
+        '@font-face { src: url("fonts/sora-latin-600-normal.woff2"); }\n'
+    )
+    monkeypatch.setattr(app_module.app, "static_folder", str(folder))
+    monkeypatch.setattr(app_module, "_asset_manifest", None)
+    yield folder
+    app_module._asset_manifest = None
+
+
+def vendor(folder, names):
+    for name in names:
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"vendored")
+
+
+def asset_url(app_module, name):
+    with app_module.app.test_request_context():
+        return app_module.asset_url(name)
+
+
+def test_upstream_until_vendored(app_module, static_dir):
+    assert asset_url(app_module, "vendor/chart.umd.js").startswith("https://cdn.jsdelivr.net/")
+    assert asset_url(app_module, "vendor/fonts.css").startswith("https://fonts.googleapis.com/")
+    assert asset_url(app_module, "style.css") == "/static/style.css"
+
+    vendor(static_dir, app_module.VENDOR_ASSETS)
+    assert asset_url(app_module, "vendor/chart.umd.js") == "/static/vendor/chart.umd.js"
+    assert asset_url(app_module, "vendor/fonts.css") == "/static/vendor/fonts.css"
+
+
+def test_fonts_need_every_file(app_module, static_dir):
+    fonts = [name for name in app_module.VENDOR_ASSETS if name.startswith("vendor/fonts/")]
+    vendor(static_dir, fonts[:-1])
+    assert asset_url(app_module, "vendor/fonts.css").startswith("https://fonts.googleapis.com/")
+
+
+def test_build_fails_without_vendored_files(app_module, static_dir, monkeypatch):
+    def offline(url, timeout=None):
+        raise urllib.error.URLError("no network")
+
+    monkeypatch.setattr(app_module.urllib.request, "urlopen", offline)
+    result = app_module.app.test_cli_runner().invoke(args=["assets-build"])
+    assert result.exit_code != 0
+    assert "Could not fetch vendored assets" in result.output
+    assert not (static_dir / "build" / "manifest.json").exists()
+
+
+def test_build_serves_vendored_files_locally(app_module, static_dir):
+    vendor(static_dir, app_module.VENDOR_ASSETS)
+    result = app_module.app.test_cli_runner().invoke(args=["assets-build"])
+    assert result.exit_code == 0, result.output
+
+    chart = asset_url(app_module, "vendor/chart.umd.js")
+    assert chart.startswith("/assets/vendor/chart.umd.")
+    fonts_css = asset_url(app_module, "vendor/fonts.css")
+    client = app_module.app.test_client()
+    body = client.get(fonts_css).get_data(as_text=True)
+    assert 'url("fonts/sora-latin-600-normal.' in body
+    assert client.get(chart).status_code == 200
@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+CHART_KEYS = {
+    "labels",
+    "values",
+    "months",
+    "monthly_totals",
+    "category_month_labels",
+    "category_datasets",
+}
+
+
+@pytest.fixture
+def user_id(app_module, conn):
+    conn.execute(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        ("Dash", "dash@example.com", "x"),
+    )
+    conn.commit()
+    user_id = conn.execute("SELECT id FROM users").fetchone()["id"]
+    text = "date,item,category,amount\n" + "".join(
+        f"2024-0{month}-1{day},item {day},{category},{day}.50\n"
+        for month in (1, 2)
+        for day in range(5)
+        for category in ("Food", "Travel")
+    )
+    app_module.import_expenses_csv(conn, user_id, io.StringIO(text))
+    return user_id
+
+
+@pytest.fixture
+def builds(app_module, monkeypatch):
+    # The sections each request asks build_dashboard_context for.
+    recorded = []
+    build = app_module.build_dashboard_context
+
+    def record(*args):
+        recorded.append(args[6])
+        return build(*args)
+
+    monkeypatch.setattr(app_module, "build_dashboard_context", record)
+    return recorded
+
+
+@pytest.mark.parametrize("filters", [(None, None, None), (None, "2024-01-01", "2024-02-28")])
+def test_sections_add_up_to_full_context(app_module, conn, user_id, filters):
+    full = app_module.build_dashboard_context(conn, user_id, *filters)
+    cards = app_module.build_dashboard_context(conn, user_id, *filters, None, ("cards",))
+    charts = app_module.build_dashboard_context(conn, user_id, *filters, None, ("charts",))
+    assert set(charts) == CHART_KEYS
+    assert not set(cards) & CHART_KEYS
+    assert {**cards, **charts} == full
+
+
+def test_page_and_chart_request_each_build_their_half(app_module, user_id, builds):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+
+    page = client.get("/dashboard?filter=year")
+    assert page.status_code == 200
+    assert b"part=charts" in page.data
+    charts = client.get("/api/v1/dashboard?part=charts&filter=year")
+    assert charts.status_code == 200
+    assert set(charts.get_json()) == CHART_KEYS
+    assert builds == [("cards",), ("charts",)]
+
+    # The other halves are cached separately and validated separately.
+    cards = client.get("/api/v1/dashboard?part=cards&filter=year")
+    assert not set(cards.get_json()) & CHART_KEYS
+    assert cards.headers["ETag"] != charts.headers["ETag"]
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+
+def make_user(conn):
+    conn.execute(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        ("Importer", "importer@example.com", "x"),
+    )
+    conn.commit()
+    return conn.execute("SELECT id FROM users").fetchone()["id"]
+
+
+def csv_text(count, start=1):
+    rows = [f"2024-01-{day % 28 + 1:02d},item {day},Food,{day}.50" for day in range(start, start + count)]
+    return "\n".join(rows) + "\n"
+
+
+def expense_count(conn, user_id):
+    return conn.execute(
+        "SELECT COUNT(*) AS count FROM expenses WHERE user_id = ?", (user_id,)
+    ).fetchone()["count"]
+
+
+def test_import_skips_invalid_rows(app_module, conn):
+    user_id = make_user(conn)
+    text = "date,item,category,amount\n" + csv_text(3) + "not a date,x,Food,1\n2024-01-01,y,Food,-2\n"
+    result = app_module.import_expenses_csv(conn, user_id, io.StringIO(text), batch_size=2)
+    assert result["imported"] == 3
+    assert [error["line"] for error in result["errors"]] == [5, 6]
+    assert expense_count(conn, user_id) == 3
+
+
+def test_unreadable_row_keeps_rows_before_it(app_module, conn):
+    user_id = make_user(conn)
+    huge = "x" * 200000  # over csv.field_size_limit()
+    text = "date,item,category,amount\n" + csv_text(5) + f"2024-01-01,{huge},Food,1\n" + csv_text(5, 6)
+    with pytest.raises(app_module.ImportInterrupted) as info:
+        app_module.import_expenses_csv(conn, user_id, io.StringIO(text), batch_size=2)
+    # Lines 2-6 are the five good rows; every one of them is committed, so
+    # the file can be resumed after the reported line.
+    assert info.value.line == 6
+    assert info.value.result["imported"] == 5
+    assert expense_count(conn, user_id) == 5
+
+
+def test_undecodable_bytes_report_progress(app_module, conn):
+    user_id = make_user(conn)
+    data = ("date,item,category,amount\n" + csv_text(2000)).encode() + b"2024-01-01,caf\xe9,Food,1\n"
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    with pytest.raises(app_module.ImportInterrupted) as info:
+        app_module.import_expenses_csv(conn, user_id, stream, batch_size=500)
+    imported = info.value.result["imported"]
+    # The decoder reads ahead, so it may stop a little before the bad line.
+    assert 0 < imported <= 2000
+    assert imported == info.value.line - 1
+    assert expense_count(conn, user_id) == imported
+
+
+def test_import_view_reports_imported_rows(app_module, conn):
+    user_id = make_user(conn)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+    text = "date,item,category,amount\n" + csv_text(3) + "2024-01-01," + "x" * 200000 + ",Food,1\n"
+    response = client.post(
+        "/expenses/import",
+        data={"file": (io.BytesIO(text.encode()), "expenses.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    assert b"Import stopped after line 4" in response.data
+    assert b"3 expense(s) up to that line were imported" in response.data
+    assert expense_count(conn, user_id) == 3
@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+
+def plan(conn, query, params):
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return " | ".join(row["detail"] for row in rows)
+
+
+def uses_index(detail, index):
+    return re.search(rf"USING (COVERING )?INDEX {index}\b", detail) is not None
+
+
+def test_migrations_recorded_in_order(app_module, conn):
+    rows = conn.execute(
+        "SELECT version, description FROM schema_version ORDER BY version"
+    ).fetchall()
+    assert [(row["version"], row["description"]) for row in rows] == [
+        (version, description) for version, description, _ in app_module.MIGRATIONS
+    ]
+    assert [row["version"] for row in rows] == list(range(1, len(rows) + 1))
+
+
+def test_migrations_are_idempotent(app_module, conn):
+    app_module.run_migrations(conn)
+    app_module.init_db()
+    count = conn.execute("SELECT COUNT(*) AS count FROM schema_version").fetchone()["count"]
+    assert count == len(app_module.MIGRATIONS)
+
+
+def test_indexes_created(conn):
+    names = {
+        row["name"]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+    }
+    assert {
+        "idx_expenses_user_date",
+        "idx_expenses_user_category_date",
+        "idx_expenses_category",
+        "idx_reset_tokens_user_used",
+    } <= names
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        ("week", None, None),
+        ("month", None, None),
+        ("year", None, None),
+        (None, "2024-01-01", "2024-03-31"),
+    ],
+)
+def test_dashboard_queries_use_user_date_index(app_module, conn, filters):
+    for kind, query, params in app_module.dashboard_queries(1, *filters):
+        detail = plan(conn, query, params)
+        if kind in ("this_month", "last_month"):
+            assert "expense_rollup" in detail
+        else:
+            assert uses_index(detail, "idx_expenses_user_date"), (kind, detail)
+
+
+def test_reset_token_invalidation_uses_index(conn):
+    # The statement _store_reset_token runs before issuing a new token.
+    detail = plan(
+        conn,
+        "UPDATE password_reset_tokens SET used_at = ? WHERE user_id = ? AND used_at IS NULL",
+        ["2024-01-01 00:00:00", 1],
+    )
+    assert uses_index(detail, "idx_reset_tokens_user_used"), detail
+    assert "(user_id=? AND used_at=?)" in detail
+
+
+def test_unfiltered_dashboard_reads_rollup(app_module, conn):
+    kind, query, params = app_module.dashboard_queries(1, None, None, None)[0]
+    assert kind == "groups"
+    detail = plan(conn, query, params)
+    assert "expense_rollup" in detail and "expenses " not in detail
+
+
+@pytest.mark.parametrize(
+    "filters, index",
+    [
+        (("week", None, None, None), "idx_expenses_user_date"),
+        (("year", None, None, None), "idx_expenses_user_date"),
+        ((None, "2024-01-01", "2024-03-31", None), "idx_expenses_user_date"),
+        ((None, None, None, None), "idx_expenses_user_date"),
+        (("month", None, None, 3), "idx_expenses_user_category_date"),
+        ((None, None, None, 3), "idx_expenses_user_category_date"),
+    ],
+)
+def test_expense_list_uses_indexes(app_module, conn, filters, index):
+    where_clause, params, _ = app_module.build_expense_filters(1, *filters)
+    page = f"""
+        SELECT expenses.id FROM expenses {where_clause}
+        ORDER BY expenses.date DESC, expenses.id DESC LIMIT ?
+    """
+    detail = plan(conn, page, params + [51])
+    assert uses_index(detail, index), detail
+    # Keyset order comes from the index, not a sort of the user's rows.
+    assert "USE TEMP B-TREE FOR ORDER BY" not in detail
+
+    # expense_totals reads the rollup when there is no filter at all.
+    if filters != (None, None, None, None):
+        totals = f"SELECT SUM(expenses.amount), COUNT(*) FROM expenses {where_clause}"
+        assert uses_index(plan(conn, totals, params), index)
+
+
+def test_category_usage_uses_category_index(conn):
+    detail = plan(conn, "SELECT 1 FROM expenses WHERE category_id = ? LIMIT 1", [3])
+    assert "idx_expenses_category" in detail
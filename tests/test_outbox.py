@@ -0,0 +1,229 @@
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from email import message_from_bytes
+
+import pytest
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, QUIT.
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost test SMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("MAIL FROM"):
+                recipients = []
+                self.reply("250 OK")
+            elif command.startswith("RCPT TO"):
+                recipients.append(line.decode().split(":", 1)[1].strip(" <>\r\n"))
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in iter(self.rfile.readline, b".\r\n"):
+                    data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                self.server.messages.append((recipients, message_from_bytes(b"".join(data))))
+                self.reply("250 OK queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_transport(app_module, smtp_server):
+    return app_module.SMTPTransport(
+        "127.0.0.1", smtp_server.server_address[1], sender="noreply@example.com", starttls=False
+    )
+
+
+@pytest.fixture
+def failing_transport(app_module):
+    # Nothing listens on a port we just released: connection refused.
+    with socketserver.TCPServer(("127.0.0.1", 0), socketserver.BaseRequestHandler) as closed:
+        port = closed.server_address[1]
+    return app_module.SMTPTransport("127.0.0.1", port, starttls=False, timeout=2)
+
+
+def make_user(conn):
+    conn.execute(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        ("Resetter", "resetter@example.com", "x"),
+    )
+    conn.commit()
+    return conn.execute("SELECT id FROM users").fetchone()["id"]
+
+
+def outbox(conn):
+    conn.commit()  # end any read transaction so other connections' writes show
+    return conn.execute("SELECT * FROM email_outbox ORDER BY id").fetchall()
+
+
+def queue_reset(app_module, conn, expires_in=timedelta(minutes=15)):
+    user_id = make_user(conn)
+    now = datetime.utcnow()
+    app_module._store_reset_token(
+        user_id,
+        "hash",
+        now + expires_in,
+        now,
+        email=app_module._reset_email("resetter@example.com", "https://example.test/reset/abc"),
+    )
+    return user_id
+
+
+def test_reset_email_queued_with_token(app_module, conn):
+    queue_reset(app_module, conn)
+    rows = outbox(conn)
+    assert len(rows) == 1
+    assert rows[0]["status"] == "pending"
+    assert rows[0]["to_email"] == "resetter@example.com"
+    assert "https://example.test/reset/abc" in rows[0]["body"]
+    assert conn.execute("SELECT COUNT(*) AS count FROM password_reset_tokens").fetchone()["count"] == 1
+
+
+def test_reset_token_rolled_back_with_email(app_module, conn, monkeypatch):
+    def broken_enqueue(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+
+    def reset_request(errors):
+        # Its own thread and app context, like a request: the connection is
+        # released (and the open transaction rolled back) at teardown.
+        with app_module.app.app_context():
+            try:
+                queue_reset(app_module, app_module.get_db_connection())
+            except RuntimeError as exc:
+                errors.append(exc)
+
+    monkeypatch.setattr(app_module, "enqueue_email", broken_enqueue)
+    errors = []
+    thread = threading.Thread(target=reset_request, args=(errors,))
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    assert conn.execute("SELECT COUNT(*) AS count FROM password_reset_tokens").fetchone()["count"] == 0
+    assert outbox(conn) == []
+
+
+def test_forgot_password_queues_email(app_module, conn):
+    make_user(conn)
+    response = app_module.app.test_client().post(
+        "/forgot-password", data={"email": "resetter@example.com"}
+    )
+    assert response.status_code == 200
+    rows = outbox(conn)
+    assert [row["to_email"] for row in rows] == ["resetter@example.com"]
+    assert "/reset-password/" in rows[0]["body"]
+
+
+def test_delivers_over_smtp(app_module, conn, smtp_server, smtp_transport):
+    queue_reset(app_module, conn)
+    assert app_module.process_outbox(smtp_transport) == 1
+
+    [(recipients, message)] = smtp_server.messages
+    assert recipients == ["resetter@example.com"]
+    assert message["Subject"] == "Reset your Expense Tracker password"
+    assert "https://example.test/reset/abc" in message.get_payload()
+    [row] = outbox(conn)
+    assert (row["status"], row["attempts"], row["body"]) == ("sent", 1, "")
+    assert row["sent_at"] is not None
+
+
+def test_failed_delivery_backs_off(app_module, conn, monkeypatch, failing_transport):
+    monkeypatch.setattr(app_module, "OUTBOX_BACKOFF_BASE", 60)
+    queue_reset(app_module, conn)
+    before = datetime.utcnow()
+    assert app_module.process_outbox(failing_transport) == 1
+
+    [row] = outbox(conn)
+    assert (row["status"], row["attempts"]) == ("pending", 1)
+    assert row["last_error"]
+    retry_at = app_module._parse_db_datetime(row["next_attempt_at"])
+    # First retry after 60 s with +-50% jitter.
+    assert before + timedelta(seconds=29) <= retry_at <= before + timedelta(seconds=91)
+    # Not due yet: the next pass leaves it alone.
+    assert app_module.process_outbox(failing_transport) == 0
+
+
+def test_backoff_doubles_up_to_the_cap(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "OUTBOX_BACKOFF_BASE", 10)
+    monkeypatch.setattr(app_module, "OUTBOX_BACKOFF_MAX", 60)
+    for attempts, delay in [(1, 10), (2, 20), (3, 40), (4, 60), (8, 60)]:
+        assert delay * 0.5 <= app_module._outbox_backoff(attempts) <= delay * 1.5
+
+
+def test_dead_letter_after_max_attempts(app_module, conn, monkeypatch, failing_transport):
+    monkeypatch.setattr(app_module, "OUTBOX_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(app_module, "OUTBOX_BACKOFF_BASE", 0)
+    queue_reset(app_module, conn)
+    for attempt in range(1, 4):
+        assert app_module.process_outbox(failing_transport) == 1
+        [row] = outbox(conn)
+        assert row["attempts"] == attempt
+    assert row["status"] == "dead"
+    assert row["last_error"]
+    assert app_module.process_outbox(failing_transport) == 0
+
+
+def test_expired_message_is_not_sent(app_module, conn, smtp_server, smtp_transport):
+    queue_reset(app_module, conn, expires_in=timedelta(seconds=-1))
+    assert app_module.process_outbox(smtp_transport) == 1
+
+    assert smtp_server.messages == []
+    [row] = outbox(conn)
+    assert (row["status"], row["last_error"], row["body"]) == (
+        "dead",
+        "expired before delivery",
+        "",
+    )
+
+
+def test_worker_thread_drains_pending_rows_on_start(
+    app_module, conn, monkeypatch, smtp_server, smtp_transport
+):
+    # Rows left pending by a previous process go out when the thread starts,
+    # without a wake() from a new enqueue.
+    queue_reset(app_module, conn)
+    monkeypatch.setattr(app_module, "OUTBOX_WORKER", "thread")
+    monkeypatch.setattr(app_module, "get_email_transport", lambda: smtp_transport)
+    worker = app_module.OutboxWorker(poll_interval=3600)
+    monkeypatch.setattr(app_module, "outbox_worker", worker)
+
+    app_module.app.test_client().get("/login")
+    deadline = time.monotonic() + 10
+    while not smtp_server.messages and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(smtp_server.messages) == 1
+    assert worker._thread.name == "email-outbox"
+
+
+def test_worker_thread_off(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "OUTBOX_WORKER", "off")
+    worker = app_module.OutboxWorker(poll_interval=3600)
+    worker.start()
+    worker.wake()
+    assert worker._thread is None
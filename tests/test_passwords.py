@@ -0,0 +1,36 @@
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+
+def test_rehash_stored_off_the_executor_thread(app_module, conn, monkeypatch):
+    monkeypatch.setattr(app_module, "BCRYPT_ROUNDS", 4)
+    legacy = generate_password_hash("secret")
+    conn.execute(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+        ("Legacy", "legacy@example.com", legacy),
+    )
+    conn.commit()
+    user_id = conn.execute("SELECT id FROM users").fetchone()["id"]
+
+    writers = []
+    get_db_connection = app_module.get_db_connection
+
+    def recording_connection():
+        writers.append(threading.current_thread().name)
+        return get_db_connection()
+
+    monkeypatch.setattr(app_module, "get_db_connection", recording_connection)
+    app_module._rehash_in_background(user_id, legacy, "secret")
+
+    deadline = time.monotonic() + 30
+    stored = legacy
+    while stored == legacy and time.monotonic() < deadline:
+        time.sleep(0.05)
+        stored = conn.execute("SELECT password FROM users WHERE id = ?", (user_id,)).fetchone()[
+            "password"
+        ]
+    assert stored.startswith("$2b$04$")
+    assert app_module._check_password(stored, "secret")
+    assert writers and all(name.startswith("password-rehash") for name in writers)
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+SLOW_ROWS = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 20)
+    SELECT slow(i) AS i FROM n
+"""
+
+
+@pytest.fixture
+def timings(app_module, conn, monkeypatch):
+    # Each row costs 10 ms inside SQLite, i.e. while it is being stepped.
+    conn.conn.create_function("slow", 1, lambda value: time.sleep(0.01) or value)
+    recorded = []
+    monkeypatch.setattr(
+        app_module,
+        "QUERY_HOOKS",
+        [lambda conn, query, params, seconds: recorded.append((query, seconds))],
+    )
+    return recorded
+
+
+def test_fetch_time_is_counted(conn, timings):
+    cursor = conn.execute(SLOW_ROWS)
+    # execute() only steps to the first row; the rest runs in fetchall().
+    assert timings == []
+    assert len(cursor.fetchall()) == 20
+    [(query, seconds)] = timings
+    assert query == SLOW_ROWS
+    assert seconds >= 0.19
+
+
+def test_iteration_and_fetchmany(conn, timings):
+    assert sum(1 for _ in conn.execute(SLOW_ROWS)) == 20
+    cursor = conn.execute(SLOW_ROWS)
+    while cursor.fetchmany(7):
+        pass
+    assert [seconds >= 0.19 for _, seconds in timings] == [True, True]
+
+
+def test_reported_when_connection_moves_on(conn, timings):
+    assert conn.execute(SLOW_ROWS).fetchone()["i"] == 1
+    assert timings == []
+    conn.execute("SELECT 1").fetchall()
+    assert [query for query, _ in timings] == [SLOW_ROWS, "SELECT 1"]
+
+    conn.execute(SLOW_ROWS)
+    conn.commit()
+    assert len(timings) == 3
+
+
+def test_statements_without_rows_report_at_once(conn, timings):
+    conn.execute("INSERT INTO categories (name) VALUES (?)", ["Timing"])
+    assert [query for query, _ in timings] == ["INSERT INTO categories (name) VALUES (?)"]
+    conn.rollback()
+
+
+def test_stream_counts_fetches_only(conn, timings):
+    rows = conn.stream(SLOW_ROWS, batch_size=5)
+    next(rows)
+    time.sleep(0.3)  # the consumer's own time is not the query's
+    assert sum(1 for _ in rows) == 19
+    [(_, seconds)] = timings
+    assert 0.19 <= seconds < 0.45
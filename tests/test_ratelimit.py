@@ -0,0 +1,85 @@
+import pytest
+
+
+@pytest.fixture
+def clock(app_module, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def drain(store, key, capacity, rate):
+    for _ in range(int(capacity)):
+        assert store.take(key, capacity, rate) == 0
+
+
+def test_sweep_keeps_buckets_of_slower_limits(app_module, clock):
+    store = app_module.MemoryBucketStore(sweep_interval=60)
+    login = app_module._parse_rate("20/60")
+    reset = app_module._parse_rate("3/900")
+    drain(store, "reset_email:a@example.com", *reset)
+
+    # A login after the sweep interval triggers the sweep; a minute only
+    # refills a fifth of a reset token, so that bucket must survive it.
+    clock[0] += 61
+    assert store.take("login_ip:127.0.0.1", *login) == 0
+    assert store.size() == 2
+    assert store.take("reset_email:a@example.com", *reset) > 0
+
+
+def test_sweep_drops_refilled_buckets(app_module, clock):
+    store = app_module.MemoryBucketStore(sweep_interval=60)
+    login = app_module._parse_rate("20/60")
+    reset = app_module._parse_rate("3/900")
+    drain(store, "reset_email:a@example.com", *reset)
+    drain(store, "login_email:a@example.com", *login)
+
+    clock[0] += 120
+    store.take("login_ip:127.0.0.1", *login)
+    assert store.size() == 2  # the reset bucket and the new login_ip one
+
+    clock[0] += 900
+    store.take("login_ip:127.0.0.1", *login)
+    assert store.size() == 1
+
+
+def test_rate_limiter_checks_each_limit(app_module, clock):
+    limiter = app_module.RateLimiter(
+        app_module.MemoryBucketStore(), {"login_ip": "2/60", "login_email": "5/60"}
+    )
+    checks = (("login_ip", "10.0.0.1"), ("login_email", "a@example.com"))
+    assert limiter.check(*checks) == 0
+    assert limiter.check(*checks) == 0
+    assert limiter.check(*checks) == pytest.approx(30)
+    assert limiter.check(("login_ip", "10.0.0.2"), ("login_email", "a@example.com")) == 0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_spoofed_forwarded_for_does_not_reset_limit(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "RATE_LIMIT_TRUST_PROXY", 1)
+    monkeypatch.setattr(
+        app_module,
+        "rate_limiter",
+        app_module.RateLimiter(
+            app_module.MemoryBucketStore(),
+            dict(app_module.RATE_LIMITS, login_ip="3/60", login_email="100/60"),
+        ),
+    )
+    client = app_module.app.test_client()
+
+    def login(number):
+        # The router appends the address it saw; the rest is the client's.
+        return client.post(
+            "/login",
+            data={"email": f"user{number}@example.com", "password": "wrong"},
+            headers={"X-Forwarded-For": f"10.0.0.{number}, 203.0.113.7"},
+        )
+
+    assert [login(n).status_code for n in range(3)] == [200, 200, 200]
+    assert login(3).status_code == 429
+    response = client.post(
+        "/login",
+        data={"email": "other@example.com", "password": "wrong"},
+        headers={"X-Forwarded-For": "203.0.113.8"},
+    )
+    assert response.status_code == 200